@@ -0,0 +1,306 @@
+"""Бенчмарки разрешения и рендеринга расписания.
+
+Запуск (из корня репозитория):
+
+    python benchmarks/bench_schedule.py                      # все размеры
+    python benchmarks/bench_schedule.py --sizes small medium
+    python benchmarks/bench_schedule.py --compare benchmarks/results/<old>.json
+
+Бот импортируется в пустом временном каталоге (никакие файлы репозитория не
+читаются и не перезаписываются), Google Sheets не подключается. Данные —
+синтетические: много профилей субботы, длинная история temp_schedule и тысячи
+подписок. «Сейчас» заморожено (по умолчанию суббота), чтобы прогоны были
+воспроизводимы и проходили через ветку профилей.
+
+Результаты пишутся в JSON (benchmarks/results/<время>-<коммит>.json), чтобы
+регрессии были видны между коммитами; --compare печатает отношение к старому
+прогону и с --fail-threshold возвращает ненулевой код при замедлении.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+SIZES = {
+    "small":  {"profiles": 6,  "temp_days": 30,   "subscriptions": 100,   "lessons": 6},
+    "medium": {"profiles": 20, "temp_days": 365,  "subscriptions": 2000,  "lessons": 8},
+    "large":  {"profiles": 60, "temp_days": 3000, "subscriptions": 10000, "lessons": 10},
+}
+
+SUBJECTS = [
+    "Алгебра", "Геометрия", "Рус. яз", "Литература", "Физика", "Химия", "Биология",
+    "Англ. яз.", "История", "Обществ.", "Инфор-ка", "Физкультура", "ВиСТ", "РОВ",
+    "Практикум по мат", "Экология раст.", "Алгоритмика",
+]
+
+
+def _import_bot(workdir: str):
+    os.environ.setdefault("TELEGRAM_TOKEN", "123456:bench")
+    os.environ.setdefault("BOT_URL", "http://127.0.0.1:9")
+    os.environ.pop("GOOGLE_SHEET_ID", None)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    import logging
+    import warnings
+    logging.disable(logging.WARNING)
+    warnings.filterwarnings("ignore", module="telegram")
+    warnings.filterwarnings("ignore", message=".*per_message.*")
+    import bot
+    return bot
+
+
+def _freeze_now(bot, now: datetime) -> None:
+    real = bot.datetime
+
+    class _FrozenDateTime(real):
+        @classmethod
+        def now(cls, tz=None):
+            return now.replace(tzinfo=tz) if tz is not None else now
+
+    bot.datetime = _FrozenDateTime
+
+
+def _lessons(rng: random.Random, n: int) -> list[str]:
+    out = []
+    start = 8 * 60 + 30
+    for _ in range(n):
+        end = start + 40
+        subj = rng.choice(SUBJECTS)
+        room = rng.randint(100, 330)
+        out.append(f"{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d} {subj}/{room}")
+        start = end + 10
+    return out
+
+
+def _install_profiles(bot, count: int) -> None:
+    items = [dict(p) for p in bot._DEFAULT_PROFILES]
+    for i in range(len(items), count):
+        items.append({"key": f"Профиль_{i}", "label": f"Профиль {i} группа",
+                      "triggers": [f"профиль {i}"]})
+    normalized, err = bot._normalize_profiles(items[:count])
+    assert err is None, err
+    bot._set_profiles(normalized)
+
+
+def build_dataset(bot, size: dict, now: datetime, seed: int = 42) -> dict:
+    """Заполняет глобальное состояние бота синтетическими данными."""
+    rng = random.Random(seed)
+    _install_profiles(bot, size["profiles"])
+    n = size["lessons"]
+
+    sched: dict = {}
+    for day in bot.SCHEDULE_DAYS:
+        if day == "Воскресенье":
+            continue
+        if day == "Суббота":
+            sched[day] = {k: _lessons(rng, n) for k in bot.SATURDAY_PROFILE_KEYS}
+        else:
+            sched[day] = _lessons(rng, n)
+
+    temp: dict = {}
+    start = now.date() - timedelta(days=size["temp_days"] - 14)
+    for i in range(size["temp_days"]):
+        d = start + timedelta(days=i)
+        if d.weekday() == 6 or rng.random() < 0.3:
+            continue
+        if d.weekday() == 5:
+            keys = rng.sample(bot.SATURDAY_PROFILE_KEYS, max(1, len(bot.SATURDAY_PROFILE_KEYS) // 3))
+            temp[d.isoformat()] = {k: _lessons(rng, n) for k in keys}
+        else:
+            temp[d.isoformat()] = _lessons(rng, n)
+
+    subs: dict = {}
+    for i in range(size["subscriptions"]):
+        cid = 100000 + i
+        subs[str(cid)] = {
+            "chat_id": cid,
+            "time": f"{rng.randint(6, 8):02d}:{rng.choice((0, 15, 30, 45)):02d}",
+            "day_type": rng.choice(("today", "tomorrow")),
+            "notify_daily": rng.random() < 0.8,
+            "notify_changes": rng.random() < 0.5,
+        }
+
+    bot._replace_schedule(base=sched, temp=temp)
+    bot.subscriptions = subs
+    bot.alice_profiles = {f"alice-{i}": "__ALL__" for i in range(50)}
+
+    week_lines: list[str] = []
+    for day in bot.SCHEDULE_DAYS:
+        data = sched.get(day)
+        if isinstance(data, dict):
+            for k, lessons in data.items():
+                week_lines.append(f"Суббота {bot.SATURDAY_PROFILE_LABELS[k]}:")
+                week_lines.extend(lessons)
+                week_lines.append("")
+        elif data:
+            week_lines.append(f"{day}:")
+            week_lines.extend(data)
+            week_lines.append("")
+    return {"week_text": "\n".join(week_lines)}
+
+
+def _bench(fn, min_time: float = 0.2, repeat: int = 5) -> dict:
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 2 if elapsed < min_time / 10 else max(2, int(min_time / max(elapsed, 1e-9)))
+    runs = [elapsed / loops]
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        runs.append((time.perf_counter() - t0) / loops)
+    return {
+        "median_us": round(statistics.median(runs) * 1e6, 3),
+        "min_us": round(min(runs) * 1e6, 3),
+        "loops": loops,
+        "repeat": repeat,
+    }
+
+
+def run_size(bot, name: str, now: datetime, min_time: float) -> dict:
+    data = build_dataset(bot, SIZES[name], now)
+    today = now.date()
+    sat = today + timedelta(days=(5 - today.weekday()) % 7)
+    weekday = today + timedelta(days=(0 - today.weekday()) % 7 or 7)
+
+    alice_bodies = [
+        {"session": {"new": False, "user": {"user_id": "alice-1"}}, "request": {"command": cmd}}
+        for cmd in ("на сегодня", "на завтра", "какие уроки", "что ты умеешь")
+    ]
+
+    def alice_mix():
+        for body in alice_bodies:
+            bot._alice_handle_request(body)
+
+    cases = {
+        "_get_lessons_for_date[weekday]": lambda: bot._get_lessons_for_date(weekday),
+        "_get_lessons_for_date[saturday]": lambda: bot._get_lessons_for_date(sat),
+        "_get_saturday_profiles_for_date": lambda: bot._get_saturday_profiles_for_date(sat),
+        "_format_week_text": bot._format_week_text,
+        "_parse_week_from_text": lambda: bot._parse_week_from_text(data["week_text"]),
+        "_alice_handle_request[mix4]": alice_mix,
+        "_now_status": lambda: bot._now_status(now),
+    }
+    # уведомление об изменении недели: один день переставлен, остальные те же
+    snap = bot._snapshot
+    week_days = [d for d in bot.SCHEDULE_DAYS if d in snap.base]
+    edited = snap._replace(base={**snap.base, "Понедельник": snap.base["Понедельник"][::-1]})
+    cases["_format_change_notice[week]"] = (
+        lambda: bot._format_change_notice("📢", snap, edited, week_days)
+    )
+    # имя случая прежнее (сравнение с сохранёнными результатами), но меряем сам
+    # рендер: _get_schedule_html_for_day_type после первого вызова отдаёт кэш
+    for day_type in ("today", "tomorrow", "week", "week_base", "saturday"):
+        cases[f"_get_schedule_html_for_day_type[{day_type}]"] = (
+            lambda t=day_type: bot._render_schedule_html_for_day_type(t)
+        )
+
+    results = {}
+    for case, fn in cases.items():
+        results[case] = _bench(fn, min_time=min_time)
+        print(f"  {name:<7} {case:<48} {results[case]['median_us']:>12.1f} µs")
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(old: dict, new: dict, threshold: float) -> bool:
+    """Печатает отношение new/old; True если есть замедление больше threshold."""
+    regressed = False
+    for size, cases in new["results"].items():
+        old_cases = old.get("results", {}).get(size, {})
+        for case, res in cases.items():
+            prev = old_cases.get(case)
+            if not prev:
+                continue
+            ratio = res["median_us"] / max(prev["median_us"], 1e-9)
+            mark = ""
+            if ratio > 1 + threshold:
+                mark = "  ← регрессия"
+                regressed = True
+            elif ratio < 1 - threshold:
+                mark = "  ← ускорение"
+            print(f"  {size:<7} {case:<48} x{ratio:6.2f}{mark}")
+    return regressed
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", nargs="+", choices=sorted(SIZES), default=list(SIZES))
+    ap.add_argument("--now", default="2026-10-17T08:00",
+                    help="замороженное «сейчас» (ISO, по умолчанию суббота)")
+    ap.add_argument("--min-time", type=float, default=0.2,
+                    help="минимальное время одного замера, с")
+    ap.add_argument("--out", help="путь к JSON с результатами")
+    ap.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    ap.add_argument("--fail-threshold", type=float, default=None,
+                    help="вернуть код 1 при замедлении больше доли (например 0.2)")
+    args = ap.parse_args()
+
+    now = datetime.fromisoformat(args.now)
+    commit = _git_commit()
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit}.json"
+    )
+    out = os.path.abspath(out)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        bot = _import_bot(workdir)
+        _freeze_now(bot, now)
+        report = {
+            "meta": {
+                "commit": commit,
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "now": args.now,
+                "sizes": {name: SIZES[name] for name in args.sizes},
+            },
+            "results": {},
+        }
+        for name in args.sizes:
+            report["results"][name] = run_size(bot, name, now, args.min_time)
+
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"Результаты: {out}")
+
+    if compare_path:
+        with open(compare_path, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        print(f"Сравнение с {old.get('meta', {}).get('commit', '?')}:")
+        threshold = args.fail_threshold if args.fail_threshold is not None else 0.1
+        if compare(old, report, threshold) and args.fail_threshold is not None:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,427 @@
+"""Нагрузочный тест бота без реального Telegram и Google Sheets.
+
+Запуск (из корня репозитория):
+
+    python benchmarks/loadtest.py --duration 20 --concurrency 32
+    python benchmarks/loadtest.py --transport http --sheets-latency 150 --json out.json
+
+Что поднимается:
+  * фейковый Bot API (uvicorn на localhost) — записывает sendMessage,
+    answerInlineQuery, editMessageText и остальные вызовы и отвечает как Telegram;
+    бот направляется на него через TELEGRAM_API_URL;
+  * фейковый бэкенд gspread в памяти (с настраиваемой задержкой на вызов),
+    подставляется вместо _gs_spreadsheet;
+  * сам FastAPI `app` бота — в процессе через ASGI (--transport asgi, по
+    умолчанию) или отдельным uvicorn-сервером (--transport http).
+
+Нагрузка — смесь реалистичных обновлений: inline-запросы, колбэки /subscribe,
+команды, вызовы WebApp API и фразы Алисы. В конце печатается пропускная
+способность и перцентили задержки по каждому виду запросов.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_TOKEN = "123456:LOADTEST"
+
+# Вес каждого вида запроса в смеси
+MIX = {
+    "inline": 40,
+    "subscribe_callback": 5,
+    "command": 5,
+    "webapp_schedule": 25,
+    "webapp_me": 5,
+    "alice": 20,
+}
+
+INLINE_QUERIES = ["", "сегодня", "завтра", "неделя", "суббота"]
+WEBAPP_TYPES = ["today", "tomorrow", "week", "week_base", "saturday"]
+ALICE_UTTERANCES = ["на сегодня", "на завтра", "какие уроки", "физмат", "все профили", "что ты умеешь"]
+SUB_CALLBACKS = ["sub_toggle:changes", "sub_toggle:daily", "sub_toggle:day_type", "sub_back"]
+COMMANDS = ["/start", "/help", "/subscribe", "/chatid"]
+
+
+# ================== Фейковый Bot API ==================
+
+class FakeBotAPI:
+    """Минимальный Bot API: отвечает как Telegram и считает вызовы по методам."""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self._message_id = 0
+        self._lock = threading.Lock()
+
+    def _next_message_id(self) -> int:
+        with self._lock:
+            self._message_id += 1
+            return self._message_id
+
+    def result_for(self, method: str, params: dict):
+        self.calls[method] += 1
+        if method == "getMe":
+            return {
+                "id": 123456, "is_bot": True, "first_name": "LoadTest",
+                "username": "loadtest_bot", "can_join_groups": True,
+                "can_read_all_group_messages": False, "supports_inline_queries": True,
+            }
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = params.get("chat_id") or 0
+            try:
+                chat_id = int(chat_id)
+            except (TypeError, ValueError):
+                chat_id = 0
+            return {
+                "message_id": int(params.get("message_id") or self._next_message_id()),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        if method == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        return True
+
+    def build_app(self):
+        from fastapi import FastAPI, Request
+        from fastapi.responses import JSONResponse
+
+        api = FastAPI()
+
+        @api.api_route("/bot{token}/{method}", methods=["GET", "POST"])
+        async def _method(token: str, method: str, request: Request):
+            params: dict = dict(request.query_params)
+            ctype = request.headers.get("content-type", "")
+            if "json" in ctype:
+                try:
+                    params.update(await request.json())
+                except Exception:
+                    pass
+            elif ctype:
+                form = await request.form()
+                params.update({k: v for k, v in form.items() if isinstance(v, str)})
+            return JSONResponse({"ok": True, "result": self.result_for(method, params)})
+
+        @api.get("/")
+        async def _root():
+            return {"ok": True}
+
+        return api
+
+
+# ================== Фейковый gspread ==================
+
+class FakeWorksheet:
+    def __init__(self, title: str, latency: float):
+        self.title = title
+        self._rows: list[list[str]] = []
+        self._latency = latency
+
+    def _delay(self):
+        if self._latency:
+            time.sleep(self._latency)
+
+    def get_all_values(self):
+        self._delay()
+        return [list(r) for r in self._rows]
+
+    def clear(self):
+        self._delay()
+        self._rows = []
+
+    def update(self, rows, value_input_option="RAW", **kwargs):
+        self._delay()
+        self._rows = [[str(c) for c in r] for r in rows]
+
+
+class FakeSpreadsheet:
+    """Хранит листы в памяти; каждый вызов может «стоить» latency секунд."""
+
+    def __init__(self, latency: float = 0.0):
+        self._latency = latency
+        self._sheets: dict[str, FakeWorksheet] = {}
+        self.calls: Counter = Counter()
+
+    def worksheet(self, name: str):
+        self.calls["worksheet"] += 1
+        if self._latency:
+            time.sleep(self._latency)
+        ws = self._sheets.get(name)
+        if ws is None:
+            import gspread
+            raise gspread.WorksheetNotFound(name)
+        return ws
+
+    def worksheets(self):
+        self.calls["worksheets"] += 1
+        if self._latency:
+            time.sleep(self._latency)
+        return list(self._sheets.values())
+
+    def add_worksheet(self, title: str, rows: int = 0, cols: int = 0):
+        self.calls["add_worksheet"] += 1
+        ws = self._sheets.setdefault(title, FakeWorksheet(title, self._latency))
+        return ws
+
+    def values_batch_get(self, ranges, params=None):
+        self.calls["values_batch_get"] += 1
+        if self._latency:
+            time.sleep(self._latency)
+        out = []
+        for rng in ranges:
+            name = rng.split("!", 1)[0].strip("'")
+            ws = self._sheets.get(name)
+            out.append({"range": rng, "values": [list(r) for r in ws._rows] if ws else []})
+        return {"valueRanges": out}
+
+
+# ================== Генерация нагрузки ==================
+
+def _user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": f"User{uid}", "language_code": "ru"}
+
+
+class UpdateFactory:
+    def __init__(self, seed: int, users: int):
+        self.rng = random.Random(seed)
+        self.users = users
+        self.update_id = 0
+        self.kinds = list(MIX)
+        self.weights = [MIX[k] for k in self.kinds]
+
+    def _uid(self) -> int:
+        return 500000 + self.rng.randrange(self.users)
+
+    def _next_update_id(self) -> int:
+        self.update_id += 1
+        return self.update_id
+
+    def next(self, webhook_path: str) -> tuple[str, str, dict]:
+        """Возвращает (вид, путь, тело) очередного запроса."""
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        uid = self._uid()
+        now = int(time.time())
+        if kind == "inline":
+            body = {"update_id": self._next_update_id(), "inline_query": {
+                "id": str(self.update_id), "from": _user(uid),
+                "query": self.rng.choice(INLINE_QUERIES), "offset": "",
+            }}
+            return kind, webhook_path, body
+        if kind == "subscribe_callback":
+            body = {"update_id": self._next_update_id(), "callback_query": {
+                "id": str(self.update_id), "from": _user(uid), "chat_instance": str(uid),
+                "data": self.rng.choice(SUB_CALLBACKS),
+                "message": {"message_id": 1, "date": now, "text": "Твои подписки",
+                            "chat": {"id": uid, "type": "private"},
+                            "from": {"id": 123456, "is_bot": True, "first_name": "LoadTest"}},
+            }}
+            return kind, webhook_path, body
+        if kind == "command":
+            text = self.rng.choice(COMMANDS)
+            body = {"update_id": self._next_update_id(), "message": {
+                "message_id": self.update_id, "date": now, "text": text,
+                "chat": {"id": uid, "type": "private"}, "from": _user(uid),
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+            }}
+            return kind, webhook_path, body
+        if kind == "webapp_schedule":
+            return kind, "/api/schedule", {"user": _user(uid), "type": self.rng.choice(WEBAPP_TYPES)}
+        if kind == "webapp_me":
+            return kind, "/api/me", {"user": _user(uid)}
+        body = {
+            "version": "1.0",
+            "session": {"new": False, "session_id": str(uid), "message_id": 1,
+                        "user": {"user_id": f"alice-{uid}"},
+                        "application": {"application_id": f"app-{uid}"}},
+            "request": {"command": self.rng.choice(ALICE_UTTERANCES), "type": "SimpleUtterance"},
+        }
+        return "alice", "/alice", body
+
+
+def _percentile(sorted_vals: list[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    idx = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[idx]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve_in_thread(asgi_app, port: int):
+    import uvicorn
+    config = uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning",
+                            lifespan="off")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    for _ in range(200):
+        if server.started:
+            break
+        time.sleep(0.025)
+    return server, thread
+
+
+async def run_load(args) -> dict:
+    import httpx
+
+    fake_api = FakeBotAPI()
+    api_port = _free_port()
+    api_server, _ = _serve_in_thread(fake_api.build_app(), api_port)
+    api_url = f"http://127.0.0.1:{api_port}"
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    for name in ("schedule.json", "temp_schedule.json", "subscriptions.json"):
+        src = os.path.join(REPO_ROOT, name)
+        if os.path.exists(src):
+            shutil.copy(src, workdir)
+    os.chdir(workdir)
+    os.environ["TELEGRAM_TOKEN"] = FAKE_TOKEN
+    os.environ["BOT_URL"] = api_url
+    os.environ["TELEGRAM_API_URL"] = api_url
+    os.environ.pop("GOOGLE_SHEET_ID", None)
+    sys.path.insert(0, REPO_ROOT)
+
+    import logging
+    import warnings
+    logging.disable(logging.WARNING)
+    warnings.filterwarnings("ignore", message=".*per_message.*")
+    import bot
+
+    fake_sheets = FakeSpreadsheet(latency=args.sheets_latency / 1000.0)
+    for name in bot._GS_SHEET_NAMES:
+        fake_sheets.add_worksheet(name)
+    fake_sheets.calls.clear()
+
+    def _fake_connect() -> bool:
+        bot._gs_spreadsheet = fake_sheets
+        return True
+
+    bot._gs_connect = _fake_connect
+    await bot.startup_event()
+
+    bot_server = None
+    if args.transport == "http":
+        bot_port = _free_port()
+        bot_server, _ = _serve_in_thread(bot.app, bot_port)
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{bot_port}", timeout=30.0)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=bot.app),
+                                   base_url="http://loadtest", timeout=30.0)
+
+    factory = UpdateFactory(args.seed, args.users)
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: Counter = Counter()
+    fake_api.calls.clear()
+    deadline = time.perf_counter() + args.duration
+    sent = 0
+
+    async def worker():
+        nonlocal sent
+        while time.perf_counter() < deadline and (not args.requests or sent < args.requests):
+            sent += 1
+            kind, path, body = factory.next(bot.WEBHOOK_PATH)
+            t0 = time.perf_counter()
+            try:
+                resp = await client.post(path, json=body)
+                if resp.status_code >= 400:
+                    errors[kind] += 1
+            except Exception:
+                errors[kind] += 1
+            latencies[kind].append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    await client.aclose()
+    await bot.shutdown_event()
+    if bot_server is not None:
+        bot_server.should_exit = True
+    api_server.should_exit = True
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    report: dict = {
+        "config": {k: getattr(args, k) for k in
+                   ("duration", "requests", "concurrency", "users", "transport",
+                    "sheets_latency", "seed")},
+        "elapsed_s": round(elapsed, 3),
+        "total": {},
+        "kinds": {},
+        "bot_api_calls": dict(fake_api.calls),
+        "sheets_calls": dict(fake_sheets.calls),
+    }
+    all_lat: list[float] = []
+    for kind, vals in sorted(latencies.items()):
+        vals.sort()
+        all_lat.extend(vals)
+        report["kinds"][kind] = {
+            "count": len(vals),
+            "errors": errors[kind],
+            "rps": round(len(vals) / elapsed, 1),
+            "p50_ms": round(_percentile(vals, 0.50) * 1000, 2),
+            "p90_ms": round(_percentile(vals, 0.90) * 1000, 2),
+            "p99_ms": round(_percentile(vals, 0.99) * 1000, 2),
+            "max_ms": round(vals[-1] * 1000, 2),
+        }
+    all_lat.sort()
+    report["total"] = {
+        "count": len(all_lat),
+        "errors": sum(errors.values()),
+        "rps": round(len(all_lat) / elapsed, 1),
+        "p50_ms": round(_percentile(all_lat, 0.50) * 1000, 2),
+        "p90_ms": round(_percentile(all_lat, 0.90) * 1000, 2),
+        "p99_ms": round(_percentile(all_lat, 0.99) * 1000, 2),
+    }
+    return report
+
+
+def _print_report(report: dict) -> None:
+    print(f"{'вид':<20}{'кол-во':>8}{'ошибки':>8}{'rps':>9}{'p50 мс':>9}{'p90 мс':>9}{'p99 мс':>9}{'max мс':>9}")
+    for kind, r in report["kinds"].items():
+        print(f"{kind:<20}{r['count']:>8}{r['errors']:>8}{r['rps']:>9}"
+              f"{r['p50_ms']:>9}{r['p90_ms']:>9}{r['p99_ms']:>9}{r['max_ms']:>9}")
+    t = report["total"]
+    print(f"{'ИТОГО':<20}{t['count']:>8}{t['errors']:>8}{t['rps']:>9}"
+          f"{t['p50_ms']:>9}{t['p90_ms']:>9}{t['p99_ms']:>9}")
+    print("Bot API:", ", ".join(f"{m}={n}" for m, n in sorted(report["bot_api_calls"].items())))
+    print("Sheets:", ", ".join(f"{m}={n}" for m, n in sorted(report["sheets_calls"].items())) or "—")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--duration", type=float, default=10.0, help="длительность, с")
+    ap.add_argument("--requests", type=int, default=0, help="ограничить число запросов (0 — без лимита)")
+    ap.add_argument("--concurrency", type=int, default=16, help="параллельных клиентов")
+    ap.add_argument("--users", type=int, default=1000, help="число различных пользователей")
+    ap.add_argument("--transport", choices=("asgi", "http"), default="asgi")
+    ap.add_argument("--sheets-latency", type=float, default=0.0,
+                    help="задержка фейкового gspread на вызов, мс")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", help="сохранить отчёт в JSON")
+    args = ap.parse_args()
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    report = asyncio.run(run_load(args))
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
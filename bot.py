@@ -1,13 +1,9 @@
-import os, json, uuid, asyncio, httpx, html, re, logging, hmac, hashlib
-try:
-    import gspread
-    from google.oauth2.service_account import Credentials as GCredentials
-    _GSPREAD_OK = True
-except ImportError:
-    _GSPREAD_OK = False
-from datetime import datetime, timedelta, date
+import os, sys, json, uuid, asyncio, httpx, html, re, logging, hmac, hashlib, threading, time, sqlite3, csv, io, contextlib, contextvars, bisect, collections, difflib
+_IMPORT_T0 = time.perf_counter()
+from datetime import datetime, timedelta, date, timezone
+from typing import NamedTuple
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
 from zoneinfo import ZoneInfo
 from telegram import (
     BotCommand,
@@ -21,6 +17,8 @@ from telegram import (
     ReplyKeyboardRemove,
     Update,
 )
+from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     ApplicationBuilder,
     CallbackQueryHandler,
@@ -29,11 +27,19 @@ from telegram.ext import (
     ConversationHandler,
     InlineQueryHandler,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.schedulers.base import STATE_PAUSED
 from apscheduler.triggers.cron import CronTrigger
-from urllib.parse import parse_qsl
+from urllib.parse import parse_qsl, quote
+from email.utils import format_datetime, parsedate_to_datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессной блокировки журнала рассылок нет
+    fcntl = None
 
 # ================== Настройки ==================
 logging.basicConfig(
@@ -45,6 +51,9 @@ logger = logging.getLogger(__name__)
 TOKEN = os.environ.get("TELEGRAM_TOKEN")
 BOT_URL = os.environ.get("BOT_URL")  # например: https://school-schedule-bot2.onrender.com
 WEBHOOK_PATH = f"/webhook/{TOKEN}"
+# Адрес Bot API (по умолчанию api.telegram.org). Нужен для локального Bot API
+# сервера и нагрузочного теста с фейковым Telegram (benchmarks/loadtest.py).
+TELEGRAM_API_URL = (os.environ.get("TELEGRAM_API_URL") or "").strip()
 
 if not TOKEN or not BOT_URL:
     raise RuntimeError("Не заданы переменные окружения TELEGRAM_TOKEN или BOT_URL")
@@ -52,26 +61,52 @@ if not TOKEN or not BOT_URL:
 GOOGLE_SHEET_ID   = (os.environ.get("GOOGLE_SHEET_ID") or "").strip()
 _GCREDS_JSON_RAW  = (os.environ.get("GOOGLE_CREDENTIALS_JSON") or "").strip()
 
+# gspread и google-auth импортируются лениво (при первом подключении к Sheets):
+# вместе они заметно замедляют холодный старт.
+gspread = None
+GCredentials = None
+_GSPREAD_OK: bool | None = None   # None — ещё не пробовали импортировать
+
 _gs_client: "gspread.Client | None" = None
 _gs_spreadsheet = None   # gspread.Spreadsheet
 
+# Пока начальная загрузка из Sheets не закончилась, сохранения в Sheets
+# откладываются: иначе локальная копия перезапишет более свежие данные листа.
+_gs_hydrated = False
+_gs_dirty_before_hydration: set[str] = set()
+
 _GS_SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
 ]
 
+def _gs_import() -> bool:
+    """Импортирует gspread/google-auth при первом обращении."""
+    global gspread, GCredentials, _GSPREAD_OK
+    if _GSPREAD_OK is None:
+        try:
+            import gspread as _gspread
+            from google.oauth2.service_account import Credentials as _GCredentials
+            gspread, GCredentials = _gspread, _GCredentials
+            _GSPREAD_OK = True
+        except ImportError:
+            _GSPREAD_OK = False
+    return _GSPREAD_OK
+
+
 def _gs_connect() -> bool:
     """Открывает соединение с Google Sheets. Возвращает True при успехе."""
     global _gs_client, _gs_spreadsheet
-    if not _GSPREAD_OK:
-        logger.warning("gspread не установлен — работаем без Google Sheets")
-        return False
     if not GOOGLE_SHEET_ID or not _GCREDS_JSON_RAW:
         logger.warning("GOOGLE_SHEET_ID или GOOGLE_CREDENTIALS_JSON не заданы — работаем без Google Sheets")
         return False
+    if not _gs_import():
+        logger.warning("gspread не установлен — работаем без Google Sheets")
+        return False
     try:
         creds_dict = json.loads(_GCREDS_JSON_RAW)
         creds = GCredentials.from_service_account_info(creds_dict, scopes=_GS_SCOPES)
         _gs_client = gspread.authorize(creds)
+        _gs_tune_session(_gs_client)
         _gs_spreadsheet = _gs_client.open_by_key(GOOGLE_SHEET_ID)
         logger.info("✅ Google Sheets подключён")
         return True
@@ -79,48 +114,258 @@ def _gs_connect() -> bool:
         logger.error(f"Google Sheets connect error: {e}")
         return False
 
+# Все листы, которые бот читает и пишет
+_GS_SHEET_NAMES = ("schedule", "temp_schedule", "subscriptions", "alice_profiles", "profiles")
+
+# Кэш объектов листов: каждый worksheet() — отдельный запрос метаданных
+_gs_ws_cache: dict = {}
+
+
 def _gs_sheet(name: str):
-    """Возвращает лист по имени, создаёт если нет."""
-    global _gs_spreadsheet
+    """Возвращает лист по имени (из кэша), создаёт если нет."""
+    ws = _gs_ws_cache.get(name)
+    if ws is not None:
+        return ws
     try:
-        return _gs_spreadsheet.worksheet(name)
+        _gs_count("read")
+        ws = _gs_spreadsheet.worksheet(name)
     except gspread.WorksheetNotFound:
-        return _gs_spreadsheet.add_worksheet(title=name, rows=500, cols=10)
+        try:
+            ws = _gs_spreadsheet.add_worksheet(title=name, rows=500, cols=10)
+        except Exception as e:
+            logger.error(f"_gs_sheet({name}) create error: {e}")
+            return None
     except Exception as e:
         logger.error(f"_gs_sheet({name}) error: {e}")
         return None
+    _gs_ws_cache[name] = ws
+    return ws
+
+
+def _gs_ensure_sheets(names) -> None:
+    """Одним запросом получает список листов, заполняет кэш и создаёт недостающие."""
+    _gs_count("read")
+    for ws in _gs_spreadsheet.worksheets():
+        _gs_ws_cache[ws.title] = ws
+    for name in names:
+        if name not in _gs_ws_cache:
+            logger.info(f"📊 Лист {name} отсутствует — создаём")
+            _gs_sheet(name)
+
+
+def _gs_batch_values(names) -> dict[str, list[list[str]]]:
+    """Читает значения нескольких листов одним запросом values_batch_get.
+    Если какого-то листа нет (запрос падает целиком с 400 «Unable to parse range») —
+    создаёт недостающие и повторяет. Остальные ошибки (квота, 5xx) пробрасываются."""
+    ranges = [f"'{name}'" for name in names]
+    try:
+        _gs_count("read")
+        resp = _gs_spreadsheet.values_batch_get(ranges)
+    except gspread.exceptions.APIError as e:
+        if not _gs_is_missing_range(e):
+            raise
+        _gs_ensure_sheets(names)
+        _gs_count("read")
+        resp = _gs_spreadsheet.values_batch_get(ranges)
+    value_ranges = resp.get("valueRanges", [])
+    return {name: (vr.get("values") or []) for name, vr in zip(names, value_ranges)}
+
+def _gs_sync(name: str, save_fn) -> None:
+    """Сохраняет лист name в Sheets; до окончания начальной загрузки — только помечает его."""
+    if not _gs_hydrated:
+        _gs_dirty_before_hydration.add(name)
+        return
+    if _gs_spreadsheet is not None:
+        save_fn()
+
+# ── Учёт квоты и отпечатки листов ─────────────────────────────────────────
+# Квоты Sheets API — порядка 60 чтений и 60 записей в минуту на сервисный аккаунт.
+# Считаем свои запросы в скользящем окне, чтобы фоновая синхронизация
+# не съедала квоту, нужную для сохранений.
+GS_READS_PER_MIN = int(os.environ.get("GS_READS_PER_MIN") or 60)
+GS_WRITES_PER_MIN = int(os.environ.get("GS_WRITES_PER_MIN") or 60)
+_gs_requests: dict[str, list[float]] = {"read": [], "write": []}
+_gs_quota_lock = threading.Lock()
+
+# Отпечатки содержимого листов (последнее прочитанное или записанное нами)
+_gs_hashes: dict[str, str] = {}
+# Счётчик собственных записей: опрос, пересёкшийся с записью, отбрасывается
+_gs_write_gen = 0
+
+
+def _gs_count(kind: str, n: int = 1) -> None:
+    now = time.monotonic()
+    with _gs_quota_lock:
+        bucket = _gs_requests[kind]
+        bucket.extend([now] * n)
+        while bucket and bucket[0] < now - 60:
+            bucket.pop(0)
+
+
+def _gs_used(kind: str) -> int:
+    """Сколько запросов данного вида сделано за последнюю минуту."""
+    now = time.monotonic()
+    with _gs_quota_lock:
+        bucket = _gs_requests[kind]
+        while bucket and bucket[0] < now - 60:
+            bucket.pop(0)
+        return len(bucket)
+
+
+def _gs_is_rate_limited(e: Exception) -> bool:
+    code = getattr(getattr(e, "response", None), "status_code", None)
+    return code == 429 or "RESOURCE_EXHAUSTED" in str(e)
+
+
+def _gs_is_transient(e: Exception) -> bool:
+    """Квота или ошибка сервера — повтор другими запросами только тратит квоту."""
+    code = getattr(getattr(e, "response", None), "status_code", None)
+    return _gs_is_rate_limited(e) or (code is not None and code >= 500)
+
+
+def _gs_is_missing_range(e: Exception) -> bool:
+    """Запрос упал из‑за отсутствующего листа в диапазоне."""
+    code = getattr(getattr(e, "response", None), "status_code", None)
+    return code == 400 and "Unable to parse range" in str(e)
+
+
+def _gs_rows_hash(rows: list[list[str]]) -> str:
+    """Отпечаток значений листа (хвостовые пустые ячейки и строки Sheets не возвращает)."""
+    norm = []
+    for row in rows:
+        row = [str(c) for c in row]
+        while row and row[-1] == "":
+            row.pop()
+        norm.append(row)
+    while norm and not norm[-1]:
+        norm.pop()
+    return hashlib.sha1(json.dumps(norm, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _gs_write_rows(name: str, ws, rows: list[list[str]]) -> None:
+    """Перезаписывает лист целиком и запоминает отпечаток записанного."""
+    global _gs_write_gen
+    _gs_write_gen += 1
+    try:
+        _gs_count("write")
+        ws.clear()
+        if rows:
+            _gs_count("write")
+            ws.update(rows, value_input_option="RAW")
+        _gs_hashes[name] = _gs_rows_hash(rows)
+    finally:
+        _gs_write_gen += 1
 
 # ── Загрузка ──────────────────────────────────────────────────────────────
 
+def _gs_parse_schedule(rows: list[list[str]]) -> dict | None:
+    if not rows:
+        return None
+    result = {}
+    for row in rows:
+        if len(row) < 2 or not row[0].strip():
+            continue
+        day, raw = row[0].strip(), row[1].strip()
+        # Пропускаем заголовок и строки не являющиеся днями недели
+        if day not in SCHEDULE_DAYS:
+            continue
+        if not raw:
+            continue
+        try:
+            result[day] = json.loads(raw)
+        except json.JSONDecodeError:
+            # Пробуем исправить одинарные кавычки (питоновский repr)
+            try:
+                import ast
+                result[day] = ast.literal_eval(raw)
+            except Exception:
+                logger.warning(f"_gs_load_schedule: не удалось распарсить '{day}'")
+    return result if result else None
+
+
+def _gs_parse_temp_schedule(rows: list[list[str]]) -> dict:
+    result = {}
+    for row in rows:
+        if len(row) < 2 or not row[0].strip():
+            continue
+        date_key, raw = row[0].strip(), row[1].strip()
+        try:
+            result[date_key] = json.loads(raw)
+        except Exception:
+            pass
+    return result
+
+
+def _gs_parse_subscriptions(rows: list[list[str]]) -> dict:
+    """Формат строки: chat_id | time | day_type | notify_daily | notify_changes | profile
+    Старые строки без последних двух колонок читаются как notify_daily=True, notify_changes=False;
+    пустой profile — все профили субботы.
+    """
+    result = {}
+    for row in rows:
+        if not row or not row[0].strip():
+            continue
+        chat_id_str = row[0].strip()
+        try:
+            chat_id = int(chat_id_str)
+        except ValueError:
+            continue
+        time_str       = row[1].strip() if len(row) > 1 else ""
+        day_type       = row[2].strip() or "today" if len(row) > 2 else "today"
+        notify_daily   = (row[3].strip().lower() not in ("false", "0", "нет")) if len(row) > 3 else True
+        notify_changes = (row[4].strip().lower() in ("true", "1", "да"))        if len(row) > 4 else False
+        profile        = row[5].strip()                                          if len(row) > 5 else ""
+        result[chat_id_str] = {
+            "chat_id":        chat_id,
+            "time":           time_str,
+            "day_type":       day_type,
+            "notify_daily":   notify_daily,
+            "notify_changes": notify_changes,
+        }
+        if profile:
+            result[chat_id_str]["profile"] = profile
+    return result
+
+
+def _gs_parse_alice_profiles(rows: list[list[str]]) -> dict:
+    """Формат: alice_user_id | profile_key"""
+    result = {}
+    for row in rows:
+        if len(row) >= 2 and row[0].strip():
+            result[row[0].strip()] = row[1].strip()
+    return result
+
+
+def _gs_parse_profiles(rows: list[list[str]]) -> list[dict] | None:
+    """Формат: key | JSON профиля (label, tts, triggers, days); порядок строк — порядок
+    профилей. [] — лист пуст, None — профили в листе не прошли проверку."""
+    raw = []
+    for row in rows:
+        if len(row) < 2 or not row[0].strip():
+            continue
+        try:
+            p = json.loads(row[1])
+        except json.JSONDecodeError:
+            continue  # заголовок или испорченная строка
+        if isinstance(p, dict):
+            raw.append({**p, "key": row[0].strip()})
+    if not raw:
+        return []
+    items, err = _normalize_profiles(raw)
+    if err:
+        logger.error(f"_gs_parse_profiles: {err}")
+        return None
+    return items
+
+
 def _gs_load_schedule() -> dict | None:
     """Загружает основное расписание из листа schedule."""
     try:
         ws = _gs_sheet("schedule")
         if ws is None:
             return None
-        rows = ws.get_all_values()
-        if not rows:
-            return None
-        result = {}
-        for row in rows:
-            if len(row) < 2 or not row[0].strip():
-                continue
-            day, raw = row[0].strip(), row[1].strip()
-            # Пропускаем заголовок и строки не являющиеся днями недели
-            if day not in SCHEDULE_DAYS:
-                continue
-            if not raw:
-                continue
-            try:
-                result[day] = json.loads(raw)
-            except json.JSONDecodeError:
-                # Пробуем исправить одинарные кавычки (питоновский repr)
-                try:
-                    import ast
-                    result[day] = ast.literal_eval(raw)
-                except Exception:
-                    logger.warning(f"_gs_load_schedule: не удалось распарсить '{day}'")
-        return result if result else None
+        _gs_count("read")
+        return _gs_parse_schedule(ws.get_all_values())
     except Exception as e:
         logger.error(f"_gs_load_schedule error: {e}")
         return None
@@ -131,60 +376,51 @@ def _gs_load_temp_schedule() -> dict | None:
         ws = _gs_sheet("temp_schedule")
         if ws is None:
             return None
-        rows = ws.get_all_values()
-        if not rows:
-            return {}
-        result = {}
-        for row in rows:
-            if len(row) < 2 or not row[0].strip():
-                continue
-            date_key, raw = row[0].strip(), row[1].strip()
-            try:
-                result[date_key] = json.loads(raw)
-            except Exception:
-                pass
-        return result
+        _gs_count("read")
+        return _gs_parse_temp_schedule(ws.get_all_values())
     except Exception as e:
         logger.error(f"_gs_load_temp_schedule error: {e}")
         return None
 
 def _gs_load_subscriptions() -> dict | None:
-    """Загружает подписки из листа subscriptions.
-    Формат строки: chat_id | time | day_type | notify_daily | notify_changes
-    Старые строки без последних двух колонок читаются как notify_daily=True, notify_changes=False.
-    """
+    """Загружает подписки из листа subscriptions."""
     try:
         ws = _gs_sheet("subscriptions")
         if ws is None:
             return None
-        rows = ws.get_all_values()
-        if not rows:
-            return {}
-        result = {}
-        for row in rows:
-            if not row or not row[0].strip():
-                continue
-            chat_id_str = row[0].strip()
-            try:
-                chat_id = int(chat_id_str)
-            except ValueError:
-                continue
-            time_str       = row[1].strip() if len(row) > 1 else ""
-            day_type       = row[2].strip() or "today" if len(row) > 2 else "today"
-            notify_daily   = (row[3].strip().lower() not in ("false", "0", "нет")) if len(row) > 3 else True
-            notify_changes = (row[4].strip().lower() in ("true", "1", "да"))        if len(row) > 4 else False
-            result[chat_id_str] = {
-                "chat_id":        chat_id,
-                "time":           time_str,
-                "day_type":       day_type,
-                "notify_daily":   notify_daily,
-                "notify_changes": notify_changes,
-            }
-        return result
+        _gs_count("read")
+        return _gs_parse_subscriptions(ws.get_all_values())
     except Exception as e:
         logger.error(f"_gs_load_subscriptions error: {e}")
         return None
 
+def _gs_load_all() -> dict:
+    """Загружает все листы одним запросом values_batch_get.
+    Возвращает {имя_листа: данные} в тех же форматах, что и _gs_load_*.
+    Квота и 5xx пробрасываются: по одному листу читать бессмысленно, загрузку повторяют."""
+    try:
+        values = _gs_batch_values(_GS_SHEET_NAMES)
+    except Exception as e:
+        if _gs_is_transient(e):
+            raise
+        logger.error(f"_gs_load_all batch error: {e} — читаем листы по одному")
+        return {
+            "schedule": _gs_load_schedule(),
+            "temp_schedule": _gs_load_temp_schedule(),
+            "subscriptions": _gs_load_subscriptions(),
+            "alice_profiles": _gs_load_alice_profiles(),
+            "profiles": _gs_load_profiles(),
+        }
+    for name, rows in values.items():
+        _gs_hashes[name] = _gs_rows_hash(rows)
+    return {
+        "schedule": _gs_parse_schedule(values.get("schedule", [])),
+        "temp_schedule": _gs_parse_temp_schedule(values.get("temp_schedule", [])),
+        "subscriptions": _gs_parse_subscriptions(values.get("subscriptions", [])),
+        "alice_profiles": _gs_parse_alice_profiles(values.get("alice_profiles", [])),
+        "profiles": _gs_parse_profiles(values.get("profiles", [])),
+    }
+
 # ── Сохранение ────────────────────────────────────────────────────────────
 
 def _gs_save_schedule() -> None:
@@ -195,9 +431,7 @@ def _gs_save_schedule() -> None:
             return
         rows = [[day, json.dumps(data, ensure_ascii=False)]
                 for day, data in schedule.items()]
-        ws.clear()
-        if rows:
-            ws.update(rows, value_input_option="RAW")
+        _gs_write_rows("schedule", ws, rows)
     except Exception as e:
         logger.error(f"_gs_save_schedule error: {e}")
 
@@ -209,15 +443,13 @@ def _gs_save_temp_schedule() -> None:
             return
         rows = [[date_key, json.dumps(data, ensure_ascii=False)]
                 for date_key, data in temp_schedule.items()]
-        ws.clear()
-        if rows:
-            ws.update(rows, value_input_option="RAW")
+        _gs_write_rows("temp_schedule", ws, rows)
     except Exception as e:
         logger.error(f"_gs_save_temp_schedule error: {e}")
 
 def _gs_save_subscriptions() -> None:
     """Сохраняет подписки в лист subscriptions.
-    Формат: chat_id | time | day_type | notify_daily | notify_changes
+    Формат: chat_id | time | day_type | notify_daily | notify_changes | profile
     """
     try:
         ws = _gs_sheet("subscriptions")
@@ -230,12 +462,11 @@ def _gs_save_subscriptions() -> None:
                 entry.get("day_type", "today"),
                 "true" if entry.get("notify_daily", True)   else "false",
                 "true" if entry.get("notify_changes", False) else "false",
+                entry.get("profile", ""),
             ]
             for entry in subscriptions.values()
         ]
-        ws.clear()
-        if rows:
-            ws.update(rows, value_input_option="RAW")
+        _gs_write_rows("subscriptions", ws, rows)
     except Exception as e:
         logger.error(f"_gs_save_subscriptions error: {e}")
 
@@ -246,14 +477,8 @@ def _gs_load_alice_profiles() -> dict | None:
         ws = _gs_sheet("alice_profiles")
         if ws is None:
             return None
-        rows = ws.get_all_values()
-        if not rows:
-            return {}
-        result = {}
-        for row in rows:
-            if len(row) >= 2 and row[0].strip():
-                result[row[0].strip()] = row[1].strip()
-        return result
+        _gs_count("read")
+        return _gs_parse_alice_profiles(ws.get_all_values())
     except Exception as e:
         logger.error(f"_gs_load_alice_profiles error: {e}")
         return None
@@ -265,13 +490,36 @@ def _gs_save_alice_profiles() -> None:
         if ws is None:
             return
         rows = [[uid, profile] for uid, profile in alice_profiles.items() if profile]
-        ws.clear()
-        if rows:
-            ws.update(rows, value_input_option="RAW")
+        _gs_write_rows("alice_profiles", ws, rows)
     except Exception as e:
         logger.error(f"_gs_save_alice_profiles error: {e}")
 
 
+def _gs_load_profiles() -> list[dict] | None:
+    """Загружает профили основного класса из листа profiles."""
+    try:
+        ws = _gs_sheet("profiles")
+        if ws is None:
+            return None
+        _gs_count("read")
+        return _gs_parse_profiles(ws.get_all_values())
+    except Exception as e:
+        logger.error(f"_gs_load_profiles error: {e}")
+        return None
+
+
+def _gs_save_profiles() -> None:
+    try:
+        ws = _gs_sheet("profiles")
+        if ws is None:
+            return
+        rows = [[p["key"], json.dumps({k: v for k, v in p.items() if k != "key"}, ensure_ascii=False)]
+                for p in _profile_set.items]
+        _gs_write_rows("profiles", ws, rows)
+    except Exception as e:
+        logger.error(f"_gs_save_profiles error: {e}")
+
+
 def _load_alice_profiles_from_disk() -> None:
     global alice_profiles
     try:
@@ -286,12 +534,12 @@ def _load_alice_profiles_from_disk() -> None:
 
 
 def _save_alice_profiles_to_disk() -> None:
+    _state_publish("alice_profiles")
     tmp = ALICE_PROFILES_PATH + ".tmp"
     with open(tmp, "w", encoding="utf-8") as f:
         json.dump(alice_profiles, f, ensure_ascii=False, indent=2)
     os.replace(tmp, ALICE_PROFILES_PATH)
-    if _gs_spreadsheet is not None:
-        _gs_save_alice_profiles()
+    _gs_sync("alice_profiles", _gs_save_alice_profiles)
 
 
 def _alice_set_profile(user_id: str, profile_key: str) -> None:
@@ -339,6 +587,7 @@ def _load_dynamic_admins() -> None:
 
 
 def _save_dynamic_admins() -> None:
+    _state_publish("admins")
     tmp = f"{ADMINS_PATH}.tmp"
     with open(tmp, "w", encoding="utf-8") as f:
         json.dump(sorted(dynamic_admins), f, ensure_ascii=False)
@@ -359,6 +608,236 @@ except Exception as e:
 TEMP_SCHEDULE_PATH = "temp_schedule.json"
 temp_schedule: dict[str, list[str]] = {}
 
+# ── Снимок расписания ──
+# Основное и временное расписание вместе с версией образуют снимок, который
+# не меняется после публикации: писатели собирают новые словари (копия при
+# записи, см. _set_base_days / _set_temp_days ...) и подменяют снимок целиком
+# через _replace_schedule. Читатель, взявший _snapshot (или schedule /
+# temp_schedule — это ссылки на словари текущего снимка), видит согласованное
+# состояние, даже если параллельно публикуется правка недели.
+# Производные кэши регистрируются через _register_schedule_cache; при правке
+# из них удаляется только затронутое (см. _invalidate_schedule_caches).
+class ScheduleSnapshot(NamedTuple):
+    version: int
+    base: dict
+    temp: dict
+
+
+schedule_version = 0
+_snapshot = ScheduleSnapshot(0, schedule, temp_schedule)
+# (кэш, позиция ISO-даты в ключе или None); ключ кэша начинается с id класса
+_schedule_caches: list[tuple[dict, int | None]] = []
+
+
+def _register_schedule_cache(cache: dict, date_pos: int | None = None) -> dict:
+    """Регистрирует производный кэш. Ключи — кортежи (класс, ...); date_pos —
+    индекс ISO-даты в ключе, если запись зависит только от этой даты."""
+    _schedule_caches.append((cache, date_pos))
+    return cache
+
+
+def _clear_schedule_caches() -> None:
+    for cache, _ in _schedule_caches:
+        cache.clear()
+
+
+# Кэши с классом в ключе ограничены по размеру вытеснением давно не используемых
+# записей (LRU), а не сбросом целиком: с десятками классов полный сброс при
+# переполнении выбрасывал бы горячие записи на каждом запросе.
+SCHEDULE_CACHE_SIZE = int(os.environ.get("SCHEDULE_CACHE_SIZE") or 1024)
+_CACHE_MISS = object()
+
+
+def _lru_get(cache: collections.OrderedDict, key):
+    value = cache.get(key, _CACHE_MISS)
+    if value is not _CACHE_MISS:
+        with contextlib.suppress(KeyError):  # запись могла уйти при инвалидации
+            cache.move_to_end(key)
+    return value
+
+
+def _lru_put(cache: collections.OrderedDict, key, value):
+    cache[key] = value
+    while len(cache) > SCHEDULE_CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+
+# ── События изменений ──
+# Любое изменение расписания или подписок публикуется как событие; всё
+# производное (сохранение, кэши, индексы, задачи напоминаний, счётчики)
+# подписано на события, а не вызывается с каждого места правки:
+#   ScheduleChanged    — изменились дни основного расписания класса;
+#   TempOverrideSet    — добавлены, изменены или сняты замены на даты;
+#   SubscriptionChanged — изменилась подписка чата (None — все подписки).
+# source — откуда правка (telegram, admin, bulk, undo, sheets, disk, state, load);
+# persist — записать на диск и в Sheets (загрузки из них не пишут обратно);
+# before — прежние значения изменённых ключей (None — ключа не было);
+# actor — id админа, сделавшего правку (_current_actor), или None.
+# Синхронные подписчики выполняются сразу в порядке регистрации; ошибка одного
+# не мешает остальным и пробрасывается публикующему после всех (так места
+# правки по-прежнему сообщают «не удалось сохранить»). Асинхронные подписчики
+# запускаются задачами в текущем цикле событий.
+class ScheduleChanged(NamedTuple):
+    tenant: str
+    version: int
+    days: frozenset[str]
+    source: str
+    persist: bool
+    before: dict
+    actor: int | None
+
+
+class TempOverrideSet(NamedTuple):
+    tenant: str
+    version: int
+    dates: frozenset[str]
+    source: str
+    persist: bool
+    before: dict
+    actor: int | None
+
+
+class SubscriptionChanged(NamedTuple):
+    chat_id: int | None
+    source: str
+    persist: bool = True
+
+
+_event_handlers: dict[type, list] = {}
+_event_tasks: set[asyncio.Task] = set()
+# Кто правит расписание: обработчики админских правок выставляют id пользователя
+_current_actor: contextvars.ContextVar[int | None] = contextvars.ContextVar("actor", default=None)
+
+
+def _subscribe_event(*event_types):
+    """Декоратор: подписывает функцию (обычную или async) на типы событий."""
+    def decorator(handler):
+        for event_type in event_types:
+            _event_handlers.setdefault(event_type, []).append(handler)
+        return handler
+    return decorator
+
+
+async def _run_event_handler(handler, event) -> None:
+    try:
+        await handler(event)
+    except Exception as e:
+        logger.error(f"{handler.__name__}({type(event).__name__}) error: {e}")
+
+
+def _publish(*events) -> None:
+    error: Exception | None = None
+    for event in events:
+        for handler in _event_handlers.get(type(event), ()):
+            if asyncio.iscoroutinefunction(handler):
+                try:
+                    loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    continue  # нет цикла (импорт, поток) — только синхронные
+                task = loop.create_task(_run_event_handler(handler, event))
+                _event_tasks.add(task)
+                task.add_done_callback(_event_tasks.discard)
+                continue
+            try:
+                handler(event)
+            except Exception as e:
+                logger.error(f"{handler.__name__}({type(event).__name__}) error: {e}")
+                error = error or e
+    if error is not None:
+        raise error
+
+
+def _changed_keys(old: dict, new: dict) -> frozenset[str]:
+    """Ключи, значения которых изменились. При правке неизменённые значения —
+    те же объекты (копирование при записи); при загрузке сравниваются по значению."""
+    if old is new:
+        return frozenset()
+    return frozenset(
+        k for k in old.keys() | new.keys()
+        if old.get(k) is not new.get(k) and old.get(k) != new.get(k)
+    )
+
+
+def _schedule_events(tenant_id: str, old: ScheduleSnapshot, new: ScheduleSnapshot,
+                     base: dict | None, temp: dict | None, source: str, persist: bool) -> list:
+    events = []
+    actor = _current_actor.get()
+    if base is not None:
+        days = _changed_keys(old.base, base)
+        events.append(ScheduleChanged(tenant_id, new.version, days, source, persist,
+                                      {k: old.base.get(k) for k in days}, actor))
+    if temp is not None:
+        dates = _changed_keys(old.temp, temp)
+        events.append(TempOverrideSet(tenant_id, new.version, dates, source, persist,
+                                      {k: old.temp.get(k) for k in dates}, actor))
+    return events
+
+
+def _replace_schedule(base: dict | None = None, temp: dict | None = None,
+                      source: str = "load", persist: bool = False) -> ScheduleSnapshot:
+    """Публикует новый снимок; None — оставить соответствующую часть как есть.
+    Переданные словари после этого менять нельзя. persist — сохранить
+    изменённые части (ошибка сохранения пробрасывается, снимок уже опубликован)."""
+    global _snapshot, schedule, temp_schedule, schedule_version
+    old = _snapshot
+    _snapshot = ScheduleSnapshot(
+        schedule_version + 1,
+        old.base if base is None else base,
+        old.temp if temp is None else temp,
+    )
+    schedule, temp_schedule = _snapshot.base, _snapshot.temp
+    schedule_version = _snapshot.version
+    _publish(*_schedule_events("", old, _snapshot, base, temp, source, persist))
+    return _snapshot
+
+
+def _set_base_days(days: dict, source: str = "edit", persist: bool = True) -> ScheduleSnapshot:
+    """Новый снимок, в котором дни основного расписания заменены на days."""
+    base = dict(_snapshot.base)
+    base.update(days)
+    return _replace_schedule(base=base, source=source, persist=persist)
+
+
+def _set_base_saturday_profiles(updates: dict[str, list[str]], source: str = "edit",
+                                persist: bool = True) -> ScheduleSnapshot:
+    """Новый снимок с обновлёнными профилями основной субботы (остальные сохраняются)."""
+    sat = _snapshot.base.get("Суббота")
+    new_sat = dict(sat) if isinstance(sat, dict) else {}
+    new_sat.update(updates)
+    return _set_base_days({"Суббота": new_sat}, source, persist)
+
+
+def _set_temp_days(days: dict, source: str = "edit", persist: bool = True) -> ScheduleSnapshot:
+    """Новый снимок с временными заменами days ({дата ISO: уроки или профили};
+    None — убрать замену на эту дату)."""
+    temp = dict(_snapshot.temp)
+    for key, value in days.items():
+        if value is None:
+            temp.pop(key, None)
+        else:
+            temp[key] = value
+    return _replace_schedule(temp=temp, source=source, persist=persist)
+
+
+def _set_temp_saturday_profiles(date_key: str, updates: dict[str, list[str]],
+                                seed_from_base: bool = False, source: str = "edit",
+                                persist: bool = True) -> ScheduleSnapshot:
+    """Новый снимок с обновлёнными профилями временной субботы date_key.
+    seed_from_base — если замены на эту дату ещё нет, остальные профили
+    копируются из основного расписания."""
+    existing = _snapshot.temp.get(date_key)
+    if isinstance(existing, dict):
+        new_day = dict(existing)
+    elif seed_from_base:
+        sat_base = _snapshot.base.get("Суббота")
+        base_dict = sat_base if isinstance(sat_base, dict) else {}
+        new_day = {pk: list(base_dict.get(pk, [])) for pk in SATURDAY_PROFILE_KEYS}
+    else:
+        new_day = {}
+    new_day.update(updates)
+    return _set_temp_days({date_key: new_day}, source, persist)
+
 SUBSCRIPTIONS_PATH = "subscriptions.json"
 subscriptions: dict[str, dict] = {}
 scheduler: AsyncIOScheduler | None = None
@@ -387,96 +866,447 @@ DAY_MAP = {
     "Sunday": "Воскресенье"
 }
 
-# Суббота: расписание по профилям (ключ для хранения, подпись для UI)
-SATURDAY_PROFILES: list[tuple[str, str]] = [
-    ("Физмат", "Физмат"),
-    ("Биохим", "Биохим"),
-    ("Инфотех_1", "Инфотех 1 группа"),
-    ("Инфотех_2", "Инфотех 2 группа"),
-    ("Общеобразовательный_3", "Общеобр-ый 3 группа"),
-    ("Соцгум", "Соцгум"),
+# ── Профили ──
+# Профили (группы) — это части класса с разными уроками в некоторые дни недели
+# (исторически — только суббота, отсюда имена SATURDAY_*). Они задаются данными:
+# PROFILES_PATH (список объектов, см. _DEFAULT_PROFILES) или /api/admin/profiles,
+# без правки кода и передеплоя. Как и расписание, профили хранятся в листе
+# profiles Google Sheets и в общей базе (STATE_BACKEND): локальный файл на
+# эфемерном диске — только копия. Из списка один раз строятся производные таблицы
+# (ProfileSet): подпись → ключ, произношение для Алисы, дни с профилями и все
+# голосовые триггеры одной регуляркой. SATURDAY_PROFILES / _KEYS / _LABELS /
+# SATURDAY_LABEL_TO_KEY остаются и обновляются на месте — их используют
+# админские сценарии.
+PROFILES_PATH = "profiles.json"
+
+_DEFAULT_PROFILES: list[dict] = [
+    {"key": "Физмат", "label": "Физмат", "tts": "Физмат",
+     "triggers": ["физмат", "физико"]},
+    {"key": "Биохим", "label": "Биохим", "tts": "Биохим",
+     "triggers": ["биохим", "биолог"]},
+    {"key": "Инфотех_1", "label": "Инфотех 1 группа", "tts": "Инфотех первая группа",
+     "triggers": ["инфотех первый", "инфотех 1", "первая группа", "первый", "инфотех"]},
+    {"key": "Инфотех_2", "label": "Инфотех 2 группа", "tts": "Инфотех вторая группа",
+     "triggers": ["инфотех второй", "инфотех 2", "вторая группа", "второй", "инфотех"]},
+    {"key": "Общеобразовательный_3", "label": "Общеобр-ый 3 группа",
+     "tts": "Общеобразовательный, третья группа", "triggers": ["общеобр", "третий"]},
+    {"key": "Соцгум", "label": "Соцгум", "tts": "Социально-гуманитарный",
+     "triggers": ["соцгум", "социально", "гуманит"]},
 ]
+
+
+class ProfileSet(NamedTuple):
+    items: tuple[dict, ...]               # нормализованные описания профилей
+    profiles: list[tuple[str, str]]       # (ключ, подпись) в порядке показа
+    labels: dict[str, str]                # ключ → подпись
+    label_to_key: dict[str, str]
+    tts: dict[str, str]                   # подпись → произношение
+    days: frozenset[str]                  # дни недели, у которых бывают профили
+    trigger_re: re.Pattern | None         # все триггеры, длинные раньше коротких
+    triggers: dict[str, tuple[str, ...]]  # триггер → ключи профилей
+
+
+def _normalize_profiles(raw) -> tuple[list[dict] | None, str | None]:
+    """Приводит описание профилей к списку {key, label, tts, triggers, days}.
+    Принимает и короткую форму [[ключ, подпись], ...]. Возвращает (список, ошибка)."""
+    if not isinstance(raw, list):
+        return None, "ожидается список профилей"
+    items: list[dict] = []
+    seen: set[str] = set()
+    for n, p in enumerate(raw, 1):
+        if isinstance(p, (list, tuple)) and len(p) == 2:
+            p = {"key": p[0], "label": p[1]}
+        if not isinstance(p, dict):
+            return None, f"профиль {n}: ожидается объект"
+        key = str(p.get("key") or "").strip()
+        label = str(p.get("label") or key).strip()
+        if not key or ":" in key:
+            return None, f"профиль {n}: пустой или недопустимый ключ"
+        if key in seen:
+            return None, f"профиль {n}: ключ {key!r} повторяется"
+        seen.add(key)
+        days = p.get("days") or ["Суббота"]
+        if not isinstance(days, list) or any(d not in SCHEDULE_DAYS for d in days):
+            return None, f"профиль {key}: неизвестный день в days"
+        triggers = p.get("triggers") or []
+        if not isinstance(triggers, list):
+            return None, f"профиль {key}: triggers — список строк"
+        items.append({
+            "key": key,
+            "label": label,
+            "tts": str(p.get("tts") or label),
+            "triggers": [t for t in (" ".join(str(x).lower().split()) for x in triggers) if t],
+            "days": list(dict.fromkeys(days)),
+        })
+    return items, None
+
+
+def _build_profile_set(items: list[dict]) -> ProfileSet:
+    profiles = [(p["key"], p["label"]) for p in items]
+    triggers: dict[str, tuple[str, ...]] = {}
+    for p in items:
+        for t in p["triggers"]:
+            triggers[t] = triggers.get(t, ()) + (p["key"],)
+    trigger_re = None
+    if triggers:
+        alternation = "|".join(re.escape(t) for t in sorted(triggers, key=len, reverse=True))
+        trigger_re = re.compile(alternation)
+    return ProfileSet(
+        items=tuple(items),
+        profiles=profiles,
+        labels={k: label for k, label in profiles},
+        label_to_key={label: k for k, label in profiles},
+        tts={p["label"]: p["tts"] for p in items},
+        days=frozenset(d for p in items for d in p["days"]),
+        trigger_re=trigger_re,
+        triggers=triggers,
+    )
+
+
+_profile_set: ProfileSet = _build_profile_set(_normalize_profiles(_DEFAULT_PROFILES)[0])
+SATURDAY_PROFILES: list[tuple[str, str]] = list(_profile_set.profiles)
 SATURDAY_PROFILE_KEYS = [k for k, _ in SATURDAY_PROFILES]
-SATURDAY_PROFILE_LABELS = {k: label for k, label in SATURDAY_PROFILES}
-SATURDAY_LABEL_TO_KEY = {label: key for key, label in SATURDAY_PROFILES}
+SATURDAY_PROFILE_LABELS = dict(_profile_set.labels)
+SATURDAY_LABEL_TO_KEY = dict(_profile_set.label_to_key)
+
+
+def _set_profiles(items: list[dict]) -> ProfileSet:
+    """Применяет новый список профилей основного класса (уже нормализованный)."""
+    global _profile_set
+    _profile_set = _build_profile_set(items)
+    SATURDAY_PROFILES[:] = _profile_set.profiles
+    SATURDAY_PROFILE_KEYS[:] = [k for k, _ in SATURDAY_PROFILES]
+    SATURDAY_PROFILE_LABELS.clear()
+    SATURDAY_PROFILE_LABELS.update(_profile_set.labels)
+    SATURDAY_LABEL_TO_KEY.clear()
+    SATURDAY_LABEL_TO_KEY.update(_profile_set.label_to_key)
+    _clear_schedule_caches()
+    return _profile_set
+
+
+def _load_profiles_from_disk() -> None:
+    try:
+        with open(PROFILES_PATH, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        return
+    except Exception as e:
+        logger.error(f"{PROFILES_PATH}: не удалось прочитать ({e}) — профили по умолчанию")
+        return
+    items, err = _normalize_profiles(raw)
+    if err:
+        logger.error(f"{PROFILES_PATH}: {err} — профили по умолчанию")
+        return
+    _set_profiles(items)
+
+
+def _save_profiles_to_disk() -> None:
+    _state_publish("profiles")
+    tmp_path = f"{PROFILES_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(list(_profile_set.items), f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, PROFILES_PATH)
+    _gs_sync("profiles", _gs_save_profiles)
+
+# ── Несколько классов и школ ──
+# Один бот может обслуживать много классов: школа → класс → профили субботы.
+# Описание классов — в TENANTS_PATH:
+#   {"<школа>/<класс>": {"school": "Лицей 1", "class": "10А", "title": "Лицей 1, 10А",
+#                        "profiles": [{"key", "label", ...}] или [["ключ", "подпись"], ...],
+#                        "admins": [user_id, ...], "aliases": ["л1 10а", ...]}}
+# Расписание класса лежит в TENANTS_DIR/<школа>/<класс>/schedule.json и
+# temp_schedule.json. Класс "" — прежний единственный класс: schedule.json из
+# корня, профили из PROFILES_PATH, синхронизация с Sheets и все админские команды.
+# Класс пользователя или чата выбирается командой /class и хранится в
+# USER_TENANTS_PATH ({"<telegram id>" | "alice:<id>": id класса}). Обработчик
+# запроса выставляет класс в contextvar, а функции чтения расписания берут
+# снимок и профили через _current_snapshot() / _current_profile_set() — это поиск
+# в словаре, стоимость не растёт с числом классов.
+TENANTS_PATH = "tenants.json"
+TENANTS_DIR = os.environ.get("TENANTS_DIR") or "tenants"
+USER_TENANTS_PATH = "user_tenants.json"
+DEFAULT_TENANT_TITLE = os.environ.get("DEFAULT_TENANT_TITLE") or "Основной класс"
+
+# id → {"id", "title", "school", "class", "profile_set", "admins", "snapshot"}
+_tenants: dict[str, dict] = {}
+# название / id / алиас в нижнем регистре → id класса (неоднозначные не попадают)
+_tenant_lookup: dict[str, str] = {}
+user_tenants: dict[str, str] = {}
+_current_tenant: contextvars.ContextVar[str] = contextvars.ContextVar("tenant", default="")
+
+
+@contextlib.contextmanager
+def _tenant_scope(tenant_id: str):
+    """Выполняет блок в контексте класса tenant_id (неизвестный — класс по умолчанию)."""
+    token = _current_tenant.set(tenant_id if tenant_id in _tenants else "")
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+
+def _current_snapshot() -> ScheduleSnapshot:
+    tenant = _tenants.get(_current_tenant.get())
+    return tenant["snapshot"] if tenant else _snapshot
+
+
+def _current_profile_set() -> ProfileSet:
+    tenant = _tenants.get(_current_tenant.get())
+    return tenant["profile_set"] if tenant else _profile_set
+
+
+def _current_profiles() -> list[tuple[str, str]]:
+    return _current_profile_set().profiles
+
+
+def _current_profile_labels() -> dict[str, str]:
+    return _current_profile_set().labels
+
+
+def _user_tenant(user_key) -> str:
+    """Класс пользователя / чата (ключ — telegram id или "alice:<id>")."""
+    tenant_id = user_tenants.get(str(user_key), "")
+    return tenant_id if tenant_id in _tenants else ""
+
+
+def _tenant_title(tenant_id: str) -> str:
+    tenant = _tenants.get(tenant_id)
+    return tenant["title"] if tenant else DEFAULT_TENANT_TITLE
+
+
+def _tenant_key(text: str) -> str:
+    return " ".join(str(text or "").lower().split())
+
+
+def _find_tenant(query: str) -> str | None:
+    """id класса по id, названию или алиасу; None — не найден или неоднозначен."""
+    return _tenant_lookup.get(_tenant_key(query))
+
+
+def _is_tenant_admin(user_id: int, tenant_id: str) -> bool:
+    if _is_admin_user_id(user_id):
+        return True
+    tenant = _tenants.get(tenant_id)
+    return bool(tenant) and user_id in tenant["admins"]
+
+
+def _tenant_file(tenant_id: str, name: str) -> str:
+    return os.path.join(TENANTS_DIR, *tenant_id.split("/"), f"{name}.json")
+
+
+def _read_tenant_file(tenant_id: str, name: str, profile_set: ProfileSet) -> dict:
+    path = _tenant_file(tenant_id, name)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.error(f"🏫 {path}: не удалось прочитать ({e})")
+        return {}
+    if data == {}:
+        return data
+    err = _validate_schedule_file(name, data, profile_set.days)
+    if err:
+        logger.error(f"🏫 {path}: файл отклонён — {err}")
+        return {}
+    return data
+
+
+def _load_tenants_from_disk() -> None:
+    global _tenants, _tenant_lookup
+    try:
+        with open(TENANTS_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        data = {}
+    except Exception as e:
+        logger.error(f"🏫 {TENANTS_PATH}: не удалось прочитать ({e})")
+        data = {}
+    tenants: dict[str, dict] = {}
+    lookup: dict[str, str] = {}
+    ambiguous: set[str] = set()
+    for tenant_id, meta in (data.items() if isinstance(data, dict) else []):
+        if not tenant_id or not isinstance(meta, dict) or ".." in tenant_id.split("/"):
+            continue
+        items, err = _normalize_profiles(meta.get("profiles") or meta.get("saturday_profiles") or [])
+        if err:
+            logger.error(f"🏫 {tenant_id}: {err} — класс без профилей")
+            items = []
+        profile_set = _build_profile_set(items)
+        title = meta.get("title") or ", ".join(
+            str(x) for x in (meta.get("school"), meta.get("class")) if x
+        ) or tenant_id
+        tenants[tenant_id] = {
+            "id": tenant_id,
+            "title": str(title),
+            "school": str(meta.get("school") or ""),
+            "class": str(meta.get("class") or ""),
+            "profile_set": profile_set,
+            "admins": {int(x) for x in meta.get("admins") or [] if str(x).lstrip("-").isdigit()},
+            "snapshot": ScheduleSnapshot(
+                0,
+                _read_tenant_file(tenant_id, "schedule", profile_set),
+                _read_tenant_file(tenant_id, "temp_schedule", profile_set),
+            ),
+        }
+        for name in (tenant_id, title, *(meta.get("aliases") or [])):
+            key = _tenant_key(name)
+            if key in lookup and lookup[key] != tenant_id:
+                ambiguous.add(key)
+            lookup.setdefault(key, tenant_id)
+    for key in ambiguous:
+        del lookup[key]
+    _tenants, _tenant_lookup = tenants, lookup
+    _clear_schedule_caches()
+    _rebuild_subscriber_index()
+    if tenants:
+        logger.info(f"🏫 Загружено классов: {len(tenants)}")
+
+
+def _replace_tenant_schedule(tenant_id: str, base: dict | None = None,
+                             temp: dict | None = None, source: str = "load",
+                             persist: bool = False) -> ScheduleSnapshot:
+    """То же, что _replace_schedule, для класса tenant_id."""
+    tenant = _tenants[tenant_id]
+    old = tenant["snapshot"]
+    snap = tenant["snapshot"] = ScheduleSnapshot(
+        old.version + 1,
+        old.base if base is None else base,
+        old.temp if temp is None else temp,
+    )
+    _publish(*_schedule_events(tenant_id, old, snap, base, temp, source, persist))
+    return snap
+
+
+def _save_tenant_schedule_to_disk(tenant_id: str, name: str) -> None:
+    snap = _tenants[tenant_id]["snapshot"]
+    path = _tenant_file(tenant_id, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snap.base if name == "schedule" else snap.temp, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def _load_user_tenants_from_disk() -> None:
+    global user_tenants
+    try:
+        with open(USER_TENANTS_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        user_tenants = {str(k): str(v) for k, v in data.items()} if isinstance(data, dict) else {}
+    except FileNotFoundError:
+        user_tenants = {}
+    except Exception:
+        user_tenants = {}
+    _rebuild_subscriber_index()
+
+
+def _save_user_tenants_to_disk() -> None:
+    tmp_path = f"{USER_TENANTS_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(user_tenants, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, USER_TENANTS_PATH)
+
+
+def _set_user_tenant(user_key, tenant_id: str) -> None:
+    if tenant_id:
+        user_tenants[str(user_key)] = tenant_id
+    else:
+        user_tenants.pop(str(user_key), None)
+    _save_user_tenants_to_disk()
+    _index_chat(user_key)
 
-def _saturday_data_to_profiles(day_data: list | dict | None) -> list[tuple[str, list[str]]]:
-    """Превращает schedule['Суббота'] или temp_schedule[date] в список (подпись, уроки)."""
+
+def _saturday_data_to_profiles(day_data: list | dict | None,
+                               day: str = "Суббота") -> list[tuple[str, list[str]]]:
+    """Превращает schedule[day] или temp_schedule[date] в список (подпись, уроки)."""
     if day_data is None:
         return []
     if isinstance(day_data, list):
-        return [("Суббота", day_data)]  # legacy: один блок
+        return [(day, day_data)]  # legacy: один блок
     if isinstance(day_data, dict):
         out: list[tuple[str, list[str]]] = []
-        for key in SATURDAY_PROFILE_KEYS:
+        for key, label in _current_profiles():
             if key in day_data and isinstance(day_data[key], list):
-                label = SATURDAY_PROFILE_LABELS.get(key, key)
                 out.append((label, day_data[key]))
         return out
     return []
 
+def _date_has_profiles(d: date) -> bool:
+    """Расписание на дату d задано по профилям (с учётом temp_schedule)."""
+    snap = _current_snapshot()
+    key = d.isoformat()
+    data = snap.temp[key] if key in snap.temp else snap.base.get(SCHEDULE_DAYS[d.weekday()])
+    return isinstance(data, dict)
+
+
 def _get_saturday_profiles_for_date(d: date) -> list[tuple[str, list[str]]]:
-    """Расписание субботы по профилям на дату d (с учётом temp_schedule).
+    """Расписание по профилям на дату d (с учётом temp_schedule); профили бывают
+    в любой день из ProfileSet.days, имя функции — историческое.
     Если temp_schedule[date] — dict, мёржим с основным: temp перекрывает только
     те профили которые в нём есть, остальные берутся из schedule.
     Если temp_schedule[date] — list, используем его целиком (legacy).
     """
     key = d.isoformat()
-    base_sat = schedule.get("Суббота")
+    day = SCHEDULE_DAYS[d.weekday()]
+    snap = _current_snapshot()
+    base_sat = snap.base.get(day)
 
-    if key in temp_schedule:
-        raw = temp_schedule[key]
+    if key in snap.temp:
+        raw = snap.temp[key]
         if isinstance(raw, list):
-            return [("Суббота", raw)]
+            return [(day, raw)]
         if isinstance(raw, dict):
             # Мёржим: для каждого профиля берём temp если есть, иначе base
             merged: dict[str, list[str]] = {}
-            for pk in SATURDAY_PROFILE_KEYS:
+            for pk, _ in _current_profiles():
                 if pk in raw:
                     merged[pk] = raw[pk]
                 elif isinstance(base_sat, dict) and pk in base_sat:
                     merged[pk] = base_sat[pk]
-            return _saturday_data_to_profiles(merged)
+            return _saturday_data_to_profiles(merged, day)
         return []
 
-    return _saturday_data_to_profiles(base_sat)
+    return _saturday_data_to_profiles(base_sat, day)
 
 _LESSON_RE = re.compile(
     r"^\s*(?P<start>\d{1,2}:\d{2})\s*-\s*(?P<end>\d{1,2}:\d{2})\s+(?P<rest>.+?)\s*$"
 )
 
 def _load_temp_schedule_from_disk() -> None:
-    global temp_schedule
+    temp: dict = {}
     try:
         with open(TEMP_SCHEDULE_PATH, "r", encoding="utf-8") as f:
             data = json.load(f)
-        if not isinstance(data, dict):
-            temp_schedule = {}
-            return
-        temp_schedule = {}
-        for k, v in data.items():
-            if isinstance(v, list):
-                temp_schedule[k] = [str(x) for x in v]
-            elif isinstance(v, dict):
-                # временная суббота по профилям
-                temp_schedule[k] = {
-                    pk: [str(x) for x in pv]
-                    for pk, pv in v.items()
-                    if isinstance(pv, list)
-                }
+        if isinstance(data, dict):
+            for k, v in data.items():
+                if isinstance(v, list):
+                    temp[k] = [str(x) for x in v]
+                elif isinstance(v, dict):
+                    # временная суббота по профилям
+                    temp[k] = {
+                        pk: [str(x) for x in pv]
+                        for pk, pv in v.items()
+                        if isinstance(pv, list)
+                    }
     except FileNotFoundError:
-        temp_schedule = {}
+        pass
     except Exception:
-        temp_schedule = {}
+        pass
+    _replace_schedule(temp=temp)
 
 def _save_temp_schedule_to_disk() -> None:
+    _state_publish("temp_schedule")
     tmp_path = f"{TEMP_SCHEDULE_PATH}.tmp"
     with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(temp_schedule, f, ensure_ascii=False, indent=2)
         f.write("\n")
     os.replace(tmp_path, TEMP_SCHEDULE_PATH)
-    if _gs_spreadsheet is not None:
-        _gs_save_temp_schedule()
+    _gs_sync("temp_schedule", _gs_save_temp_schedule)
 
 def _load_subscriptions_from_disk() -> None:
     global subscriptions
@@ -491,49 +1321,451 @@ def _load_subscriptions_from_disk() -> None:
         subscriptions = {}
     except Exception:
         subscriptions = {}
+    _rebuild_subscriber_index()
 
 def _save_subscriptions_to_disk() -> None:
+    _state_publish("subscriptions")
     tmp_path = f"{SUBSCRIPTIONS_PATH}.tmp"
     with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(subscriptions, f, ensure_ascii=False, indent=2)
         f.write("\n")
     os.replace(tmp_path, SUBSCRIPTIONS_PATH)
-    if _gs_spreadsheet is not None:
-        _gs_save_subscriptions()
+    _gs_sync("subscriptions", _gs_save_subscriptions)
+
+# ── Журнал рассылок ───────────────────────────────────────────────────────
+# Каждая рассылка записывается в BROADCASTS_PATH (JSON Lines): start — текст и
+# список получателей, try — перед отправкой в чат, sent / failed — результат,
+# done — конец. Если процесс перезапустился посреди рассылки, при старте
+# (у лидера) она досылается тем, кому ещё не отправляли. Чаты, по которым есть
+# только try (отправка могла пройти), повторно не трогаем — помечаем unknown,
+# чтобы не прислать сообщение дважды. Рассылку, которую ещё ведёт другой живой
+# воркер (запись в журнале свежее BROADCAST_STALE_SECONDS), не подхватываем.
+# Когда незавершённых рассылок не остаётся, журнал сжимается до сводок
+# последних BROADCAST_HISTORY рассылок. Журнал пишут все воркеры, поэтому
+# дозапись и сжатие согласуются через flock на BROADCASTS_LOCK_PATH: дозапись —
+# разделяемая блокировка, подмена файла при сжатии — исключительная.
+BROADCASTS_PATH = "broadcasts.jsonl"
+BROADCASTS_LOCK_PATH = f"{BROADCASTS_PATH}.lock"
+BROADCAST_HISTORY = 20
+BROADCAST_STALE_SECONDS = 60.0
+_broadcast_lock = threading.Lock()
+_broadcast_lock_fd: int | None = None
+
+
+@contextlib.contextmanager
+def _broadcast_file_lock(exclusive: bool = False):
+    """Блокировка журнала рассылок: внутри процесса — _broadcast_lock, между процессами — flock."""
+    global _broadcast_lock_fd
+    with _broadcast_lock:
+        if fcntl is None:
+            yield
+            return
+        if _broadcast_lock_fd is None:
+            _broadcast_lock_fd = os.open(BROADCASTS_LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(_broadcast_lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(_broadcast_lock_fd, fcntl.LOCK_UN)
 
-async def _notify_subscribers(text: str, parse_mode: str = "HTML",
-                              notify_type: str = "changes") -> None:
-    """Отправляет сообщение подписчикам.
-    notify_type='changes' — только тем у кого включены уведомления об изменениях.
-    notify_type='daily'   — только тем у кого включены ежедневные напоминания (используется планировщиком).
-    notify_type='all'     — всем у кого есть хоть какая-то подписка.
+
+def _broadcast_log(record: dict, sync: bool = False) -> None:
+    record["t"] = round(time.time(), 3)
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _broadcast_file_lock():
+        with open(BROADCASTS_PATH, "a", encoding="utf-8") as f:
+            f.write(line)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def _broadcast_read() -> dict[str, dict]:
+    """Восстанавливает состояние рассылок из журнала: {id: {...}}."""
+    try:
+        with open(BROADCASTS_PATH, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return {}
+    return _broadcast_parse(lines)
+
+
+def _broadcast_parse(lines) -> dict[str, dict]:
+    out: dict[str, dict] = {}
+    for line in lines:
+        try:
+            rec = json.loads(line)
+        except Exception:
+            continue  # недописанная строка при падении
+        op, bid = rec.get("op"), rec.get("id")
+        if op == "summary":
+            out[bid] = {**rec, "done": True}
+        elif op == "start":
+            out[bid] = {
+                "id": bid,
+                "ts": rec.get("ts"),
+                "owner": rec.get("owner"),
+                "text": rec.get("text", ""),
+                "parse_mode": rec.get("parse_mode"),
+                "targets": rec.get("targets", []),
+                "status": {},
+                "last": rec.get("t", 0),
+                "done": False,
+            }
+        elif bid in out:
+            entry = out[bid]
+            entry["last"] = max(entry.get("last", 0), rec.get("t", 0))
+            if op == "done":
+                entry["done"] = True
+            elif op in ("try", "sent", "failed", "unknown"):
+                entry["status"][str(rec.get("chat"))] = op
+    return out
+
+
+def _broadcast_summary(entry: dict) -> dict:
+    counts: dict[str, int] = {}
+    for st in entry["status"].values():
+        counts[st] = counts.get(st, 0) + 1
+    return {
+        "op": "summary",
+        "id": entry["id"],
+        "ts": entry["ts"],
+        "text": entry["text"][:200],
+        "targets": len(entry["targets"]),
+        "counts": counts,
+        # Храним только проблемные чаты — по ним и нужен разбор
+        "status": {c: st for c, st in entry["status"].items() if st != "sent"},
+    }
+
+
+def _broadcast_compact() -> None:
+    """Сжимает журнал, если все рассылки завершены.
+
+    Журнал читается и разбирается без блокировки; под исключительной блокировкой
+    только проверяется, что файл с тех пор не менялся, и он подменяется. Если
+    кто-то успел дописать — сжатие пропускается до следующей рассылки.
     """
-    if not subscriptions:
+    try:
+        with open(BROADCASTS_PATH, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+            st = os.fstat(f.fileno())
+    except FileNotFoundError:
         return
-    chat_ids = set()
-    for entry in subscriptions.values():
-        cid = entry.get("chat_id")
-        if cid is None:
-            continue
-        if notify_type == "all":
-            chat_ids.add(int(cid))
-        elif notify_type == "changes" and entry.get("notify_changes", True):
-            chat_ids.add(int(cid))
-        elif notify_type == "daily" and entry.get("notify_daily", True):
-            chat_ids.add(int(cid))
+    entries = _broadcast_parse(lines)
+    if any(not e["done"] for e in entries.values()):
+        return
+    done = sorted(entries.values(), key=lambda e: e["ts"] or "")[-BROADCAST_HISTORY:]
+    body = "".join(
+        json.dumps(
+            {k: v for k, v in e.items() if k != "done"} if e.get("op") == "summary" else _broadcast_summary(e),
+            ensure_ascii=False,
+        ) + "\n"
+        for e in done
+    )
+    with _broadcast_file_lock(exclusive=True):
+        try:
+            cur = os.stat(BROADCASTS_PATH)
+        except FileNotFoundError:
+            return
+        if (cur.st_ino, cur.st_size) != (st.st_ino, st.st_size):
+            return
+        tmp = f"{BROADCASTS_PATH}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(body)
+        os.replace(tmp, BROADCASTS_PATH)
+
+
+async def _broadcast_send(bid: str, text: str, parse_mode: str | None, chat_ids) -> None:
     for chat_id in chat_ids:
+        _broadcast_log({"op": "try", "id": bid, "chat": chat_id})
         try:
             await bot_app.bot.send_message(
                 chat_id=chat_id,
                 text=text,
                 parse_mode=parse_mode,
             )
+            _broadcast_log({"op": "sent", "id": bid, "chat": chat_id})
             await asyncio.sleep(0.05)
-        except Exception:
-            pass
-
-def _is_superadmin_user_id(user_id: int) -> bool:
-    """Суперадмин — только из переменной окружения ADMIN_USER_IDS."""
+        except Exception as e:
+            _broadcast_log({"op": "failed", "id": bid, "chat": chat_id, "error": str(e)[:200]})
+    _broadcast_log({"op": "done", "id": bid}, sync=True)
+    try:
+        await asyncio.to_thread(_broadcast_compact)
+    except Exception as e:
+        logger.error(f"_broadcast_compact error: {e}")
+
+
+async def _broadcast(text: str, parse_mode: str | None, chat_ids) -> str:
+    """Рассылает text в chat_ids с записью в журнал. Возвращает id рассылки."""
+    bid = uuid.uuid4().hex[:12]
+    targets = sorted(int(c) for c in chat_ids)
+    _broadcast_log({
+        "op": "start",
+        "id": bid,
+        "ts": datetime.now(tz=_get_tz()).isoformat(timespec="seconds"),
+        "owner": _state_owner,
+        "text": text,
+        "parse_mode": parse_mode,
+        "targets": targets,
+    }, sync=True)
+    await _broadcast_send(bid, text, parse_mode, targets)
+    return bid
+
+
+async def _broadcast_resume() -> None:
+    """Досылает незавершённые рассылки после перезапуска."""
+    for _ in range(5):
+        entries = await asyncio.to_thread(_broadcast_read)
+        unfinished = [e for e in entries.values() if not e["done"] and e.get("owner") != _state_owner]
+        stale = [e for e in unfinished if time.time() - e["last"] >= BROADCAST_STALE_SECONDS]
+        for entry in stale:
+            await _broadcast_resume_one(entry)
+        if len(stale) == len(unfinished):
+            return
+        # Остальные, возможно, ещё ведёт другой воркер — проверим позже
+        await asyncio.sleep(BROADCAST_STALE_SECONDS)
+
+
+async def _broadcast_resume_one(entry: dict) -> None:
+    status = entry["status"]
+    for chat, st in status.items():
+        if st == "try":
+            _broadcast_log({"op": "unknown", "id": entry["id"], "chat": int(chat)})
+    pending = [c for c in entry["targets"] if str(c) not in status]
+    logger.info(
+        f"📨 Досылаем рассылку {entry['id']}: осталось {len(pending)} из {len(entry['targets'])}"
+    )
+    await _broadcast_send(entry["id"], entry["text"], entry["parse_mode"], pending)
+
+
+# Индекс класс → ключи подписок: рассылка класса обходит только своих подписчиков.
+# Подписка хранится под id пользователя, а класс берётся по её chat_id (это может
+# быть группа), поэтому рядом ведётся chat_id → ключи подписок: смена класса чата
+# переиндексирует все подписки, которые в него шлют. Обновляется по
+# SubscriptionChanged и из _set_user_tenant, перестраивается при загрузке.
+_tenant_subscribers: dict[str, set[str]] = {}
+_chat_subscriptions: dict[str, set[str]] = {}
+_subscriber_slot: dict[str, tuple[str, str]] = {}  # ключ подписки → (класс, chat_id)
+
+
+def _index_subscriber(key: str) -> None:
+    old = _subscriber_slot.pop(key, None)
+    if old is not None:
+        _tenant_subscribers.get(old[0], set()).discard(key)
+        _chat_subscriptions.get(old[1], set()).discard(key)
+    entry = subscriptions.get(key)
+    if not entry or entry.get("chat_id") is None:
+        return
+    chat = str(entry["chat_id"])
+    tenant = _user_tenant(chat)
+    _subscriber_slot[key] = (tenant, chat)
+    _tenant_subscribers.setdefault(tenant, set()).add(key)
+    _chat_subscriptions.setdefault(chat, set()).add(key)
+
+
+def _index_chat(chat_key) -> None:
+    """Переиндексирует подписки, которые шлют в чат chat_key (после смены его класса)."""
+    for key in list(_chat_subscriptions.get(str(chat_key), ())):
+        _index_subscriber(key)
+
+
+def _rebuild_subscriber_index() -> None:
+    _tenant_subscribers.clear()
+    _chat_subscriptions.clear()
+    _subscriber_slot.clear()
+    for key in subscriptions:
+        _index_subscriber(key)
+
+
+@_subscribe_event(SubscriptionChanged)
+def _update_subscriber_index(event: SubscriptionChanged) -> None:
+    if event.chat_id is None:
+        _rebuild_subscriber_index()
+    else:
+        _index_subscriber(str(event.chat_id))
+
+
+def _subscriber_chat_ids(notify_type: str = "changes", tenant: str = "") -> set[int]:
+    """Чаты подписчиков класса tenant ("" — основного)."""
+    chat_ids = set()
+    for key in _tenant_subscribers.get(tenant, ()):
+        entry = subscriptions[key]
+        cid = entry["chat_id"]
+        if notify_type == "all":
+            chat_ids.add(int(cid))
+        elif notify_type == "changes" and entry.get("notify_changes", True):
+            chat_ids.add(int(cid))
+        elif notify_type == "daily" and entry.get("notify_daily", True):
+            chat_ids.add(int(cid))
+    return chat_ids
+
+
+async def _notify_subscribers(text: str, parse_mode: str = "HTML",
+                              notify_type: str = "changes", exclude=(), tenant: str = "") -> None:
+    """Отправляет сообщение подписчикам класса tenant ("" — основного).
+    notify_type='changes' — только тем у кого включены уведомления об изменениях.
+    notify_type='daily'   — только тем у кого включены ежедневные напоминания (используется планировщиком).
+    notify_type='all'     — всем у кого есть хоть какая-то подписка.
+    exclude — чаты, которым не отправлять.
+    """
+    chat_ids = _subscriber_chat_ids(notify_type, tenant) - set(exclude)
+    if chat_ids:
+        await _broadcast(text, parse_mode, chat_ids)
+
+# ── Объединение уведомлений об изменениях ─────────────────────────────────
+# Правки, сделанные подряд (понедельник, потом вторник, потом профиль субботы),
+# не рассылаются по отдельности: уведомления копятся NOTIFY_COALESCE_SECONDS
+# после последней правки (но не дольше пяти окон с первой) и уходят одним
+# сообщением. Повторная правка того же дня заменяет ещё не отправленное
+# уведомление о нём. 0 — рассылать сразу, как раньше.
+# Если изменение касается дня, напоминание о котором уже отправлено, это
+# напоминание редактируется на месте, а дайджест такому чату не шлётся.
+NOTIFY_COALESCE_SECONDS = float(os.environ.get("NOTIFY_COALESCE_SECONDS") or 30)
+
+# (класс, ключ) → (текст, даты); ключ описывает, что изменено: "base:Понедельник",
+# "base:Суббота:<профиль>", "temp:2026-10-20", "temp:2026-10-24:<профиль>" ...
+# даты — затронутые конкретные даты (для правок основного расписания — None).
+# Уведомления каждого класса собираются в свой дайджест для его подписчиков.
+_pending_notices: dict[tuple[str, str], tuple[str, frozenset[str] | None]] = {}
+# (класс, ключ) → снимок, с которым сравнивалось ещё не отправленное уведомление-разница
+_notice_origins: dict[tuple[str, str], ScheduleSnapshot] = {}
+_notice_window = {"first": 0.0, "last": 0.0}
+_notice_task: asyncio.Task | None = None
+
+
+def _superseded_notices(key: str, covers=(), tenant: str = "") -> list[tuple[str, str]]:
+    """Ожидающие уведомления класса tenant, которые заменяет уведомление key."""
+    superseded = {key, *covers}
+    return [
+        (t, k) for t, k in _pending_notices
+        if t == tenant and (k in superseded or any(c.endswith(":") and k.startswith(c) for c in covers))
+    ]
+
+
+def _queue_change_notice(key: str, text: str, covers=(), tenant: str = "") -> None:
+    """Ставит уведомление об изменении в очередь на рассылку подписчикам класса
+    tenant ("" — основного). covers — ключи уведомлений, которые это изменение
+    делает неактуальными (ключ с ':' на конце — все ключи с таким префиксом)."""
+    global _notice_task
+    dates = _notice_dates(key, covers)
+    if NOTIFY_COALESCE_SECONDS <= 0:
+        asyncio.create_task(_deliver_change_notices({tenant: [(text, dates)]}))
+        return
+    for k in _superseded_notices(key, covers, tenant):
+        del _pending_notices[k]
+        _notice_origins.pop(k, None)
+    _pending_notices[(tenant, key)] = (text, dates)
+    now = time.monotonic()
+    if _notice_task is None or _notice_task.done():
+        _notice_window["first"] = now
+        _notice_task = asyncio.create_task(_flush_change_notices())
+    _notice_window["last"] = now
+
+
+def _queue_diff_notice(key: str, title: str, old: ScheduleSnapshot, days, covers=(),
+                       tenant: str = "") -> None:
+    """Уведомление «было → стало» по дням days между снимком old и текущим
+    снимком класса tenant. Если уведомление о тех же днях ещё ждёт отправки,
+    «было» берётся из него: подписчики видят разницу с тем, что им уже
+    присылали, а правка, вернувшая всё как было, снимает уведомление совсем."""
+    pending = _superseded_notices(key, covers, tenant)
+    origins = [_notice_origins[k] for k in pending if k in _notice_origins]
+    origin = min([old, *origins], key=lambda snap: snap.version)
+    with _tenant_scope(tenant):
+        text = _format_change_notice(title, origin, _tenant_snapshot(tenant), days)
+    if text is None:
+        for k in pending:
+            del _pending_notices[k]
+            _notice_origins.pop(k, None)
+        return
+    _queue_change_notice(key, text, covers, tenant)
+    if (tenant, key) in _pending_notices:
+        _notice_origins[(tenant, key)] = origin
+
+
+def _notice_dates(key: str, covers=()) -> frozenset[str] | None:
+    """Конкретные даты, которых касается уведомление (только временные замены)."""
+    if not key.startswith("temp:"):
+        return None
+    dates = set()
+    for k in (key, *covers):
+        part = k.split(":")[1] if k.count(":") else ""
+        if re.fullmatch(r"\d{4}-\d{2}-\d{2}", part):
+            dates.add(part)
+    return frozenset(dates) or None
+
+
+def _change_notice_digest(notices: list[tuple[str, frozenset[str] | None]]) -> str | None:
+    """Собирает уведомления в одно сообщение."""
+    texts = [text for text, _ in notices]
+    if not texts:
+        return None
+    if len(texts) == 1:
+        return _truncate_message(texts[0])
+    parts = [t.removeprefix("📢").strip() for t in texts]
+    return _truncate_message("📢 Изменения в расписании:\n\n" + "\n\n".join(parts))
+
+
+def _pending_notices_by_tenant() -> dict[str, list[tuple[str, frozenset[str] | None]]]:
+    """Забирает ожидающие уведомления, сгруппированные по классам."""
+    by_tenant: dict[str, list] = {}
+    for (tenant, _), notice in _pending_notices.items():
+        by_tenant.setdefault(tenant, []).append(notice)
+    _pending_notices.clear()
+    _notice_origins.clear()
+    return by_tenant
+
+
+def _journal_pending_notices() -> None:
+    """При остановке записывает неотправленные дайджесты в журнал рассылок —
+    их дошлёт лидер после перезапуска."""
+    for tenant, notices in _pending_notices_by_tenant().items():
+        text = _change_notice_digest(notices)
+        chat_ids = _subscriber_chat_ids("changes", tenant) if text else set()
+        if chat_ids:
+            _broadcast_log({
+                "op": "start",
+                "id": uuid.uuid4().hex[:12],
+                "ts": datetime.now(tz=_get_tz()).isoformat(timespec="seconds"),
+                "owner": None,
+                "text": text,
+                "parse_mode": "HTML",
+                "targets": sorted(chat_ids),
+            }, sync=True)
+
+
+async def _flush_change_notices() -> None:
+    while True:
+        deadline = min(
+            _notice_window["last"] + NOTIFY_COALESCE_SECONDS,
+            _notice_window["first"] + NOTIFY_COALESCE_SECONDS * 5,
+        )
+        delay = deadline - time.monotonic()
+        if delay <= 0:
+            break
+        await asyncio.sleep(delay)
+    await _deliver_change_notices(_pending_notices_by_tenant())
+
+
+async def _deliver_change_notices(by_tenant: dict[str, list[tuple[str, frozenset[str] | None]]]) -> None:
+    if not any(by_tenant.values()):
+        return
+    edited = await _edit_sent_reminders()
+    for tenant, notices in by_tenant.items():
+        text = _change_notice_digest(notices)
+        if not text:
+            continue
+        # Чату с отредактированным напоминанием дайджест не нужен, если все изменения
+        # касаются только дня этого напоминания
+        exclude = {
+            chat_id for chat_id, day in edited.items()
+            if all(dates is not None and dates <= {day} for _, dates in notices)
+        }
+        await _notify_subscribers(text, exclude=exclude, tenant=tenant)
+
+
+def _is_superadmin_user_id(user_id: int) -> bool:
+    """Суперадмин — только из переменной окружения ADMIN_USER_IDS."""
     return user_id in ADMIN_USER_IDS
 
 
@@ -635,13 +1867,13 @@ def _log_user(update: Update, action: str = "") -> None:
     logger.info(f"USER id={user.id} {username} ({name}) {chat_info}{text}{(' | ' + action) if action else ''}")
 
 def _save_schedule_to_disk() -> None:
+    _state_publish("schedule")
     tmp_path = "schedule.json.tmp"
     with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(schedule, f, ensure_ascii=False, indent=4)
         f.write("\n")
     os.replace(tmp_path, "schedule.json")
-    if _gs_spreadsheet is not None:
-        _gs_save_schedule()
+    _gs_sync("schedule", _gs_save_schedule)
 
 def _parse_lesson_line(line: str) -> dict:
     raw = (line or "").strip()
@@ -732,6 +1964,95 @@ def _format_day_table_html(day: str, lessons: list[str]) -> str:
     pre = html.escape("\n".join(lines))
     return f"<b>{html.escape(day)}</b>\n<pre>{pre}</pre>"
 
+
+# ── Разница расписаний для уведомлений ──
+# Уведомление об изменении показывает только отличия по урокам («было → стало»),
+# а не день или неделю целиком. Сравниваются итоговые дни: для даты — замена,
+# если она есть (с профилями основного расписания, которых в ней нет), иначе
+# основное расписание. В сводке по нескольким дням день, в котором отличий
+# больше NOTICE_DIFF_DAY_LINES, сворачивается в одну строку.
+NOTICE_DIFF_DAY_LINES = 4
+
+
+def _resolved_day(snap: ScheduleSnapshot, key: str) -> dict[str, list[str]]:
+    """Итоговые уроки дня key (день недели или ISO-дата): {профиль: уроки},
+    для дня без профилей — {"": уроки}."""
+    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", key):
+        base = snap.base.get(SCHEDULE_DAYS[date.fromisoformat(key).weekday()])
+        value = snap.temp.get(key, base)
+        if isinstance(value, dict) and isinstance(base, dict) and value is not base:
+            value = {**base, **value}
+    else:
+        value = snap.base.get(key)
+    if isinstance(value, dict):
+        return value
+    return {"": value} if value else {}
+
+
+def _lesson_short(line: str) -> str:
+    p = _parse_lesson_line(line)
+    text = p["subject"] + (f" ({p['room']})" if p["room"] else "")
+    return f"{p['start']} {text}" if p["start"] else text
+
+
+def _lesson_diff_lines(old: list[str], new: list[str]) -> list[str]:
+    """Отличия по урокам: «N. было → стало», «+ N. новый», «− N. убран»
+    (номера — по новому расписанию, у убранных — по старому)."""
+    old = [line.strip() for line in old]
+    new = [line.strip() for line in new]
+    out = []
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if op == "equal":
+            continue
+        paired = min(i2 - i1, j2 - j1)
+        for k in range(paired):
+            was, now = _parse_lesson_line(old[i1 + k]), _lesson_short(new[j1 + k])
+            if was["start"] and now.startswith(was["start"] + " "):
+                now = now[len(was["start"]) + 1:]  # время то же — не повторяем
+            out.append(f"{j1 + k + 1}. {_lesson_short(old[i1 + k])} → {now}")
+        out.extend(f"− {k + 1}. {_lesson_short(old[k])}" for k in range(i1 + paired, i2))
+        out.extend(f"+ {k + 1}. {_lesson_short(new[k])}" for k in range(j1 + paired, j2))
+    return out
+
+
+def _notice_day_label(key: str) -> str:
+    if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", key):
+        return key
+    d = date.fromisoformat(key)
+    return f"{d.strftime('%d.%m.%Y')} ({DAY_MAP.get(d.strftime('%A'), d.strftime('%A'))})"
+
+
+def _format_change_notice(title: str, old: ScheduleSnapshot, new: ScheduleSnapshot,
+                          days) -> str | None:
+    """Текст уведомления об отличиях дней days между снимками; None — отличий нет."""
+    days = list(days)
+    labels = _current_profile_labels()
+    sections = []
+    for key in days:
+        old_day, new_day = _resolved_day(old, key), _resolved_day(new, key)
+        if old_day == new_day:
+            continue
+        label = _notice_day_label(key)
+        blocks = []
+        for profile in dict.fromkeys([*new_day, *old_day]):
+            lines = _lesson_diff_lines(old_day.get(profile) or [], new_day.get(profile) or [])
+            if lines:
+                head = f"{label} — {labels.get(profile, profile)}" if profile else label
+                blocks.append((head, lines))
+        changed = sum(len(lines) for _, lines in blocks)
+        if not changed:
+            continue
+        if len(days) > 1 and changed > NOTICE_DIFF_DAY_LINES:
+            sections.append(f"<b>{html.escape(label)}</b>: изменений — {changed}")
+            continue
+        sections.extend(
+            f"<b>{html.escape(head)}</b>\n" + "\n".join(html.escape(line) for line in lines)
+            for head, lines in blocks
+        )
+    if not sections:
+        return None
+    return _truncate_message(f"{title}\n\n" + "\n\n".join(sections))
+
 def _get_tz() -> ZoneInfo:
     name = (os.environ.get("TZ") or "Etc/GMT-5").strip()
     try:
@@ -767,72 +2088,293 @@ def _get_lessons_for_date(d: date) -> tuple[str, list[str]]:
     key = d.isoformat()
     day_eng = d.strftime("%A")
     day_ru = DAY_MAP.get(day_eng, day_eng)
+    snap = _current_snapshot()
+    raw = snap.temp[key] if key in snap.temp else snap.base.get(day_ru, [])
+    if isinstance(raw, list):
+        return day_ru, raw
+    return day_ru, []  # по профилям — см. _get_saturday_profiles_for_date
+
+# Текст напоминания одинаков для всех подписчиков с той же датой и профилем —
+# рендерим его один раз; кэш сбрасывается при изменении расписания.
+_reminder_cache: collections.OrderedDict[tuple[str, str, str, str | None], str | None] = (
+    _register_schedule_cache(collections.OrderedDict(), date_pos=1)
+)
 
-    if day_ru == "Суббота":
-        if key in temp_schedule:
-            raw = temp_schedule[key]
-            if isinstance(raw, list):
-                return day_ru, raw
-            return day_ru, []  # по профилям — см. _get_saturday_profiles_for_date
-        sat = schedule.get("Суббота")
-        if isinstance(sat, list):
-            return day_ru, sat
-        return day_ru, []  # по профилям
 
-    if key in temp_schedule:
-        raw = temp_schedule[key]
-        if isinstance(raw, list):
-            return day_ru, raw
-        return day_ru, []
-    return day_ru, schedule.get(day_ru, [])
+def _render_reminder(target_date: date, day_type: str, profile: str | None = None) -> str | None:
+    """Текст ежедневного напоминания или None, если уроков нет.
+    profile — ключ профиля субботы: в субботу показываем только его."""
+    labels = _current_profile_labels()
+    if profile not in labels:
+        profile = None
+    cache_key = (_current_tenant.get(), target_date.isoformat(), day_type, profile)
+    cached = _lru_get(_reminder_cache, cache_key)
+    if cached is not _CACHE_MISS:
+        return cached
 
-async def _send_daily_reminder(chat_id: int, day_type: str = "today"):
-    now = datetime.now(tz=_get_tz())
-    target_date = now.date() if day_type == "today" else (now + timedelta(days=1)).date()
     day_eng = target_date.strftime("%A")
     day_ru = DAY_MAP.get(day_eng, day_eng)
     date_label = "сегодня" if day_type == "today" else "завтра"
-
+    text = None
     if day_ru == "Воскресенье":
-        return  # В воскресенье уроков нет — не отправляем
-
-    if day_ru == "Суббота":
+        pass  # В воскресенье уроков нет — не отправляем
+    elif _date_has_profiles(target_date):
         profiles = _get_saturday_profiles_for_date(target_date)
+        if profile is not None:
+            wanted = labels[profile]
+            profiles = [(label, lessons) for label, lessons in profiles if label == wanted]
         # Если нет ни одного профиля с уроками — не отправляем
-        has_lessons = any(lessons for _, lessons in profiles)
-        if not profiles or not has_lessons:
-            return
-        parts = [_format_day_table_html(f"Суббота — {label}", lessons) for label, lessons in profiles]
-        text = _truncate_message(f"📅 Расписание на {date_label} (суббота):\n\n" + "\n\n".join(parts))
+        if any(lessons for _, lessons in profiles):
+            parts = [_format_day_table_html(f"{day_ru} — {label}", lessons) for label, lessons in profiles]
+            text = _truncate_message(f"📅 Расписание на {date_label} ({day_ru.lower()}):\n\n" + "\n\n".join(parts))
     else:
         day, lessons = _get_lessons_for_date(target_date)
-        if not lessons:
-            return  # Пустой день — не отправляем
-        header = f"📅 Расписание на {date_label} ({day}):\n\n"
-        text = _truncate_message(header + _format_day_table_html(day, lessons))
-    await bot_app.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+        if lessons:  # Пустой день — не отправляем
+            header = f"📅 Расписание на {date_label} ({day}):\n\n"
+            text = _truncate_message(header + _format_day_table_html(day, lessons))
+    return _lru_put(_reminder_cache, cache_key, text)
 
 
-def _format_week_text_base() -> str:
-    """Текст основного расписания на неделю (Пн–Вс) без временных замен."""
-    blocks: list[str] = []
-    for day in SCHEDULE_DAYS:
-        if day == "Суббота":
-            sat = schedule.get("Суббота")
-            if isinstance(sat, dict):
-                for pk in SATURDAY_PROFILE_KEYS:
-                    if pk in sat and sat[pk]:
-                        label = SATURDAY_PROFILE_LABELS.get(pk, pk)
-                        blocks.append(_format_day_table_html(f"Суббота — {label}", sat[pk]))
-            elif isinstance(sat, list) and sat:
-                blocks.append(_format_day_table_html("Суббота", sat))
+# ── Текущий и следующий урок ──
+# «Какой сейчас урок» спрашивают постоянно, поэтому строки уроков не
+# разбираются на каждый запрос: для разрешённого дня (с учётом temp_schedule и
+# профилей) один раз строится индекс — отсортированные минуты начала/конца —
+# и ответ ищется bisect'ом. Индексы лежат в кэше, сбрасываемом с версией
+# расписания.
+class LessonIndex(NamedTuple):
+    starts: tuple[int, ...]   # минуты от полуночи, по возрастанию
+    ends: tuple[int, ...]
+    lessons: tuple[dict, ...]  # _parse_lesson_line + "number" (номер урока в дне)
+
+
+def _hhmm_to_minute(value: str) -> int | None:
+    parsed = _parse_hhmm(value)
+    return parsed[0] * 60 + parsed[1] if parsed else None
+
+
+def _build_lesson_index(lessons: list[str]) -> LessonIndex:
+    """Уроки без времени и прочерки («-») в индекс не попадают."""
+    rows = []
+    for number, line in enumerate(lessons, start=1):
+        p = _parse_lesson_line(line)
+        start = _hhmm_to_minute(p["start"])
+        end = _hhmm_to_minute(p["end"])
+        if start is None or end is None or not p["subject"].strip("-–— "):
             continue
+        rows.append((start, max(end, start), {**p, "number": number}))
+    rows.sort(key=lambda r: r[0])
+    return LessonIndex(
+        tuple(r[0] for r in rows),
+        tuple(r[1] for r in rows),
+        tuple(r[2] for r in rows),
+    )
 
-        data = schedule.get(day, [])
-        if isinstance(data, list) and data:
-            blocks.append(_format_day_table_html(day, data))
 
-    return "\n\n".join(blocks) if blocks else _format_day_table_html("Неделя", [])
+# (класс, дата) → ((ключ профиля | None, подпись | None, индекс), ...)
+_lesson_index_cache: collections.OrderedDict[tuple[str, str], tuple] = (
+    _register_schedule_cache(collections.OrderedDict(), date_pos=1)
+)
+
+
+def _lesson_indexes_for_date(d: date) -> tuple:
+    cache_key = (_current_tenant.get(), d.isoformat())
+    cached = _lru_get(_lesson_index_cache, cache_key)
+    if cached is _CACHE_MISS:
+        if _date_has_profiles(d):
+            label_to_key = _current_profile_set().label_to_key
+            cached = tuple(
+                (label_to_key.get(label, label), label, _build_lesson_index(lessons))
+                for label, lessons in _get_saturday_profiles_for_date(d)
+                if lessons
+            )
+        else:
+            cached = ((None, None, _build_lesson_index(_get_lessons_for_date(d)[1])),)
+        _lru_put(_lesson_index_cache, cache_key, cached)
+    return cached
+
+
+def _lesson_at(index: LessonIndex, minute: int) -> dict:
+    """Текущий и следующий урок на минуту minute; поиск — bisect по началам."""
+    i = bisect.bisect_right(index.starts, minute)
+    current = index.lessons[i - 1] if i and minute < index.ends[i - 1] else None
+    nxt = index.lessons[i] if i < len(index.lessons) else None
+    return {
+        "current": current,
+        "next": nxt,
+        "minutes_left": index.ends[i - 1] - minute if current else None,
+        "minutes_to_next": index.starts[i] - minute if nxt else None,
+        "started": i > 0,
+        "finished": bool(index.lessons) and nxt is None and current is None,
+    }
+
+
+def _now_status(now: datetime, profile: str | None = None) -> list[dict]:
+    """Текущий/следующий урок для каждого профиля дня (или одного, если
+    profile — ключ профиля, который в этот день есть)."""
+    minute = now.hour * 60 + now.minute
+    indexes = _lesson_indexes_for_date(now.date())
+    if profile and any(key == profile for key, _, _ in indexes):
+        indexes = [row for row in indexes if row[0] == profile]
+    return [
+        {"profile": key, "label": label, **_lesson_at(index, minute)}
+        for key, label, index in indexes
+    ]
+
+
+def _now_lesson_json(lesson: dict | None) -> dict | None:
+    if lesson is None:
+        return None
+    return {k: lesson[k] for k in ("number", "start", "end", "subject", "room")}
+
+
+def _format_now_text(status: list[dict], tts: bool = False) -> str:
+    """Короткий ответ «что сейчас»: для экрана или (tts=True) для Алисы."""
+    def subj(lesson: dict) -> str:
+        if tts:
+            return _alice_clean_tts(_alice_expand_subject(lesson["subject"]))
+        return lesson["subject"] + (f" (каб. {lesson['room']})" if lesson["room"] else "")
+
+    mins = "минут" if tts else "мин"
+    parts = []
+    for item in status:
+        cur, nxt = item["current"], item["next"]
+        if cur:
+            text = f"Сейчас {cur['number']}-й урок: {subj(cur)}, до конца {item['minutes_left']} {mins}."
+            if nxt:
+                text += f" Дальше {subj(nxt)} в {nxt['start']}."
+            else:
+                text += " Это последний урок."
+        elif nxt:
+            head = "Сейчас перемена. Следующий урок" if item["started"] else "Уроки ещё не начались. Первый"
+            text = f"{head} — {subj(nxt)} в {nxt['start']}, через {item['minutes_to_next']} {mins}."
+        elif item["finished"]:
+            text = "Уроки на сегодня закончились."
+        else:
+            continue
+        if item["label"]:
+            label = _alice_profile_tts(item["label"]) if tts else item["label"]
+            text = f"{label}: {text}"
+        parts.append(text)
+    if not parts:
+        return "Сегодня уроков нет."
+    return ("\n" if not tts else " ").join(parts)
+
+
+# ── Отправленные напоминания ──
+# Для каждого чата помним последнее напоминание (дата, message_id, отпечаток
+# текста), чтобы при изменении расписания на этот день отредактировать его,
+# а не присылать второе сообщение. Записи за прошедшие дни выбрасываются.
+REMINDER_MESSAGES_PATH = "reminder_messages.json"
+reminder_messages: dict[str, dict] = {}
+_reminder_messages_save_task: asyncio.Task | None = None
+
+
+def _load_reminder_messages_from_disk() -> None:
+    global reminder_messages
+    try:
+        with open(REMINDER_MESSAGES_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        reminder_messages = data if isinstance(data, dict) else {}
+    except FileNotFoundError:
+        reminder_messages = {}
+    except Exception:
+        reminder_messages = {}
+
+
+def _save_reminder_messages_to_disk() -> None:
+    today = datetime.now(tz=_get_tz()).date().isoformat()
+    for cid in [c for c, rec in reminder_messages.items() if rec.get("date", "") < today]:
+        del reminder_messages[cid]
+    tmp_path = f"{REMINDER_MESSAGES_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(reminder_messages, f, ensure_ascii=False)
+        f.write("\n")
+    os.replace(tmp_path, REMINDER_MESSAGES_PATH)
+
+
+def _schedule_reminder_messages_save() -> None:
+    """Откладывает запись на пару секунд: утром напоминания уходят пачкой."""
+    global _reminder_messages_save_task
+    if _reminder_messages_save_task is not None and not _reminder_messages_save_task.done():
+        return
+
+    async def _save_later():
+        await asyncio.sleep(2)
+        try:
+            _save_reminder_messages_to_disk()
+        except Exception as e:
+            logger.error(f"_save_reminder_messages_to_disk error: {e}")
+
+    _reminder_messages_save_task = asyncio.create_task(_save_later())
+
+
+def _text_digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+async def _send_daily_reminder(chat_id: int, day_type: str = "today", profile: str | None = None):
+    now = datetime.now(tz=_get_tz())
+    target_date = now.date() if day_type == "today" else (now + timedelta(days=1)).date()
+    tenant_id = _user_tenant(chat_id)
+    with _tenant_scope(tenant_id):
+        text = _render_reminder(target_date, day_type, profile)
+    if text is None:
+        return
+    msg = await bot_app.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+    reminder_messages[str(chat_id)] = {
+        "tenant": tenant_id,
+        "date": target_date.isoformat(),
+        "message_id": msg.message_id,
+        "day_type": day_type,
+        "profile": profile,
+        "hash": _text_digest(text),
+    }
+    _schedule_reminder_messages_save()
+
+
+async def _edit_sent_reminders() -> dict[int, str]:
+    """Редактирует уже отправленные напоминания, текст которых устарел.
+    Возвращает {chat_id: дата напоминания} для успешно отредактированных."""
+    if not _is_leader():
+        # Напоминания отправляет и хранит лидер: правит и сохраняет их тоже только он,
+        # здесь уведомление уйдёт подписчикам целиком
+        return {}
+    now = datetime.now(tz=_get_tz())
+    today = now.date().isoformat()
+    edited: dict[int, str] = {}
+    for cid, rec in list(reminder_messages.items()):
+        day = rec.get("date", "")
+        if day < today:
+            continue
+        try:
+            target = date.fromisoformat(day)
+        except ValueError:
+            continue
+        with _tenant_scope(rec.get("tenant", "")):
+            text = _render_reminder(target, rec.get("day_type", "today"), rec.get("profile"))
+        if text is None or _text_digest(text) == rec.get("hash"):
+            continue
+        try:
+            await bot_app.bot.edit_message_text(
+                chat_id=int(cid),
+                message_id=rec["message_id"],
+                text=_truncate_message(f"✏️ Обновлено в {now.strftime('%H:%M')}\n{text}"),
+                parse_mode="HTML",
+            )
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                continue  # сообщение удалено или слишком старое — уйдёт обычной рассылкой
+        except Exception:
+            continue
+        rec["hash"] = _text_digest(text)
+        edited[int(cid)] = day
+        await asyncio.sleep(0.05)
+    if edited:
+        try:
+            _save_reminder_messages_to_disk()
+        except Exception as e:
+            logger.error(f"_save_reminder_messages_to_disk error: {e}")
+    return edited
 
 
 def _nearest_saturday_profiles() -> list[tuple[str, list[str]]]:
@@ -884,9 +2426,24 @@ def _format_week_webapp_html(blocks_fn) -> str:
     ) if parts else _format_schedule_webapp_html("Нет занятий", [])
 
 
+# (класс, режим, сегодняшняя дата) → HTML; сбрасывается с новой версией расписания
+_schedule_html_cache: collections.OrderedDict[tuple[str, str, str], str] = (
+    _register_schedule_cache(collections.OrderedDict())
+)
+
+
 def _get_schedule_html_for_day_type(day_type: str = "today") -> str:
     """HTML‑текст расписания для различных режимов (для WebApp API)."""
+    cache_key = (_current_tenant.get(), day_type, datetime.now(tz=_get_tz()).date().isoformat())
+    cached = _lru_get(_schedule_html_cache, cache_key)
+    if cached is _CACHE_MISS:
+        cached = _lru_put(_schedule_html_cache, cache_key, _render_schedule_html_for_day_type(day_type))
+    return cached
+
+
+def _render_schedule_html_for_day_type(day_type: str) -> str:
     now = datetime.now(tz=_get_tz())
+    snap = _current_snapshot()
 
     if day_type == "week":
         def _week_blocks():
@@ -896,14 +2453,14 @@ def _get_schedule_html_for_day_type(day_type: str = "today") -> str:
                 day_idx = SCHEDULE_DAYS.index(day)
                 today_idx = now_tz.weekday()
                 target_date = (now_tz + timedelta(days=day_idx - today_idx)).date()
-                if day == "Суббота":
+                if _date_has_profiles(target_date):
                     for label, lessons in _get_saturday_profiles_for_date(target_date):
                         if lessons:
-                            result.append((f"Суббота — {label}", lessons))
+                            result.append((f"{day} — {label}", lessons))
                     continue
                 date_key = target_date.isoformat()
-                raw = temp_schedule.get(date_key)
-                data = raw if isinstance(raw, list) else schedule.get(day, [])
+                raw = snap.temp.get(date_key)
+                data = raw if isinstance(raw, list) else snap.base.get(day, [])
                 if isinstance(data, list) and data:
                     result.append((day, data))
             return result
@@ -914,16 +2471,12 @@ def _get_schedule_html_for_day_type(day_type: str = "today") -> str:
         def _week_base_blocks():
             result = []
             for day in SCHEDULE_DAYS:
-                if day == "Суббота":
-                    sat = schedule.get("Суббота")
-                    if isinstance(sat, dict):
-                        for pk in SATURDAY_PROFILE_KEYS:
-                            if pk in sat and sat[pk]:
-                                result.append((f"Суббота — {SATURDAY_PROFILE_LABELS.get(pk, pk)}", sat[pk]))
-                    elif isinstance(sat, list) and sat:
-                        result.append(("Суббота", sat))
+                data = snap.base.get(day, [])
+                if isinstance(data, dict):
+                    for pk, label in _current_profiles():
+                        if pk in data and data[pk]:
+                            result.append((f"{day} — {label}", data[pk]))
                     continue
-                data = schedule.get(day, [])
                 if isinstance(data, list) and data:
                     result.append((day, data))
             return result
@@ -936,7 +2489,7 @@ def _get_schedule_html_for_day_type(day_type: str = "today") -> str:
         sat_date = (now_tz + timedelta(days=5 - now_tz.weekday())).date()
         profiles = _get_saturday_profiles_for_date(sat_date)
         for label, lessons in profiles:
-            if profile_key == SATURDAY_LABEL_TO_KEY.get(label, label) or profile_key == label:
+            if _current_profile_labels().get(profile_key) == label or profile_key == label:
                 return _format_schedule_webapp_html(f"Суббота — {label}", lessons)
         return _format_schedule_webapp_html("Нет занятий для выбранного профиля", [])
 
@@ -953,11 +2506,11 @@ def _get_schedule_html_for_day_type(day_type: str = "today") -> str:
     day_ru = DAY_MAP.get(day_eng, day_eng)
     date_label = "сегодня" if day_type == "today" else "завтра"
 
-    if day_ru == "Суббота":
+    if _date_has_profiles(target_date):
         profiles = _get_saturday_profiles_for_date(target_date)
         if profiles:
-            return "\n".join(_format_schedule_webapp_html(f"Суббота — {label}", lessons) for label, lessons in profiles)
-        return _format_schedule_webapp_html("Суббота", [])
+            return "\n".join(_format_schedule_webapp_html(f"{day_ru} — {label}", lessons) for label, lessons in profiles)
+        return _format_schedule_webapp_html(day_ru, [])
 
     day, lessons = _get_lessons_for_date(target_date)
     label = f"📅 {date_label.capitalize()} — {day}"
@@ -976,7 +2529,7 @@ def _reschedule_user(user_id: int):
         scheduler.remove_job(job_id)
     except Exception:
         pass
-    if not entry:
+    if not entry or entry.get("notify_daily") is False:
         return
     time_str = entry.get("time", "")
     parsed = _parse_hhmm(time_str)
@@ -989,13 +2542,308 @@ def _reschedule_user(user_id: int):
     scheduler.add_job(
         _send_daily_reminder,
         trigger=trigger,
-        args=[chat_id, day_type],
+        args=[chat_id, day_type, entry.get("profile")],
         id=job_id,
         replace_existing=True,
         misfire_grace_time=3600,
         coalesce=True,
     )
 
+# ── Подписчики событий ──
+_event_stats: dict[str, int] = {}
+
+
+@_subscribe_event(ScheduleChanged, TempOverrideSet)
+def _invalidate_schedule_caches(event) -> None:
+    """Сбрасывает в кэшах только затронутое: записи дат из события (или дат с
+    изменённым днём недели); кэши без даты в ключе — целиком для класса."""
+    days = getattr(event, "days", frozenset())
+    dates = getattr(event, "dates", frozenset())
+    for cache, date_pos in _schedule_caches:
+        for key in list(cache):
+            if key[0] != event.tenant:
+                continue
+            if date_pos is not None:
+                iso = key[date_pos]
+                if iso not in dates and SCHEDULE_DAYS[date.fromisoformat(iso).weekday()] not in days:
+                    continue
+            cache.pop(key, None)
+
+
+@_subscribe_event(ScheduleChanged, TempOverrideSet)
+def _persist_schedule(event) -> None:
+    if not event.persist:
+        return
+    name = "schedule" if isinstance(event, ScheduleChanged) else "temp_schedule"
+    if event.tenant:
+        _save_tenant_schedule_to_disk(event.tenant, name)
+    elif name == "schedule":
+        _save_schedule_to_disk()
+    else:
+        _save_temp_schedule_to_disk()
+
+
+@_subscribe_event(ScheduleChanged, TempOverrideSet)
+async def _rebuild_day_indexes(event) -> None:
+    """Индексы уроков на сегодня и завтра строятся сразу после правки, а не
+    первым запросом «что сейчас»."""
+    now = datetime.now(tz=_get_tz())
+    with _tenant_scope(event.tenant):
+        for d in (now.date(), (now + timedelta(days=1)).date()):
+            _lesson_indexes_for_date(d)
+
+
+@_subscribe_event(SubscriptionChanged)
+def _persist_subscriptions(event: SubscriptionChanged) -> None:
+    if event.persist:
+        _save_subscriptions_to_disk()
+
+
+@_subscribe_event(SubscriptionChanged)
+def _reschedule_on_subscription(event: SubscriptionChanged) -> None:
+    if event.chat_id is None:
+        _reschedule_all()
+    else:
+        _reschedule_user(event.chat_id)
+
+
+@_subscribe_event(ScheduleChanged, TempOverrideSet, SubscriptionChanged)
+def _count_event(event) -> None:
+    key = f"{type(event).__name__}:{event.source}"
+    _event_stats[key] = _event_stats.get(key, 0) + 1
+
+
+# ── Журнал правок ──
+# Правки расписания дописываются в AUDIT_LOG_PATH (JSON Lines); файл только
+# растёт. Запись edit — кто (actor — id админа, source) и когда (t), а для
+# каждого изменённого дня основного расписания (kind=base) или даты замены
+# (kind=temp) — значения до и после, для суббот по профилям ещё и список
+# изменённых профилей. Перед первой правкой класса и затем через каждые
+# AUDIT_SNAPSHOT_EVERY правок пишется snapshot — расписание класса целиком
+# до очередной правки. В памяти только индекс смещений: снимков, правок по id и
+# последних AUDIT_RECENT правок каждого класса. Индекс строится один раз при
+# старте (в потоке) и дальше дочитывается с последнего проиндексированного байта
+# (_audit_index_tail) — так в него попадают и строки, дописанные другими
+# воркерами, а смещения всегда точные. Состояние на момент t собирается из
+# ближайшего снимка и не более AUDIT_SNAPSHOT_EVERY правок после него, список
+# и откат читают только нужные строки. Загрузки из общей базы (state) и
+# начальная загрузка (load) не пишутся — правку уже записал воркер, который её сделал.
+AUDIT_LOG_PATH = os.getenv("AUDIT_LOG_PATH", "audit_log.jsonl")
+AUDIT_SNAPSHOT_EVERY = max(1, int(os.getenv("AUDIT_SNAPSHOT_EVERY", "100")))
+AUDIT_RECENT = 500
+_AUDIT_SKIP_SOURCES = {"state", "load"}
+_audit_lock = threading.Lock()
+# класс → [(t, смещение строки snapshot)] в порядке записи
+_audit_snapshots: dict[str, list[tuple[float, int]]] = {}
+_audit_since_snapshot: dict[str, int] = {}
+# id правки → смещение; класс → смещения последних AUDIT_RECENT правок
+_audit_edits: dict[str, int] = {}
+_audit_recent: dict[str, collections.deque] = {}
+_audit_indexed = 0  # байт журнала уже в индексе
+
+
+def _audit_index_tail() -> None:
+    """Дочитывает в индекс журнал с _audit_indexed до конца. Вызывать под _audit_lock."""
+    global _audit_indexed
+    try:
+        with open(AUDIT_LOG_PATH, "rb") as f:
+            f.seek(_audit_indexed)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # строку ещё дописывают — дочитаем в следующий раз
+                offset = _audit_indexed
+                _audit_indexed += len(line)
+                try:
+                    rec = json.loads(line)
+                except Exception:
+                    continue  # недописанная строка при падении
+                tenant = rec.get("tenant", "")
+                if rec.get("op") == "snapshot":
+                    _audit_snapshots.setdefault(tenant, []).append((rec.get("t", 0), offset))
+                    _audit_since_snapshot[tenant] = 0
+                elif rec.get("op") == "edit":
+                    _audit_since_snapshot[tenant] = _audit_since_snapshot.get(tenant, 0) + 1
+                    _audit_edits[rec.get("id")] = offset
+                    if tenant not in _audit_recent:
+                        _audit_recent[tenant] = collections.deque(maxlen=AUDIT_RECENT)
+                    _audit_recent[tenant].append(offset)
+    except FileNotFoundError:
+        pass
+
+
+def _audit_load_index() -> None:
+    """Строит индекс журнала с нуля (при старте, в отдельном потоке)."""
+    global _audit_indexed
+    with _audit_lock:
+        _audit_snapshots.clear()
+        _audit_since_snapshot.clear()
+        _audit_edits.clear()
+        _audit_recent.clear()
+        _audit_indexed = 0
+        _audit_index_tail()
+
+
+def _audit_append(records: list[dict]) -> None:
+    with _audit_lock:
+        with open(AUDIT_LOG_PATH, "ab") as f:
+            f.write("".join(json.dumps(rec, ensure_ascii=False) + "\n" for rec in records).encode("utf-8"))
+        _audit_index_tail()
+
+
+def _audit_read_at(offset: int) -> dict | None:
+    """Одна запись журнала по смещению."""
+    try:
+        with open(AUDIT_LOG_PATH, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _audit_read(offset: int = 0):
+    """Записи журнала, начиная с байта offset."""
+    try:
+        with open(AUDIT_LOG_PATH, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except Exception:
+                    continue
+    except FileNotFoundError:
+        return
+
+
+def _tenant_snapshot(tenant_id: str) -> ScheduleSnapshot:
+    return _tenants[tenant_id]["snapshot"] if tenant_id else _snapshot
+
+
+def _audit_changes(kind: str, before: dict, current: dict) -> list[dict]:
+    changes = []
+    for key in sorted(before):
+        old, new = before[key], current.get(key)
+        change = {"kind": kind, "key": key, "before": old, "after": new}
+        if isinstance(old, dict) or isinstance(new, dict):
+            old_p = old if isinstance(old, dict) else {}
+            new_p = new if isinstance(new, dict) else {}
+            change["profiles"] = sorted(k for k in old_p.keys() | new_p.keys() if old_p.get(k) != new_p.get(k))
+        changes.append(change)
+    return changes
+
+
+@_subscribe_event(ScheduleChanged, TempOverrideSet)
+def _audit_schedule_change(event) -> None:
+    if event.source in _AUDIT_SKIP_SOURCES or not event.before:
+        return
+    kind = "base" if isinstance(event, ScheduleChanged) else "temp"
+    snap = _tenant_snapshot(event.tenant)
+    current = snap.base if kind == "base" else snap.temp
+    t = round(time.time(), 3)
+    records = []
+    with _audit_lock:
+        _audit_index_tail()
+        need_snapshot = (event.tenant not in _audit_snapshots
+                         or _audit_since_snapshot.get(event.tenant, 0) >= AUDIT_SNAPSHOT_EVERY)
+    if need_snapshot:
+        previous = dict(current)
+        for key, value in event.before.items():
+            if value is None:
+                previous.pop(key, None)
+            else:
+                previous[key] = value
+        records.append({
+            "op": "snapshot", "tenant": event.tenant, "t": t,
+            "base": previous if kind == "base" else snap.base,
+            "temp": previous if kind == "temp" else snap.temp,
+        })
+    records.append({
+        "op": "edit", "id": uuid.uuid4().hex[:12], "tenant": event.tenant, "t": t,
+        "actor": event.actor, "source": event.source,
+        "changes": _audit_changes(kind, event.before, current),
+    })
+    _audit_append(records)
+
+
+def _audit_state_at(tenant_id: str, t: float) -> tuple[dict, dict] | None:
+    """Расписание класса (base, temp) на момент t; None — журнал начинается позже."""
+    with _audit_lock:
+        _audit_index_tail()
+        snaps = list(_audit_snapshots.get(tenant_id, []))
+    i = bisect.bisect_right(snaps, (t, float("inf"))) - 1
+    if i < 0:
+        return None
+    base = temp = None
+    for rec in _audit_read(snaps[i][1]):
+        if rec.get("t", 0) > t:
+            break
+        if rec.get("tenant", "") != tenant_id:
+            continue
+        if rec.get("op") == "snapshot":
+            base, temp = dict(rec["base"]), dict(rec["temp"])
+        elif rec.get("op") == "edit" and base is not None:
+            for change in rec.get("changes", []):
+                target = base if change["kind"] == "base" else temp
+                if change["after"] is None:
+                    target.pop(change["key"], None)
+                else:
+                    target[change["key"]] = change["after"]
+    return (base, temp) if base is not None else None
+
+
+def _audit_entries(tenant_id: str, limit: int) -> list[dict]:
+    """Последние limit (не больше AUDIT_RECENT) правок класса, новые первыми."""
+    with _audit_lock:
+        _audit_index_tail()
+        offsets = list(_audit_recent.get(tenant_id, ()))[-limit:]
+    entries = (_audit_read_at(offset) for offset in reversed(offsets))
+    return [rec for rec in entries if rec is not None]
+
+
+def _audit_find(edit_id: str | None, tenant_id: str) -> dict | None:
+    """Правка edit_id или, без него, последняя правка класса."""
+    with _audit_lock:
+        _audit_index_tail()
+        if edit_id:
+            offset = _audit_edits.get(edit_id)
+        else:
+            recent = _audit_recent.get(tenant_id)
+            offset = recent[-1] if recent else None
+    return None if offset is None else _audit_read_at(offset)
+
+
+def _audit_undo(rec: dict, force: bool = False) -> list[str]:
+    """Возвращает значения «до» правки rec (как новую правку с source=undo).
+    Если затронутое уже изменено позже — ничего не делает и возвращает список
+    конфликтов (force — откатить всё равно)."""
+    tenant_id = rec.get("tenant", "")
+    snap = _tenant_snapshot(tenant_id)
+    restore: dict[str, dict] = {"base": {}, "temp": {}}
+    conflicts = []
+    for change in rec.get("changes", []):
+        current = (snap.base if change["kind"] == "base" else snap.temp).get(change["key"])
+        if current != change["after"]:
+            conflicts.append(f"{change['kind']}:{change['key']}")
+        restore[change["kind"]][change["key"]] = change["before"]
+    if conflicts and not force:
+        return conflicts
+    parts: dict[str, dict | None] = {"base": None, "temp": None}
+    for kind, values in restore.items():
+        if not values:
+            continue
+        new = dict(snap.base if kind == "base" else snap.temp)
+        for key, value in values.items():
+            if value is None:
+                new.pop(key, None)
+            else:
+                new[key] = value
+        parts[kind] = new
+    if tenant_id:
+        _replace_tenant_schedule(tenant_id, parts["base"], parts["temp"], source="undo", persist=True)
+    else:
+        _replace_schedule(parts["base"], parts["temp"], source="undo", persist=True)
+    return []
+
+
 _MAX_MESSAGE_LEN = 4096
 
 def _truncate_message(text: str, max_len: int = _MAX_MESSAGE_LEN - 100) -> str:
@@ -1006,6 +2854,7 @@ def _truncate_message(text: str, max_len: int = _MAX_MESSAGE_LEN - 100) -> str:
 def _format_week_text() -> str:
     """Текст расписания на неделю с учётом временных замен."""
     now_tz = datetime.now(tz=_get_tz())
+    snap = _current_snapshot()
     blocks: list[str] = []
     for day in SCHEDULE_DAYS:
         # Ищем ближайшую дату этого дня в течение текущей недели (пн-вс)
@@ -1016,19 +2865,19 @@ def _format_week_text() -> str:
         target_date = (now_tz + timedelta(days=delta)).date()
         date_key = target_date.isoformat()
 
-        if day == "Суббота":
+        if _date_has_profiles(target_date):
             profiles = _get_saturday_profiles_for_date(target_date)
             for label, lessons in profiles:
                 if lessons:
-                    blocks.append(_format_day_table_html(f"Суббота — {label}", lessons))
+                    blocks.append(_format_day_table_html(f"{day} — {label}", lessons))
             continue
 
-        # Для обычных дней — temp перекрывает основное
-        if date_key in temp_schedule:
-            raw = temp_schedule[date_key]
+        # Для дней без профилей — temp перекрывает основное
+        if date_key in snap.temp:
+            raw = snap.temp[date_key]
             data = raw if isinstance(raw, list) else []
         else:
-            data = schedule.get(day, [])
+            data = snap.base.get(day, [])
 
         if isinstance(data, list) and data:
             blocks.append(_format_day_table_html(day, data))
@@ -1038,11 +2887,12 @@ def _format_week_text() -> str:
 def _format_week_text_without_saturday() -> str:
     """Текст расписания на неделю без субботы, с учётом временных замен."""
     now_tz = datetime.now(tz=_get_tz())
+    snap = _current_snapshot()
     blocks: list[str] = []
     for day in SCHEDULE_DAYS:
         if day == "Суббота":
             continue
-        if day not in schedule and day not in [d for d in SCHEDULE_DAYS]:
+        if day not in snap.base and day not in [d for d in SCHEDULE_DAYS]:
             continue
         day_idx = SCHEDULE_DAYS.index(day)
         today_idx = now_tz.weekday()
@@ -1050,11 +2900,16 @@ def _format_week_text_without_saturday() -> str:
         target_date = (now_tz + timedelta(days=delta)).date()
         date_key = target_date.isoformat()
 
-        if date_key in temp_schedule:
-            raw = temp_schedule[date_key]
+        if _date_has_profiles(target_date):
+            for label, lessons in _get_saturday_profiles_for_date(target_date):
+                if lessons:
+                    blocks.append(_format_day_table_html(f"{day} — {label}", lessons))
+            continue
+        if date_key in snap.temp:
+            raw = snap.temp[date_key]
             data = raw if isinstance(raw, list) else []
         else:
-            data = schedule.get(day, [])
+            data = snap.base.get(day, [])
 
         if isinstance(data, list) and data:
             blocks.append(_format_day_table_html(day, data))
@@ -1113,6 +2968,7 @@ def _get_saturday_inline_results_for_week() -> list[InlineQueryResultArticle]:
 #   завтра / tomorrow → аналогично
 #   неделя / week     → Пн–Пт одним блоком + подсказки профилей субботы
 #   суббота / saturday→ только профили субботы (текущей недели)
+#   сейчас / now      → текущий и следующий урок
 #
 async def inline_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     _log_user(update, "inline_query")
@@ -1126,24 +2982,24 @@ async def inline_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # Сегодня
         today_day, today_lessons = _get_lessons_for_date(now.date())
-        if today_day == "Суббота":
+        if _date_has_profiles(now.date()):
             today_profiles = _get_saturday_profiles_for_date(now.date())
             for label, prof_lessons in today_profiles:
-                text = _truncate_message(_format_day_table_html(f"Суббота — {label}", prof_lessons))
+                text = _truncate_message(_format_day_table_html(f"{today_day} — {label}", prof_lessons))
                 results.append(InlineQueryResultArticle(
                     id=str(uuid.uuid4()),
                     title=f"Сегодня — {label}",
-                    description="Суббота, сегодня",
+                    description=f"{today_day}, сегодня",
                     input_message_content=InputTextMessageContent(text, parse_mode="HTML"),
                 ))
             if today_profiles:
                 all_text = _truncate_message("\n\n".join(
-                    _format_day_table_html(f"Суббота — {lbl}", lsns) for lbl, lsns in today_profiles
+                    _format_day_table_html(f"{today_day} — {lbl}", lsns) for lbl, lsns in today_profiles
                 ))
                 results.append(InlineQueryResultArticle(
                     id=str(uuid.uuid4()),
                     title="Сегодня — Все профили",
-                    description="Суббота сегодня — все профили одним сообщением",
+                    description=f"{today_day} сегодня — все профили одним сообщением",
                     input_message_content=InputTextMessageContent(all_text, parse_mode="HTML"),
                 ))
         else:
@@ -1156,24 +3012,24 @@ async def inline_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # Завтра
         tomorrow_day, tomorrow_lessons = _get_lessons_for_date(tomorrow_date)
-        if tomorrow_day == "Суббота":
+        if _date_has_profiles(tomorrow_date):
             tomorrow_profiles = _get_saturday_profiles_for_date(tomorrow_date)
             for label, prof_lessons in tomorrow_profiles:
-                text = _truncate_message(_format_day_table_html(f"Суббота — {label}", prof_lessons))
+                text = _truncate_message(_format_day_table_html(f"{tomorrow_day} — {label}", prof_lessons))
                 results.append(InlineQueryResultArticle(
                     id=str(uuid.uuid4()),
                     title=f"Завтра — {label}",
-                    description="Суббота, завтра",
+                    description=f"{tomorrow_day}, завтра",
                     input_message_content=InputTextMessageContent(text, parse_mode="HTML"),
                 ))
             if tomorrow_profiles:
                 all_text = _truncate_message("\n\n".join(
-                    _format_day_table_html(f"Суббота — {lbl}", lsns) for lbl, lsns in tomorrow_profiles
+                    _format_day_table_html(f"{tomorrow_day} — {lbl}", lsns) for lbl, lsns in tomorrow_profiles
                 ))
                 results.append(InlineQueryResultArticle(
                     id=str(uuid.uuid4()),
                     title="Завтра — Все профили",
-                    description="Суббота завтра — все профили одним сообщением",
+                    description=f"{tomorrow_day} завтра — все профили одним сообщением",
                     input_message_content=InputTextMessageContent(all_text, parse_mode="HTML"),
                 ))
         else:
@@ -1201,26 +3057,26 @@ async def inline_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # ── Уровень 1: сегодня ──────────────────────────────────────────────────
     if query_text in ["сегодня", "today"]:
         day, lessons = _get_lessons_for_date(now.date())
-        if day == "Суббота":
+        if _date_has_profiles(now.date()):
             profiles = _get_saturday_profiles_for_date(now.date())
             # Каждый профиль отдельной кнопкой
             for label, prof_lessons in profiles:
-                text = _truncate_message(_format_day_table_html(f"Суббота — {label}", prof_lessons))
+                text = _truncate_message(_format_day_table_html(f"{day} — {label}", prof_lessons))
                 results.append(InlineQueryResultArticle(
                     id=str(uuid.uuid4()),
                     title=f"{label}",
-                    description=f"Суббота, сегодня — {label}",
+                    description=f"{day}, сегодня — {label}",
                     input_message_content=InputTextMessageContent(text, parse_mode="HTML"),
                 ))
             # Все профили одним сообщением
             if profiles:
                 all_text = _truncate_message("\n\n".join(
-                    _format_day_table_html(f"Суббота — {lbl}", lsns) for lbl, lsns in profiles
+                    _format_day_table_html(f"{day} — {lbl}", lsns) for lbl, lsns in profiles
                 ))
                 results.append(InlineQueryResultArticle(
                     id=str(uuid.uuid4()),
                     title="Все профили",
-                    description="Суббота сегодня — все профили одним сообщением",
+                    description=f"{day} сегодня — все профили одним сообщением",
                     input_message_content=InputTextMessageContent(all_text, parse_mode="HTML"),
                 ))
         else:
@@ -1237,26 +3093,26 @@ async def inline_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if query_text in ["завтра", "tomorrow"]:
         tomorrow_date = (now + timedelta(days=1)).date()
         day, lessons = _get_lessons_for_date(tomorrow_date)
-        if day == "Суббота":
+        if _date_has_profiles(tomorrow_date):
             profiles = _get_saturday_profiles_for_date(tomorrow_date)
             # Каждый профиль отдельной кнопкой
             for label, prof_lessons in profiles:
-                text = _truncate_message(_format_day_table_html(f"Суббота — {label}", prof_lessons))
+                text = _truncate_message(_format_day_table_html(f"{day} — {label}", prof_lessons))
                 results.append(InlineQueryResultArticle(
                     id=str(uuid.uuid4()),
                     title=f"{label}",
-                    description=f"Суббота, завтра — {label}",
+                    description=f"{day}, завтра — {label}",
                     input_message_content=InputTextMessageContent(text, parse_mode="HTML"),
                 ))
             # Все профили одним сообщением
             if profiles:
                 all_text = _truncate_message("\n\n".join(
-                    _format_day_table_html(f"Суббота — {lbl}", lsns) for lbl, lsns in profiles
+                    _format_day_table_html(f"{day} — {lbl}", lsns) for lbl, lsns in profiles
                 ))
                 results.append(InlineQueryResultArticle(
                     id=str(uuid.uuid4()),
                     title="Все профили",
-                    description="Суббота завтра — все профили одним сообщением",
+                    description=f"{day} завтра — все профили одним сообщением",
                     input_message_content=InputTextMessageContent(all_text, parse_mode="HTML"),
                 ))
         else:
@@ -1300,13 +3156,25 @@ async def inline_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.inline_query.answer(results, cache_time=0)
         return
 
+    # ── Уровень 1: сейчас (текущий и следующий урок) ────────────────────────
+    if query_text in ["сейчас", "now"]:
+        text = _format_now_text(_now_status(now))
+        results.append(InlineQueryResultArticle(
+            id=str(uuid.uuid4()),
+            title="Сейчас",
+            description=_truncate(text.replace("\n", " "), 100),
+            input_message_content=InputTextMessageContent(text),
+        ))
+        await update.inline_query.answer(results, cache_time=0)
+        return
+
     # ── Неизвестный запрос — подсказка ──────────────────────────────────────
     results.append(InlineQueryResultArticle(
         id=str(uuid.uuid4()),
-        title="Введите: сегодня / завтра / неделя / суббота",
-        description="или today / tomorrow / week / saturday",
+        title="Введите: сегодня / завтра / неделя / суббота / сейчас",
+        description="или today / tomorrow / week / saturday / now",
         input_message_content=InputTextMessageContent(
-            "Доступные запросы: сегодня, завтра, неделя, суббота"
+            "Доступные запросы: сегодня, завтра, неделя, суббота, сейчас"
         ),
     ))
     await update.inline_query.answer(results, cache_time=0)
@@ -1333,6 +3201,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/subscribe 07:30 — расписание на сегодня каждый день в указанное время\n"
         "/subscribe 07:30 завтра — расписание на завтра\n"
         "/unsubscribe — отключить напоминания\n\n"
+        "/class 10А — выбрать класс (если бот обслуживает несколько)\n"
+        "/calendar — ссылка на расписание для календаря телефона\n\n"
         "Inline-режим:\n"
         "Набери @бота и выбери подсказку или введи: today / tomorrow / week\n\n"
         "Мини‑приложение:\n"
@@ -1368,6 +3238,11 @@ def _sub_keyboard(entry: dict | None) -> InlineKeyboardMarkup:
                 callback_data="sub_toggle:day_type"
             ),
         ])
+        profile = entry.get("profile")
+        rows.append([InlineKeyboardButton(
+            "👥 Суббота: " + _current_profile_labels().get(profile, "все профили"),
+            callback_data="sub_set_profile"
+        )])
     rows.append([InlineKeyboardButton("❌ Закрыть", callback_data="sub_close")])
     return InlineKeyboardMarkup(rows)
 
@@ -1382,6 +3257,9 @@ def _sub_text(entry: dict | None) -> str:
         t = entry.get("time", "—")
         dl = "завтра" if entry.get("day_type") == "tomorrow" else "сегодня"
         parts.append(f"📅 Ежедневно в {t} — расписание на {dl}")
+        labels = _current_profile_labels()
+        if entry.get("profile") in labels:
+            parts.append(f"👥 В субботу — только {labels[entry['profile']]}")
     if changes_on:
         parts.append("🔔 Уведомления при изменении расписания")
     return "Твои подписки:\n" + "\n".join(parts)
@@ -1456,29 +3334,35 @@ async def subscribe_manage_callback(update: Update, context: ContextTypes.DEFAUL
         entry["time"] = t
         entry["chat_id"] = chat.id
 
+    elif data == "sub_set_profile":
+        rows = [
+            [InlineKeyboardButton(label, callback_data=f"sub_profile:{key}")]
+            for key, label in _current_profiles()
+        ]
+        rows.append([InlineKeyboardButton("Все профили", callback_data="sub_profile:")])
+        rows.append([InlineKeyboardButton("↩️ Назад", callback_data="sub_back")])
+        await query.edit_message_text(
+            "Какой профиль показывать в субботнем напоминании?",
+            reply_markup=InlineKeyboardMarkup(rows),
+        )
+        return
+
+    elif data.startswith("sub_profile:"):
+        profile = data[len("sub_profile:"):]
+        if profile in _current_profile_labels():
+            entry["profile"] = profile
+        else:
+            entry.pop("profile", None)
+
     elif data == "sub_back":
         pass  # просто перерисуем экран
 
     # Если обе подписки выключены — удаляем запись
     if not entry.get("notify_daily") and not entry.get("notify_changes"):
         subscriptions.pop(uid, None)
-        if scheduler is not None:
-            try:
-                scheduler.remove_job(_job_id_for(user.id))
-            except Exception:
-                pass
     else:
         subscriptions[uid] = entry
-        if entry.get("notify_daily"):
-            _reschedule_user(user.id)
-        else:
-            if scheduler is not None:
-                try:
-                    scheduler.remove_job(_job_id_for(user.id))
-                except Exception:
-                    pass
-
-    _save_subscriptions_to_disk()
+    _publish(SubscriptionChanged(user.id, "telegram"))
     entry = subscriptions.get(uid)
     await query.edit_message_text(
         _sub_text(entry),
@@ -1497,12 +3381,7 @@ async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Не удалось определить пользователя.")
         return
     subscriptions.pop(str(user.id), None)
-    _save_subscriptions_to_disk()
-    if scheduler is not None:
-        try:
-            scheduler.remove_job(_job_id_for(user.id))
-        except Exception:
-            pass
+    _publish(SubscriptionChanged(user.id, "telegram"))
     await update.message.reply_text(
         "Все подписки отключены.\n"
         "Чтобы настроить заново — /subscribe"
@@ -1521,11 +3400,60 @@ async def chatid_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-async def open_app(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Команда /app — кнопка для открытия мини‑приложения."""
-    if not update.message:
+async def _set_update_tenant(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выполняется первым для каждого апдейта: класс чата (в inline — пользователя)
+    становится текущим для всех следующих обработчиков."""
+    chat = update.effective_chat
+    user = update.effective_user
+    key = chat.id if chat else (user.id if user else "")
+    _current_tenant.set(_user_tenant(key))
+
+
+async def class_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /class — выбор класса для чата: /class 10А, /class - (основной)."""
+    if not update.message or not update.effective_chat or not update.effective_user:
         return
-    _log_user(update, "open_app")
+    _log_user(update, "class")
+    if not _tenants:
+        await update.message.reply_text("Бот обслуживает один класс — выбирать не из чего.")
+        return
+    chat = update.effective_chat
+    query = " ".join(context.args or []).strip()
+    current = _user_tenant(chat.id)
+    if not query:
+        example = next(iter(_tenants.values()))["title"]
+        await update.message.reply_text(
+            f"Сейчас: {_tenant_title(current)}.\n"
+            f"Выбрать класс: /class <название>, например /class {example}\n"
+            "Вернуть основной: /class -"
+        )
+        return
+    tenant_id = "" if query == "-" else _find_tenant(query)
+    if tenant_id is None:
+        key = _tenant_key(query)
+        # Подсказки ищем перебором только при промахе точного поиска
+        matches = sorted({tid for k, tid in _tenant_lookup.items() if key in k})[:10]
+        if matches:
+            text = "Уточни класс:\n" + "\n".join(f"/class {_tenant_title(tid)}" for tid in matches)
+        else:
+            text = "Класс не найден."
+        await update.message.reply_text(text)
+        return
+    if chat.type != "private" and not (
+        _is_admin(update) or _is_tenant_admin(update.effective_user.id, tenant_id or current)
+    ):
+        await update.message.reply_text("Класс группы может сменить только администратор.")
+        return
+    _set_user_tenant(chat.id, tenant_id)
+    _current_tenant.set(tenant_id)
+    await update.message.reply_text(f"✅ Класс: {_tenant_title(tenant_id)}")
+
+
+async def open_app(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /app — кнопка для открытия мини‑приложения."""
+    if not update.message:
+        return
+    _log_user(update, "open_app")
     url = f"{BOT_URL.rstrip('/')}/webapp"
     # Inline‑кнопка: не занимает место внизу чата и не "прилипает"
     keyboard = InlineKeyboardMarkup(
@@ -1536,6 +3464,19 @@ async def open_app(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=keyboard,
     )
 
+async def calendar_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /calendar — ссылка на расписание для календаря телефона."""
+    if not update.message or not update.effective_chat:
+        return
+    _log_user(update, "calendar")
+    await update.message.reply_text(
+        "Добавь ссылку в календарь как подписку (iPhone: Настройки → Календарь → "
+        "Учётные записи → Новая → Другое → Подписной календарь; Google Календарь: "
+        "«Добавить по URL»). Расписание обновляется само, включая временные замены.\n\n"
+        + _ics_user_url(update.effective_chat.id),
+        disable_web_page_preview=True,
+    )
+
 # ================== Редактирование расписания (/edit_schedule) ==================
 EDIT_MODE, EDIT_CHOOSE_DAY, EDIT_CHOOSE_SATURDAY_PROFILE, EDIT_ENTER_DATE, EDIT_ENTER_LESSONS, EDIT_ENTER_WEEK, EDIT_CONFIRM, EDIT_ENTER_SAT_ALL = range(8)
 
@@ -1573,11 +3514,22 @@ def _saturday_profile_keyboard() -> InlineKeyboardMarkup:
     rows.append([InlineKeyboardButton("Отмена", callback_data="edit_cancel")])
     return InlineKeyboardMarkup(rows)
 
+
+_TENANT_EDIT_HINT = (
+    "Этот чат привязан к классу — /edit_schedule меняет только основное расписание. "
+    "Расписание класса редактируется в WebApp (админка класса, /api/admin/tenant_week)."
+)
+
+
 async def edit_schedule_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     _log_user(update, "edit_schedule_start")
     if not _is_admin(update):
         await update.message.reply_text("У вас нет прав на редактирование расписания.")
         return ConversationHandler.END
+    if _current_tenant.get():
+        # Диалог правит основное расписание; у класса — своё, через WebApp
+        await update.message.reply_text(_TENANT_EDIT_HINT)
+        return ConversationHandler.END
 
     context.user_data.clear()
 
@@ -1873,19 +3825,20 @@ async def edit_schedule_saturday_profile_chosen(update: Update, context: Context
     )
     return EDIT_ENTER_LESSONS
 
+_TIME_DOT_RE = re.compile(r'(?<!\d)(\d{1,2})[.](\d{2})(?!\d)')
+_LESSON_LINE_RE = re.compile(r'^(\d{1,2}):(\d{2})\s*[-–]\s*(\d{1,2}):(\d{2})\s+(.+)$')
+
+
 def _normalize_lesson_line(line: str) -> str:
     """Нормализует строку урока: точки в времени → двоеточие, обрезает название до 16 символов."""
-    import re as _re
     line = line.strip()
     # 08.30-09.05 или 08.30–09.05 → 08:30-09:05
-    def fix_time(m):
-        return m.group(1) + ':' + m.group(2)
-    line = _re.sub(r'(?<!\d)(\d{1,2})[.](\d{2})(?!\d)', fix_time, line)
+    line = _TIME_DOT_RE.sub(r'\1:\2', line)
     # Обрезаем название предмета до 16 символов (часть до кабинета)
-    m = _re.match(r'^(\d{1,2}:\d{2})\s*[-–]\s*(\d{1,2}:\d{2})\s+(.+)$', line)
+    m = _LESSON_LINE_RE.match(line)
     if m:
-        time_part = f"{m.group(1)}-{m.group(2)}"
-        rest = m.group(3)
+        time_part = f"{m.group(1)}:{m.group(2)}-{m.group(3)}:{m.group(4)}"
+        rest = m.group(5)
         if '/' in rest:
             subj, room = rest.split('/', 1)
             subj = subj.strip()
@@ -1906,109 +3859,139 @@ def _parse_lessons_from_text(text: str) -> list[str] | None:
         return []
     return [_normalize_lesson_line(line) for line in text.splitlines() if line.strip()]
 
-def _parse_saturday_all_profiles(text: str) -> dict[str, list[str]] | None:
-    """Парсит текст вида:
-    Суббота Физмат:
-    08:30-09:05 Алгебра/211
-    ...
-    Суббота Инфотех 2 группа:
-    08:30-09:05 Алгоритмика/304
-    ...
-    Возвращает {profile_key: [уроки]} или None если не распознано ни одного профиля.
-    """
-    lines = (text or "").splitlines()
-    result: dict[str, list[str]] = {}
-    current_key: str | None = None
 
-    for raw in lines:
-        line = raw.strip()
-        if not line:
-            continue
-
-        # Попытка распознать заголовок профиля: "Суббота <метка>:"
-        matched_key: str | None = None
-        if line.lower().startswith("суббота") and line.endswith(":"):
-            rest = line[7:].strip().rstrip(":").strip()  # всё после "суббота"
-            rest_lower = rest.lower()
-            # Сначала ищем по label
-            for key, label in SATURDAY_PROFILE_LABELS.items():
-                if rest_lower == label.lower():
-                    matched_key = key
-                    break
-            # Потом по ключу напрямую
-            if matched_key is None:
-                for key in SATURDAY_PROFILE_KEYS:
-                    if rest_lower == key.lower():
-                        matched_key = key
-                        break
-
-        if matched_key is not None:
-            current_key = matched_key
-            if current_key not in result:
-                result[current_key] = []
-            continue
+# ── Разбор текста недели ──
+# Один проход по строкам: заголовок — текст до первого ':' (без учёта регистра
+# и лишних пробелов), который ищется в словаре заголовков; остальные строки —
+# уроки текущего дня / профиля. Кроме результата парсер возвращает диагностику
+# с номерами строк: {"line", "level": "error" | "warning", "message"}.
+# ProfileSet → словарь заголовков (у каждого класса свой набор профилей)
+_header_lookup_cache: dict[int, tuple[ProfileSet, dict[str, tuple[str, str | None]]]] = {}
+
+
+def _schedule_headers(profile_set: ProfileSet | None = None) -> dict[str, tuple[str, str | None]]:
+    """Словарь «заголовок в нижнем регистре» → (день, ключ профиля или None).
+    Заголовки профилей — «<день> <ключ или подпись>» для каждого дня профиля."""
+    profile_set = profile_set or _profile_set
+    cached = _header_lookup_cache.get(id(profile_set))
+    if cached is not None and cached[0] is profile_set:
+        return cached[1]
+    lookup: dict[str, tuple[str, str | None]] = {d.lower(): (d, None) for d in SCHEDULE_DAYS}
+    for p in profile_set.items:
+        for day in p["days"]:
+            lookup[f"{day.lower()} {p['key'].lower()}"] = (day, p["key"])
+            lookup[f"{day.lower()} {p['label'].lower()}"] = (day, p["key"])
+    if len(_header_lookup_cache) > 256:
+        _header_lookup_cache.clear()
+    _header_lookup_cache[id(profile_set)] = (profile_set, lookup)
+    return lookup
+
+
+def _check_lesson_line(line: str) -> str | None:
+    """Проверяет строку урока; возвращает описание проблемы или None."""
+    m = _LESSON_LINE_RE.match(_TIME_DOT_RE.sub(r'\1:\2', line))
+    if not m:
+        return "не распознано время урока (ожидается ЧЧ:ММ-ЧЧ:ММ Предмет/каб.)"
+    h1, m1, h2, m2 = (int(m.group(i)) for i in range(1, 5))
+    if h1 > 23 or h2 > 23 or m1 > 59 or m2 > 59:
+        return "недопустимое время"
+    if h2 * 60 + m2 <= h1 * 60 + m1:
+        return "урок заканчивается раньше, чем начинается"
+    return None
 
-        if current_key is not None:
-            result[current_key].append(line)
 
-    return result if result else None
-
-def _parse_week_from_text(text: str) -> dict[str, list[str] | dict[str, list[str]]] | None:
-    lines = (text or "").splitlines()
-    current_day: str | None = None
-    current_saturday_profile: str | None = None
-    result: dict[str, list[str] | dict[str, list[str]]] = {d: [] for d in SCHEDULE_DAYS}
+def _parse_schedule_text(text: str, saturday_only: bool = False,
+                         profile_set: ProfileSet | None = None):
+    """Разбирает текст недели (или всех профилей субботы при saturday_only).
+    profile_set — профили класса (по умолчанию основного).
+    Возвращает (результат или None, диагностика)."""
+    profile_set = profile_set or _profile_set
+    headers = _schedule_headers(profile_set)
+    diagnostics: list[dict] = []
+    result: dict[str, list[str] | dict[str, list[str]]] = {} if saturday_only else {d: [] for d in SCHEDULE_DAYS}
+    target: list[str] | None = None
+    seen: set = set()
     has_any = False
 
-    for raw in lines:
+    def diag(lineno: int, level: str, message: str) -> None:
+        diagnostics.append({"line": lineno, "level": level, "message": message})
+
+    for lineno, raw in enumerate((text or "").splitlines(), 1):
         line = raw.strip()
         if not line:
             continue
 
-        if line.lower().startswith("суббота ") and ":" in line:
-            prefix, _ = line.split(":", 1)
-            rest = prefix[8:].strip().lower()
-            matched_key = None
-            for key, label in SATURDAY_PROFILE_LABELS.items():
-                if rest == label.lower():
-                    matched_key = key
-                    break
-            if matched_key is not None:
-                has_any = True
-                current_day = "Суббота"
-                current_saturday_profile = matched_key
-                if not isinstance(result["Суббота"], dict):
-                    result["Суббота"] = {}
-                result["Суббота"][matched_key] = []
+        head, colon, _ = line.partition(":")
+        hit = headers.get(" ".join(head.split()).lower()) if colon else None
+        if hit is not None:
+            day, profile = hit
+            if saturday_only and (profile is None or day != "Суббота"):
+                diag(lineno, "error", "ожидается заголовок «Суббота <профиль>:»")
+                target = None
                 continue
-
-        matched_day = None
-        for d in SCHEDULE_DAYS:
-            if line.lower() == (d.lower() + ":") or line.lower().startswith(d.lower() + ":"):
-                matched_day = d
-                break
-        if matched_day is not None:
             has_any = True
-            current_day = matched_day
-            current_saturday_profile = None
-            if matched_day == "Суббота" and isinstance(result["Суббота"], dict):
-                result["Суббота"] = []
+            if (day, profile) in seen:
+                replaced = profile is not None and not saturday_only
+                diag(lineno, "warning", f"{head.strip()} указан повторно — "
+                     + ("предыдущие уроки заменены" if replaced else "уроки добавлены к предыдущим"))
+            seen.add((day, profile))
+            if saturday_only:
+                target = result.setdefault(profile, [])
+            elif profile is not None:
+                if not isinstance(result[day], dict):
+                    result[day] = {}
+                target = result[day][profile] = []
+            else:
+                if isinstance(result[day], dict):
+                    result[day] = []
+                target = result[day]
             continue
 
-        if current_day is None:
+        first_word = head.split(maxsplit=1)[0].capitalize() if colon and head.strip() else ""
+        if first_word in profile_set.days:
+            diag(lineno, "error", f"неизвестный профиль ({first_word.lower()}): "
+                 f"{head.strip()[len(first_word):].strip() or '—'}")
+            target = None
+            continue
+        if line.endswith(":") and not _LESSON_LINE_RE.match(line):
+            diag(lineno, "warning", f"похоже на заголовок, но день не распознан: {line}")
             continue
+        if target is None:
+            diag(lineno, "warning", "строка вне дня — пропущена")
+            continue
+        problem = _check_lesson_line(line)
+        if problem:
+            diag(lineno, "warning", problem)
+        target.append(line)
 
-        if current_day == "Суббота" and current_saturday_profile is not None:
-            if isinstance(result["Суббота"], dict) and current_saturday_profile in result["Суббота"]:
-                result["Суббота"][current_saturday_profile].append(line)
-        elif current_day == "Суббота" and isinstance(result["Суббота"], list):
-            result["Суббота"].append(line)
-        elif isinstance(result.get(current_day), list):
-            result[current_day].append(line)
+    return (result if has_any else None), diagnostics
 
-    if not has_any:
-        return None
-    return result
+
+def _parse_saturday_all_profiles(text: str) -> dict[str, list[str]] | None:
+    """Парсит текст вида:
+    Суббота Физмат:
+    08:30-09:05 Алгебра/211
+    ...
+    Суббота Инфотех 2 группа:
+    08:30-09:05 Алгоритмика/304
+    ...
+    Возвращает {profile_key: [уроки]} или None если не распознано ни одного профиля.
+    """
+    return _parse_schedule_text(text, saturday_only=True)[0]
+
+def _parse_week_from_text(text: str) -> dict[str, list[str] | dict[str, list[str]]] | None:
+    return _parse_schedule_text(text)[0]
+
+
+def _format_diagnostics(diagnostics: list[dict], limit: int = 10) -> str:
+    """Текст диагностики для сообщения в Telegram."""
+    lines = [
+        f"{'❌' if d['level'] == 'error' else '⚠️'} строка {d['line']}: {d['message']}"
+        for d in diagnostics[:limit]
+    ]
+    if len(diagnostics) > limit:
+        lines.append(f"… и ещё {len(diagnostics) - limit}")
+    return "\n".join(lines)
 
 async def edit_schedule_lessons_entered(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _is_admin(update):
@@ -2118,7 +4101,7 @@ async def edit_schedule_week_entered(update: Update, context: ContextTypes.DEFAU
         await update.message.reply_text("Сессия редактирования потеряна. Запусти заново: /edit_schedule")
         return ConversationHandler.END
 
-    week = _parse_week_from_text(update.message.text or "")
+    week, diagnostics = _parse_schedule_text(update.message.text or "")
     if week is None:
         await update.message.reply_text(
             "Не удалось распознать дни недели.\n"
@@ -2140,6 +4123,8 @@ async def edit_schedule_week_entered(update: Update, context: ContextTypes.DEFAU
         block.extend(lessons)
         blocks.append("\n".join(block))
     preview = "\n\n".join(blocks) if blocks else "— все дни пустые —"
+    if diagnostics:
+        preview += "\n\nЗамечания:\n" + _format_diagnostics(diagnostics)
 
     keyboard = InlineKeyboardMarkup(
         [
@@ -2150,8 +4135,7 @@ async def edit_schedule_week_entered(update: Update, context: ContextTypes.DEFAU
         ]
     )
     await update.message.reply_text(
-        "Проверь расписание на неделю:\n\n"
-        f"{preview}",
+        _truncate_message("Проверь расписание на неделю:\n\n" f"{preview}"),
         reply_markup=keyboard,
     )
     return EDIT_CONFIRM
@@ -2163,6 +4147,10 @@ async def edit_schedule_confirm(update: Update, context: ContextTypes.DEFAULT_TY
     if not _is_admin(update):
         await query.edit_message_text("У вас нет прав на редактирование расписания.")
         return ConversationHandler.END
+    if _current_tenant.get():
+        await query.edit_message_text(_TENANT_EDIT_HINT)
+        return ConversationHandler.END
+    _current_actor.set(query.from_user.id)
 
     data = query.data or ""
     if data == "edit_cancel":
@@ -2184,41 +4172,27 @@ async def edit_schedule_confirm(update: Update, context: ContextTypes.DEFAULT_TY
             if not edit_date:
                 await query.edit_message_text("Сессия редактирования потеряна. Запусти заново: /edit_schedule")
                 return ConversationHandler.END
-            existing = temp_schedule.get(edit_date)
-            if not isinstance(existing, dict):
-                existing = {}
-            existing.update(sat_all)
-            temp_schedule[edit_date] = existing
+            old = _snapshot
             try:
-                _save_temp_schedule_to_disk()
+                _set_temp_saturday_profiles(edit_date, sat_all, source="telegram")
             except Exception as e:
                 await query.edit_message_text(f"Не удалось сохранить: {e}")
                 return ConversationHandler.END
             date_label = context.user_data.get("edit_label") or edit_date
             labels_str = ", ".join(SATURDAY_PROFILE_LABELS.get(k, k) for k in sat_all)
-            notify_parts = [
-                _format_day_table_html(f"Суббота — {SATURDAY_PROFILE_LABELS.get(k, k)}", v)
-                for k, v in sat_all.items()
-            ]
-            msg = _truncate_message(f"📢 Временное расписание субботы обновлено ({date_label}):\n\n" + "\n\n".join(notify_parts))
-            asyncio.create_task(_notify_subscribers(msg))
+            _queue_diff_notice(f"temp:{edit_date}:*", "📢 Временное расписание обновлено:", old, [edit_date],
+                               [f"temp:{edit_date}:{k}" for k in sat_all])
             await query.edit_message_text(f"Готово! Обновлены профили для {date_label}: {labels_str}.")
         else:
-            if not isinstance(schedule.get("Суббота"), dict):
-                schedule["Суббота"] = {}
-            schedule["Суббота"].update(sat_all)
+            old = _snapshot
             try:
-                _save_schedule_to_disk()
+                _set_base_saturday_profiles(sat_all, source="telegram")
             except Exception as e:
                 await query.edit_message_text(f"Не удалось сохранить: {e}")
                 return ConversationHandler.END
             labels_str = ", ".join(SATURDAY_PROFILE_LABELS.get(k, k) for k in sat_all)
-            notify_parts = [
-                _format_day_table_html(f"Суббота — {SATURDAY_PROFILE_LABELS.get(k, k)}", v)
-                for k, v in sat_all.items()
-            ]
-            msg = _truncate_message("📢 Обновлено расписание субботы:\n\n" + "\n\n".join(notify_parts))
-            asyncio.create_task(_notify_subscribers(msg))
+            _queue_diff_notice("base:Суббота:*", "📢 Обновлено расписание:", old, ["Суббота"],
+                               [f"base:Суббота:{k}" for k in sat_all])
             await query.edit_message_text(f"Готово! Обновлены профили субботы: {labels_str}.")
         return ConversationHandler.END
 
@@ -2228,23 +4202,16 @@ async def edit_schedule_confirm(update: Update, context: ContextTypes.DEFAULT_TY
             await query.edit_message_text("Сессия редактирования потеряна. Запусти заново: /edit_schedule")
             return ConversationHandler.END
 
-        for d in SCHEDULE_DAYS:
-            if d in week:
-                schedule[d] = week[d]
-
+        old = _snapshot
         try:
-            _save_schedule_to_disk()
+            _set_base_days({d: week[d] for d in SCHEDULE_DAYS if d in week}, source="telegram")
         except Exception as e:
             await query.edit_message_text(f"Не удалось сохранить расписание: {e}")
             return ConversationHandler.END
 
-        week_text = "\n\n".join(
-            _format_day_table_html(d, schedule.get(d, []))
-            for d in SCHEDULE_DAYS
-            if d in schedule
-        ) or _format_day_table_html("Неделя", [])
-        week_text = _truncate_message("📢 Обновлено расписание на неделю:\n\n" + week_text)
-        asyncio.create_task(_notify_subscribers(week_text))
+        _queue_diff_notice("base:week", "📢 Обновлено расписание на неделю:", old,
+                           [d for d in SCHEDULE_DAYS if d in week],
+                           [f"base:{d}:" if d == "Суббота" else f"base:{d}" for d in week])
 
         await query.edit_message_text("Готово! Расписание на неделю обновлено.")
         return ConversationHandler.END
@@ -2262,29 +4229,26 @@ async def edit_schedule_confirm(update: Update, context: ContextTypes.DEFAULT_TY
 
         profile_key = context.user_data.get("edit_saturday_profile")
         if profile_key and profile_key in SATURDAY_PROFILE_KEYS:
-            # Суббота по профилям — сохраняем как dict, не затирая другие профили
-            existing = temp_schedule.get(edit_date)
-            if not isinstance(existing, dict):
-                existing = {}
-            existing[profile_key] = lessons
-            temp_schedule[edit_date] = existing
             profile_label = SATURDAY_PROFILE_LABELS.get(profile_key, profile_key)
             date_label = context.user_data.get("edit_label") or edit_date
             display_label = f"{date_label} — {profile_label}"
-            notify_label = f"Суббота — {profile_label}"
+            notice_key = f"temp:{edit_date}:{profile_key}"
         else:
-            temp_schedule[edit_date] = lessons
             display_label = context.user_data.get("edit_label") or edit_date
-            notify_label = display_label
+            notice_key = f"temp:{edit_date}"
 
+        old = _snapshot
         try:
-            _save_temp_schedule_to_disk()
+            if profile_key and profile_key in SATURDAY_PROFILE_KEYS:
+                # Суббота по профилям — сохраняем как dict, не затирая другие профили
+                _set_temp_saturday_profiles(edit_date, {profile_key: lessons}, source="telegram")
+            else:
+                _set_temp_days({edit_date: lessons}, source="telegram")
         except Exception as e:
             await query.edit_message_text(f"Не удалось сохранить временное расписание: {e}")
             return ConversationHandler.END
 
-        msg = "📢 Временное расписание обновлено:\n\n" + _format_day_table_html(notify_label, lessons)
-        asyncio.create_task(_notify_subscribers(msg))
+        _queue_diff_notice(notice_key, "📢 Временное расписание обновлено:", old, [edit_date])
 
         await query.edit_message_text(f"Готово! Временное расписание для «{display_label}» обновлено.")
         return ConversationHandler.END
@@ -2298,22 +4262,22 @@ async def edit_schedule_confirm(update: Update, context: ContextTypes.DEFAULT_TY
         if not profile_key or profile_key not in SATURDAY_PROFILE_KEYS:
             await query.edit_message_text("Сессия редактирования потеряна. Запусти заново: /edit_schedule")
             return ConversationHandler.END
-        if not isinstance(schedule.get("Суббота"), dict):
-            schedule["Суббота"] = {}
-        schedule["Суббота"][profile_key] = lessons
         label = SATURDAY_PROFILE_LABELS.get(profile_key, profile_key)
     else:
-        schedule[day] = lessons
         label = day
 
+    old = _snapshot
     try:
-        _save_schedule_to_disk()
+        if day == "Суббота":
+            _set_base_saturday_profiles({profile_key: lessons}, source="telegram")
+        else:
+            _set_base_days({day: lessons}, source="telegram")
     except Exception as e:
         await query.edit_message_text(f"Не удалось сохранить расписание: {e}")
         return ConversationHandler.END
 
-    msg = "📢 Обновлено расписание:\n\n" + _format_day_table_html(f"Суббота — {label}" if day == "Суббота" else day, lessons)
-    asyncio.create_task(_notify_subscribers(msg))
+    _queue_diff_notice(f"base:Суббота:{profile_key}" if day == "Суббота" else f"base:{day}",
+                       "📢 Обновлено расписание:", old, [day])
 
     await query.edit_message_text(f"Готово! Расписание для «{label}» обновлено.")
     return ConversationHandler.END
@@ -2324,13 +4288,14 @@ async def edit_schedule_sat_all_entered(update: Update, context: ContextTypes.DE
         await update.message.reply_text("У вас нет прав на редактирование расписания.")
         return ConversationHandler.END
 
-    profiles = _parse_saturday_all_profiles(update.message.text or "")
+    profiles, diagnostics = _parse_schedule_text(update.message.text or "", saturday_only=True)
     if not profiles:
+        hint = ("\n\n" + _format_diagnostics(diagnostics)) if diagnostics else ""
         await update.message.reply_text(
             "Не удалось распознать профили.\n"
             "Используй формат:\n"
             "Суббота Физмат:\n08:30-09:05 Алгебра/211\n...\n\n"
-            "Суббота Инфотех 2 группа:\n08:30-09:05 Алгоритмика/304\n..."
+            "Суббота Инфотех 2 группа:\n08:30-09:05 Алгоритмика/304\n..." + hint
         )
         return EDIT_ENTER_SAT_ALL
 
@@ -2343,13 +4308,15 @@ async def edit_schedule_sat_all_entered(update: Update, context: ContextTypes.DE
         lessons_text = "\n".join(lessons) if lessons else "— (пусто) —"
         blocks.append(f"<b>Суббота — {html.escape(label)}</b>\n{html.escape(lessons_text)}")
     preview = "\n\n".join(blocks)
+    if diagnostics:
+        preview += "\n\nЗамечания:\n" + html.escape(_format_diagnostics(diagnostics))
 
     keyboard = InlineKeyboardMarkup([[
         InlineKeyboardButton("✅ Сохранить", callback_data="edit_confirm"),
         InlineKeyboardButton("❌ Отмена", callback_data="edit_cancel"),
     ]])
     await update.message.reply_text(
-        f"Проверь расписание субботы:\n\n{preview}",
+        _truncate_message(f"Проверь расписание субботы:\n\n{preview}"),
         reply_markup=keyboard,
         parse_mode="HTML",
     )
@@ -2360,15 +4327,285 @@ async def edit_schedule_cancel(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("Ок, отменил.")
     return ConversationHandler.END
 
+# ================== Профилирование ==================
+# Семплирующий профилировщик для разбора утренних пиков задержки.
+# Включается админом на N секунд (/api/admin/profile_start) или переменной
+# PROFILE_ON_START=<секунды> на время холодного старта. Пока он выключен,
+# потока нет и накладных расходов нет. Результат — collapsed stacks
+# (формат flamegraph.pl / speedscope), скачивается через /api/admin/profile_download.
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS") or 5)
+PROFILE_ON_START = float(os.environ.get("PROFILE_ON_START") or 0)
+PROFILE_MAX_SECONDS = 600
+_PROFILE_MAX_STACKS = 20000   # защита от неограниченного роста памяти
+_PROFILE_MAX_DEPTH = 64
+
+_profile_stacks: dict[str, int] = {}
+_profile_state: dict = {
+    "running": False,
+    "started_at": None,
+    "finished_at": None,
+    "seconds": 0,
+    "samples": 0,
+    "idle_samples": 0,
+}
+_profile_stop = threading.Event()
+_profile_thread: threading.Thread | None = None
+
+# Верхние кадры, означающие что поток просто ждёт (event loop без работы, пул потоков)
+_PROFILE_IDLE_FRAMES = {"select", "poll", "epoll", "_worker", "wait", "sleep"}
+
+
+def _profile_frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _profile_sample_once(own_ident: int) -> None:
+    names = {t.ident: t.name for t in threading.enumerate()}
+    for ident, frame in sys._current_frames().items():
+        if ident == own_ident:
+            continue
+        if frame.f_code.co_name in _PROFILE_IDLE_FRAMES:
+            _profile_state["idle_samples"] += 1
+            continue
+        parts: list[str] = []
+        while frame is not None and len(parts) < _PROFILE_MAX_DEPTH:
+            parts.append(_profile_frame_label(frame))
+            frame = frame.f_back
+        parts.append(names.get(ident, str(ident)))
+        key = ";".join(reversed(parts))
+        if key in _profile_stacks or len(_profile_stacks) < _PROFILE_MAX_STACKS:
+            _profile_stacks[key] = _profile_stacks.get(key, 0) + 1
+        _profile_state["samples"] += 1
+
+
+def _profile_loop(seconds: float) -> None:
+    own_ident = threading.get_ident()
+    interval = max(PROFILE_INTERVAL_MS, 1.0) / 1000.0
+    deadline = time.monotonic() + seconds
+    while not _profile_stop.is_set() and time.monotonic() < deadline:
+        try:
+            _profile_sample_once(own_ident)
+        except Exception as e:
+            logger.error(f"profiler sample error: {e}")
+        _profile_stop.wait(interval)
+    _profile_state["running"] = False
+    _profile_state["finished_at"] = datetime.now(tz=_get_tz()).isoformat(timespec="seconds")
+    logger.info(f"🔬 Профилирование завершено: {_profile_state['samples']} семплов")
+
+
+def _profile_start(seconds: float) -> bool:
+    """Запускает профилирование на seconds секунд. False — если уже идёт."""
+    global _profile_thread
+    if _profile_state["running"]:
+        return False
+    seconds = max(1.0, min(float(seconds), PROFILE_MAX_SECONDS))
+    _profile_stacks.clear()
+    _profile_stop.clear()
+    _profile_state.update(
+        running=True,
+        started_at=datetime.now(tz=_get_tz()).isoformat(timespec="seconds"),
+        finished_at=None,
+        seconds=seconds,
+        samples=0,
+        idle_samples=0,
+    )
+    _profile_thread = threading.Thread(
+        target=_profile_loop, args=(seconds,), name="profiler", daemon=True
+    )
+    _profile_thread.start()
+    logger.info(f"🔬 Профилирование запущено на {seconds:.0f} с (шаг {PROFILE_INTERVAL_MS} мс)")
+    return True
+
+
+def _profile_stop_now() -> None:
+    _profile_stop.set()
+
+
+def _profile_collapsed() -> str:
+    """Collapsed stacks: «поток;кадр;кадр N» — по строке на уникальный стек."""
+    lines = [f"{stack} {count}" for stack, count in
+             sorted(_profile_stacks.items(), key=lambda kv: kv[1], reverse=True)]
+    return "\n".join(lines) + ("\n" if lines else "")
+
+
+# ================== Исходящие HTTP-запросы ==================
+# Все исходящие соединения настраиваются здесь:
+#   • Telegram Bot API — HTTPXRequest PTB с пулом TELEGRAM_POOL_SIZE
+#     соединений: на напоминаниях в 07:00 сотни send_message идут разом, и
+#     запрос не должен ждать соединения дольше TELEGRAM_POOL_TIMEOUT;
+#   • прочие запросы бота (самопинг и т. п.) — один общий httpx.AsyncClient
+#     (_http_client) с keep-alive, а не клиент на каждый вызов;
+#   • Google Sheets — requests-сессия gspread с пулом SHEETS_POOL_SIZE
+#     соединений keep-alive (запросы идут из потоков asyncio.to_thread).
+# HTTP/2 включается, если установлен пакет h2 (pip install httpx[http2]);
+# HTTP_HTTP2=0 — принудительно HTTP/1.1.
+# Загрузку пулов видно в /api/admin/http_stats: запросы в полёте, пик, ожидание
+# свободного соединения, открытые соединения.
+TELEGRAM_POOL_SIZE = int(os.environ.get("TELEGRAM_POOL_SIZE") or 64)
+TELEGRAM_POOL_TIMEOUT = float(os.environ.get("TELEGRAM_POOL_TIMEOUT") or 5.0)
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE") or 16)
+SHEETS_POOL_SIZE = int(os.environ.get("SHEETS_POOL_SIZE") or 4)
+
+
+def _http2_available() -> bool:
+    if (os.environ.get("HTTP_HTTP2") or "1").strip().lower() in ("0", "false", "no"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+HTTP2 = _http2_available()
+
+# имя пула → счётчики; inflight/peak — одновременные запросы
+_http_stats: dict[str, dict] = {}
+
+
+def _http_pool_stats(name: str) -> dict:
+    stats = _http_stats.get(name)
+    if stats is None:
+        stats = _http_stats[name] = {
+            "requests": 0, "errors": 0, "pool_timeouts": 0,
+            "inflight": 0, "peak_inflight": 0, "total_ms": 0.0,
+        }
+    return stats
+
+
+@contextlib.asynccontextmanager
+async def _http_track(name: str):
+    """Учитывает один исходящий запрос в статистике пула name."""
+    stats = _http_pool_stats(name)
+    stats["requests"] += 1
+    stats["inflight"] += 1
+    stats["peak_inflight"] = max(stats["peak_inflight"], stats["inflight"])
+    t = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        stats["errors"] += 1
+        # PTB оборачивает httpx.PoolTimeout в TimedOut("Pool timeout: ...")
+        if isinstance(e, httpx.PoolTimeout) or str(e).startswith("Pool timeout"):
+            stats["pool_timeouts"] += 1
+        raise
+    finally:
+        stats["inflight"] -= 1
+        stats["total_ms"] += (time.perf_counter() - t) * 1000
+
+
+def _httpx_open_connections(client: "httpx.AsyncClient | None") -> int | None:
+    """Открытые соединения пула httpx (внутренности httpcore — если доступны)."""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    return len(connections) if connections is not None else None
+
+
+class _TrackedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest PTB со статистикой в _http_stats["telegram"]."""
+
+    async def do_request(self, *args, **kwargs):
+        async with _http_track("telegram"):
+            return await super().do_request(*args, **kwargs)
+
+
+_http_shared: "httpx.AsyncClient | None" = None
+
+
+def _http_client() -> httpx.AsyncClient:
+    """Общий httpx-клиент для исходящих запросов бота (создаётся при первом вызове)."""
+    global _http_shared
+    if _http_shared is None or _http_shared.is_closed:
+        _http_shared = httpx.AsyncClient(
+            timeout=10.0,
+            http2=HTTP2,
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_SIZE,
+                max_keepalive_connections=HTTP_POOL_SIZE,
+                keepalive_expiry=60.0,
+            ),
+        )
+    return _http_shared
+
+
+async def _http_get(url: str, **kwargs) -> httpx.Response:
+    async with _http_track("shared"):
+        return await _http_client().get(url, **kwargs)
+
+
+async def _http_close() -> None:
+    global _http_shared
+    if _http_shared is not None:
+        await _http_shared.aclose()
+        _http_shared = None
+
+
+def _gs_tune_session(client) -> None:
+    """Пул keep-alive соединений для requests-сессии gspread (5.x: client.session,
+    6.x: client.http_client.session)."""
+    session = getattr(getattr(client, "http_client", None), "session", None) or getattr(client, "session", None)
+    if session is None:
+        return
+    from requests.adapters import HTTPAdapter
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=SHEETS_POOL_SIZE))
+
+
+def _gs_pool_stats() -> dict | None:
+    session = getattr(getattr(_gs_client, "http_client", None), "session", None) or getattr(_gs_client, "session", None)
+    adapter = session.adapters.get("https://") if session is not None else None
+    manager = getattr(adapter, "poolmanager", None)
+    if manager is None:
+        return None
+    pools = [manager.pools[key] for key in list(manager.pools.keys())]
+    return {
+        "pool_size": SHEETS_POOL_SIZE,
+        "hosts": len(pools),
+        "connections_opened": sum(p.num_connections for p in pools),
+        "requests": sum(p.num_requests for p in pools),
+        "idle": sum(p.pool.qsize() for p in pools if p.pool is not None),
+        "quota_used": {"read": _gs_used("read"), "write": _gs_used("write")},
+    }
+
+
+def _http_stats_snapshot() -> dict:
+    pools = {}
+    for name, stats in _http_stats.items():
+        pools[name] = {**stats, "total_ms": round(stats["total_ms"], 1)}
+    telegram = pools.setdefault("telegram", dict(_http_pool_stats("telegram")))
+    telegram["pool_size"] = TELEGRAM_POOL_SIZE
+    telegram["open_connections"] = _httpx_open_connections(getattr(_bot_request, "_client", None))
+    shared = pools.setdefault("shared", dict(_http_pool_stats("shared")))
+    shared["pool_size"] = HTTP_POOL_SIZE
+    shared["open_connections"] = _httpx_open_connections(_http_shared)
+    sheets = _gs_pool_stats()
+    if sheets is not None:
+        pools["sheets"] = sheets
+    return {"http2": HTTP2, "pools": pools}
+
+
+_bot_request = _TrackedHTTPXRequest(
+    connection_pool_size=TELEGRAM_POOL_SIZE,
+    pool_timeout=TELEGRAM_POOL_TIMEOUT,
+    http_version="2" if HTTP2 else "1.1",
+)
+
+
 # ================== FastAPI ==================
 app = FastAPI()
-bot_app = ApplicationBuilder().token(TOKEN).build()
+_bot_builder = ApplicationBuilder().token(TOKEN).request(_bot_request)
+if TELEGRAM_API_URL:
+    _bot_builder = _bot_builder.base_url(TELEGRAM_API_URL.rstrip("/") + "/bot")
+bot_app = _bot_builder.build()
+bot_app.add_handler(TypeHandler(Update, _set_update_tenant), group=-1)
 bot_app.add_handler(CommandHandler("start", start))
 bot_app.add_handler(CommandHandler("help", help_command))
 bot_app.add_handler(CommandHandler("app", open_app))
 bot_app.add_handler(CommandHandler("subscribe", subscribe))
 bot_app.add_handler(CommandHandler("unsubscribe", unsubscribe))
 bot_app.add_handler(CommandHandler("chatid", chatid_command))
+bot_app.add_handler(CommandHandler("class", class_command))
+bot_app.add_handler(CommandHandler("calendar", calendar_command))
 bot_app.add_handler(CallbackQueryHandler(subscribe_manage_callback, pattern=r"^sub_"))
 
 edit_conv = ConversationHandler(
@@ -2402,6 +4639,12 @@ bot_app.add_handler(InlineQueryHandler(inline_schedule))
 # ================== Webhook endpoint ==================
 @app.post(WEBHOOK_PATH)
 async def telegram_webhook(request: Request):
+    # При быстром старте первый webhook может прийти раньше bot_app.initialize()
+    if not _bot_ready.is_set():
+        try:
+            await asyncio.wait_for(_bot_ready.wait(), timeout=_BOT_READY_TIMEOUT)
+        except asyncio.TimeoutError:
+            return JSONResponse({"ok": False, "error": "not_ready"}, status_code=503)
     data = await request.json()
     update = Update.de_json(data, bot_app.bot)
     await bot_app.process_update(update)
@@ -2591,23 +4834,24 @@ def _alice_day_text(day_type: str = "today") -> tuple[str, str]:
     day_eng = target_date.strftime("%A")
     day_ru = DAY_MAP.get(day_eng, day_eng)
 
-    if day_ru == "Суббота":
+    if _date_has_profiles(target_date):
+        day_word = day_ru.lower()
         profiles = _get_saturday_profiles_for_date(target_date)
         active = [(label, lessons) for label, lessons in profiles if lessons]
         if not active:
-            msg = f"{prefix}, суббота\nЗанятий нет"
-            return msg, f"{prefix} суббота. Занятий нет."
+            msg = f"{prefix}, {day_word}\nЗанятий нет"
+            return msg, f"{prefix} {day_word}. Занятий нет."
         if len(active) == 1:
             # Только один профиль — показываем сразу
             label, lessons = active[0]
-            text_out = f"{prefix}, суббота — {label}\n{_alice_format_screen(lessons)}"
-            tts_out  = f"{prefix} суббота. {_alice_format_tts(lessons)}"
+            text_out = f"{prefix}, {day_word} — {label}\n{_alice_format_screen(lessons)}"
+            tts_out  = f"{prefix} {day_word}. {_alice_format_tts(lessons)}"
             return text_out, tts_out
         # Несколько профилей — показываем список и кнопки
         labels_list      = ", ".join(label for label, _ in active)
         labels_list_tts  = ", ".join(_alice_profile_tts(label) for label, _ in active)
-        text_out = f"{prefix}, суббота.\nПрофили: {labels_list}.\nВыбери профиль или скажи его название."
-        tts_out  = f"{prefix} суббота. Доступны профили: {labels_list_tts}. Назови нужный профиль."
+        text_out = f"{prefix}, {day_word}.\nПрофили: {labels_list}.\nВыбери профиль или скажи его название."
+        tts_out  = f"{prefix} {day_word}. Доступны профили: {labels_list_tts}. Назови нужный профиль."
         return text_out, tts_out
 
     _, lessons = _get_lessons_for_date(target_date)
@@ -2622,7 +4866,7 @@ def _alice_day_text(day_type: str = "today") -> tuple[str, str]:
 
 _ALICE_HELP_TEXT = (
     "Расскажу расписание уроков. "
-    "Скажи «на сегодня» или «на завтра»."
+    "Скажи «на сегодня», «на завтра» или «какой сейчас урок»."
 )
 
 _ALICE_MAIN_BUTTONS = [
@@ -2654,64 +4898,16 @@ def _alice_resp(text: str, tts: str, session: dict, end_session: bool = False,
     return resp
 
 
-# Маппинг голосовых команд к ключам профилей субботы.
-# ВАЖНО: более конкретные триггеры должны идти РАНЬШЕ общих («инфотех первый» до «инфотех»)
-_ALICE_SAT_PROFILE_TRIGGERS: list[tuple[str, str | None]] = [
-    ("инфотех первый",  "Инфотех_1"),
-    ("инфотех 1",       "Инфотех_1"),
-    ("первая группа",   "Инфотех_1"),
-    ("первый",          "Инфотех_1"),
-    ("инфотех второй",  "Инфотех_2"),
-    ("инфотех 2",       "Инфотех_2"),
-    ("вторая группа",   "Инфотех_2"),
-    ("второй",          "Инфотех_2"),
-    ("физмат",          "Физмат"),
-    ("физико",          "Физмат"),
-    ("биохим",          "Биохим"),
-    ("биолог",          "Биохим"),
-    ("общеобр",         "Общеобразовательный_3"),
-    ("третий",          "Общеобразовательный_3"),
-    ("соцгум",          "Соцгум"),
-    ("социально",       "Соцгум"),
-    ("гуманит",         "Соцгум"),
-    # «инфотех» без номера — нужно уточнение, идёт последним
-    ("инфотех",         None),
-]
-
-
-_ALICE_PROFILE_LABEL_TTS: dict[str, str] = {
-    "Физмат":                "Физмат",
-    "Биохим":                "Биохим",
-    "Инфотех 1 группа":      "Инфотех первая группа",
-    "Инфотех 2 группа":      "Инфотех вторая группа",
-    "Инфотех 3 группа":      "Инфотех третья группа",
-    "Общеобр-ый 3 группа":   "Общеобразовательный, третья группа",
-    "Соцгум":                "Социально-гуманитарный",
-}
-
 def _alice_profile_tts(label: str) -> str:
-    """Возвращает TTS-произношение метки профиля субботы."""
-    return _ALICE_PROFILE_LABEL_TTS.get(label, label)
+    """Возвращает TTS-произношение метки профиля (поле tts в описании профиля)."""
+    return _current_profile_set().tts.get(label, label)
 
 
 def _alice_saturday_buttons(day_type: str = "today") -> list[dict] | None:
-    """Возвращает кнопки профилей субботы если сегодня/завтра суббота с несколькими профилями."""
+    """Возвращает кнопки профилей, если сегодня/завтра день с несколькими профилями."""
     now = datetime.now(tz=_get_tz())
     target_date = now.date() if day_type == "today" else (now + timedelta(days=1)).date()
-    if target_date.strftime("%A") != "Saturday":
-        return None
-    profiles = _get_saturday_profiles_for_date(target_date)
-    active = [(label, lessons) for label, lessons in profiles if lessons]
-    if len(active) <= 1:
-        return None
-    buttons = [{"title": label, "hide": True} for label, _ in active]
-    buttons.append({"title": "Все профили", "hide": True})
-    buttons.append({"title": "На завтра",   "hide": True})
-    return buttons
-    """Возвращает кнопки профилей субботы если сегодня/завтра суббота с несколькими профилями."""
-    now = datetime.now(tz=_get_tz())
-    target_date = now.date() if day_type == "today" else (now + timedelta(days=1)).date()
-    if target_date.strftime("%A") != "Saturday":
+    if not _date_has_profiles(target_date):
         return None
     profiles = _get_saturday_profiles_for_date(target_date)
     active = [(label, lessons) for label, lessons in profiles if lessons]
@@ -2725,18 +4921,19 @@ def _alice_saturday_buttons(day_type: str = "today") -> list[dict] | None:
 
 def _alice_try_saturday_profile(text: str, session: dict,
                                  alice_uid: str = "") -> dict | None:
-    """Если пользователь назвал профиль субботы — сохраняет и возвращает расписание."""
+    """Если пользователь назвал профиль — сохраняет и возвращает расписание
+    ближайшего дня с профилями."""
     now = datetime.now(tz=_get_tz())
     today = now.date()
 
-    # Формируем список дат для проверки: сегодня, завтра, ближайшая суббота
+    # Ближайший день с профилями: сегодня, завтра или позже на этой неделе
     dates_to_check: list[tuple[str, object]] = []
     for i in range(7):
         d = today + timedelta(days=i)
-        if d.strftime("%A") == "Saturday":
+        if _date_has_profiles(d):
             label = "today" if i == 0 else ("tomorrow" if i == 1 else "sat")
             dates_to_check.append((label, d))
-            break  # только первая ближайшая суббота
+            break  # только первый ближайший
 
     if not dates_to_check:
         return None
@@ -2749,7 +4946,7 @@ def _alice_try_saturday_profile(text: str, session: dict,
 
     label_to_key: dict[str, str] = {}
     for label, _ in active:
-        for k, lbl in SATURDAY_PROFILE_LABELS.items():
+        for k, lbl in _current_profile_labels().items():
             if lbl == label or k == label:
                 label_to_key[label] = k
                 break
@@ -2763,24 +4960,24 @@ def _alice_try_saturday_profile(text: str, session: dict,
     else:
         prefix = target_date.strftime("%d.%m")
 
-    # Поиск конкретного профиля по триггерам
+    day_word = SCHEDULE_DAYS[target_date.weekday()].lower()
+
+    # Поиск конкретного профиля по триггерам: одна регулярка, длинные триггеры
+    # раньше коротких; триггер нескольких профилей («инфотех») требует уточнения,
+    # если в этот день есть больше одного из них
+    ps = _current_profile_set()
     matched_key: str | None = None
-    need_clarify = False
-    for trigger, profile_key in _ALICE_SAT_PROFILE_TRIGGERS:
-        if trigger in text:
-            if profile_key is None:
-                has1 = "Инфотех_1" in active_keys
-                has2 = "Инфотех_2" in active_keys
-                if has1 and has2:
-                    need_clarify = True
-                elif has1:
-                    matched_key = "Инфотех_1"
-                elif has2:
-                    matched_key = "Инфотех_2"
+    clarify: list[str] = []
+    if ps.trigger_re is not None:
+        for m in ps.trigger_re.finditer(text):
+            keys = [k for k in ps.triggers[m.group(0)] if k in active_keys]
+            if len(keys) == 1:
+                matched_key = keys[0]
                 break
-            elif profile_key in active_keys:
-                matched_key = profile_key
+            if keys:
+                clarify = keys
                 break
+    need_clarify = bool(clarify)
 
     # Прямое совпадение с меткой (кнопка «Физмат»)
     if not matched_key and not need_clarify:
@@ -2791,20 +4988,18 @@ def _alice_try_saturday_profile(text: str, session: dict,
                     break
 
     if need_clarify:
-        msg = "Уточни: первый или второй?"
-        btns = []
-        if "Инфотех_1" in active_keys:
-            btns.append({"title": "Инфотех первый", "hide": True})
-        if "Инфотех_2" in active_keys:
-            btns.append({"title": "Инфотех второй", "hide": True})
-        return _alice_resp(msg, msg, session, buttons=btns)
+        options = [ps.labels.get(k, k) for k in clarify]
+        msg = "Уточни: " + " или ".join(options) + "?"
+        tts = "Уточни: " + " или ".join(_alice_profile_tts(o) for o in options) + "?"
+        btns = [{"title": o, "hide": True} for o in options]
+        return _alice_resp(msg, tts, session, buttons=btns)
 
     if matched_key:
         _alice_set_profile(alice_uid, matched_key)
-        label_out = SATURDAY_PROFILE_LABELS.get(matched_key, matched_key)
+        label_out = _current_profile_labels().get(matched_key, matched_key)
         lessons_out = next((l for lbl, l in active if label_to_key.get(lbl) == matched_key), [])
-        display = f"{prefix}, суббота — {label_out}\n{_alice_format_screen(lessons_out)}"
-        tts = f"{prefix} суббота, {_alice_profile_tts(label_out)}. {_alice_format_tts(lessons_out)}"
+        display = f"{prefix}, {day_word} — {label_out}\n{_alice_format_screen(lessons_out)}"
+        tts = f"{prefix} {day_word}, {_alice_profile_tts(label_out)}. {_alice_format_tts(lessons_out)}"
         btns = [{"title": "На сегодня",     "hide": True},
                 {"title": "На завтра",       "hide": True},
                 {"title": "Все профили",     "hide": True},
@@ -2816,18 +5011,19 @@ def _alice_try_saturday_profile(text: str, session: dict,
 
 def _alice_saturday_response(target_date, day_type: str, saved_profile: str | None,
                               session: dict, alice_uid: str = "") -> dict:
-    """Формирует ответ для субботы с учётом сохранённого профиля."""
+    """Формирует ответ для дня с профилями с учётом сохранённого профиля."""
     prefix = "Сегодня" if day_type == "today" else "Завтра"
+    day_word = SCHEDULE_DAYS[target_date.weekday()].lower()
     profiles = _get_saturday_profiles_for_date(target_date)
     active = [(lbl, les) for lbl, les in profiles if les]
 
     if not active:
-        msg = f"{prefix}, суббота. Занятий нет."
+        msg = f"{prefix}, {day_word}. Занятий нет."
         return _alice_resp(msg, msg, session, buttons=_ALICE_MAIN_BUTTONS)
 
     label_to_key: dict[str, str] = {}
     for lbl, _ in active:
-        for k, l in SATURDAY_PROFILE_LABELS.items():
+        for k, l in _current_profile_labels().items():
             if l == lbl or k == lbl:
                 label_to_key[lbl] = k
                 break
@@ -2844,8 +5040,8 @@ def _alice_saturday_response(target_date, day_type: str, saved_profile: str | No
         for lbl, les in active:
             parts_text.append(f"{lbl}:\n{_alice_format_screen(les)}")
             parts_tts.append(f"{_alice_profile_tts(lbl)}. {_alice_format_tts(les)}")
-        display = f"{prefix}, суббота.\n\n" + "\n\n".join(parts_text)
-        tts = f"{prefix} суббота. " + " ".join(parts_tts)
+        display = f"{prefix}, {day_word}.\n\n" + "\n\n".join(parts_text)
+        tts = f"{prefix} {day_word}. " + " ".join(parts_tts)
         return _alice_resp(_alice_truncate(display, 1020), _alice_truncate(tts),
                            session, buttons=_btns_after_show())
 
@@ -2854,9 +5050,9 @@ def _alice_saturday_response(target_date, day_type: str, saved_profile: str | No
         lessons_out = next((les for lbl, les in active
                             if label_to_key.get(lbl) == saved_profile), None)
         if lessons_out is not None:
-            label_out = SATURDAY_PROFILE_LABELS.get(saved_profile, saved_profile)
-            display = f"{prefix}, суббота — {label_out}\n{_alice_format_screen(lessons_out)}"
-            tts = f"{prefix} суббота, {_alice_profile_tts(label_out)}. {_alice_format_tts(lessons_out)}"
+            label_out = _current_profile_labels().get(saved_profile, saved_profile)
+            display = f"{prefix}, {day_word} — {label_out}\n{_alice_format_screen(lessons_out)}"
+            tts = f"{prefix} {day_word}, {_alice_profile_tts(label_out)}. {_alice_format_tts(lessons_out)}"
             return _alice_resp(_alice_truncate(display, 1020), _alice_truncate(tts),
                                session, buttons=_btns_after_show())
 
@@ -2865,23 +5061,56 @@ def _alice_saturday_response(target_date, day_type: str, saved_profile: str | No
         lbl, les = active[0]
         profile_key = label_to_key.get(lbl, lbl)
         _alice_set_profile(alice_uid, profile_key)
-        display = f"{prefix}, суббота — {lbl}\n{_alice_format_screen(les)}"
-        tts = f"{prefix} суббота. {_alice_format_tts(les)}"
+        display = f"{prefix}, {day_word} — {lbl}\n{_alice_format_screen(les)}"
+        tts = f"{prefix} {day_word}. {_alice_format_tts(les)}"
         return _alice_resp(_alice_truncate(display, 1020), _alice_truncate(tts),
                            session, buttons=_ALICE_MAIN_BUTTONS)
 
     # Несколько профилей — показываем список
     labels_txt = ", ".join(lbl for lbl, _ in active)
     labels_tts = ", ".join(_alice_profile_tts(lbl) for lbl, _ in active)
-    msg_txt = f"{prefix}, суббота.\nПрофили: {labels_txt}.\nВыбери профиль или скажи его название."
-    msg_tts = f"{prefix} суббота. Доступны профили: {labels_tts}. Назови нужный профиль."
+    msg_txt = f"{prefix}, {day_word}.\nПрофили: {labels_txt}.\nВыбери профиль или скажи его название."
+    msg_tts = f"{prefix} {day_word}. Доступны профили: {labels_tts}. Назови нужный профиль."
     btns = [{"title": lbl, "hide": True} for lbl, _ in active]
     btns.append({"title": "Все профили", "hide": True})
     btns.append({"title": "На завтра",   "hide": True})
     return _alice_resp(msg_txt, _alice_truncate(msg_tts), session, buttons=btns)
 
 
+def _alice_user_id(session: dict) -> str:
+    """user_id — из session.user.user_id (авторизованные) или session.application.application_id."""
+    session_user = session.get("user") or {}
+    session_app  = session.get("application") or {}
+    return (session_user.get("user_id") or session_app.get("application_id") or "").strip()
+
+
+_ALICE_CLASS_RE = re.compile(r"^(?:мой класс|выбрать класс|класс)\s+(.+)$")
+
+
 def _alice_handle_request(req_body: dict) -> dict:
+    """Обработка запроса от Алисы: выбор класса («класс 10А»), остальное —
+    в контексте класса пользователя."""
+    session   = req_body.get("session") or {}
+    request   = req_body.get("request") or {}
+    alice_uid = _alice_user_id(session)
+    txt = ((request.get("command") or "") or (request.get("original_utterance") or "")).lower().strip()
+
+    m = _ALICE_CLASS_RE.match(txt) if _tenants else None
+    if m:
+        tenant_id = _find_tenant(m.group(1))
+        if tenant_id is None:
+            examples = ", ".join(t["title"] for t in list(_tenants.values())[:3])
+            msg = f"Не нашла такой класс. Например: {examples}."
+        else:
+            _set_user_tenant(f"alice:{alice_uid}", tenant_id)
+            msg = f"Запомнила: {_tenant_title(tenant_id)}. Спроси расписание на сегодня или на завтра."
+        return _alice_resp(msg, msg, session, buttons=_ALICE_MAIN_BUTTONS)
+
+    with _tenant_scope(_user_tenant(f"alice:{alice_uid}")):
+        return _alice_dispatch(req_body)
+
+
+def _alice_dispatch(req_body: dict) -> dict:
     """Основная логика обработки запроса от Алисы."""
     session    = req_body.get("session") or {}
     request    = req_body.get("request") or {}
@@ -2890,33 +5119,42 @@ def _alice_handle_request(req_body: dict) -> dict:
     original      = (request.get("original_utterance") or "").lower().strip()
     txt           = command or original
     is_new        = session.get("new", False)
-
-    # user_id — берём из session.user.user_id (авторизованные) или session.application.application_id
-    session_user = session.get("user") or {}
-    session_app  = session.get("application") or {}
-    alice_uid    = (session_user.get("user_id") or session_app.get("application_id") or "").strip()
+    alice_uid     = _alice_user_id(session)
 
     # Профиль с нашего сервера — надёжно между сессиями
     saved_profile: str | None = _alice_get_profile(alice_uid)
 
     now = datetime.now(tz=_get_tz())
 
-    # Хелпер: ближайшая суббота (сегодня или завтра) → (day_type, date) или (None,None)
+    # Хелпер: ближайший день с профилями (сегодня или завтра) → (day_type, date) или (None,None)
     def _nearest_sat():
-        if now.date().strftime("%A") == "Saturday":
+        if _date_has_profiles(now.date()):
             return "today", now.date()
         tmr = (now + timedelta(days=1)).date()
-        if tmr.strftime("%A") == "Saturday":
+        if _date_has_profiles(tmr):
             return "tomorrow", tmr
         return None, None
 
-    # Хелпер: кнопки показа профилей субботы
+    # Хелпер: кнопки показа профилей
     def _sat_list_buttons(active):
         btns = [{"title": lbl, "hide": True} for lbl, _ in active]
         btns.append({"title": "Все профили", "hide": True})
         btns.append({"title": "На завтра",   "hide": True})
         return btns
 
+    # ── Какой урок сейчас / следующий ────────────────────────────────────────
+    # «какой урок завтра первый» — вопрос о завтрашнем расписании, не о текущем
+    if "завтра" not in txt and any(w in txt for w in [
+        "какой сейчас урок", "какой урок сейчас", "что сейчас",
+        "сейчас урок", "следующий урок",
+    ]):
+        profile = saved_profile if saved_profile != "__ALL__" else None
+        status = _now_status(now, profile)
+        display = _format_now_text(status)
+        tts = _format_now_text(status, tts=True)
+        return _alice_resp(_alice_truncate(display, 1020), _alice_truncate(tts),
+                           session, buttons=_ALICE_MAIN_BUTTONS)
+
     # ── «Все профили» ────────────────────────────────────────────────────────
     if "все профили" in txt:
         dt, sd = _nearest_sat()
@@ -2928,205 +5166,1174 @@ def _alice_handle_request(req_body: dict) -> dict:
                 prefix = "Сегодня" if dt == "today" else "Завтра"
                 parts_d = [f"{l}:\n{_alice_format_screen(les)}" for l, les in active]
                 parts_t = [f"{_alice_profile_tts(l)}. {_alice_format_tts(les)}" for l, les in active]
-                display = f"{prefix}, суббота.\n\n" + "\n\n".join(parts_d)
-                tts     = f"{prefix} суббота. " + " ".join(parts_t)
+                day_word = SCHEDULE_DAYS[sd.weekday()].lower()
+                display = f"{prefix}, {day_word}.\n\n" + "\n\n".join(parts_d)
+                tts     = f"{prefix} {day_word}. " + " ".join(parts_t)
                 btns = [{"title": "На сегодня",     "hide": True},
                         {"title": "На завтра",       "hide": True},
                         {"title": "Сменить профиль", "hide": True}]
                 return _alice_resp(_alice_truncate(display, 1020), _alice_truncate(tts),
                                    session, buttons=btns)
 
-    # ── «Сменить профиль» ────────────────────────────────────────────────────
-    if any(w in txt for w in ["сменить профиль", "другой профиль", "другое"]):
-        _alice_set_profile(alice_uid, "")
-        dt, sd = _nearest_sat()
-        if sd:
-            profiles = _get_saturday_profiles_for_date(sd)
-            active = [(l, les) for l, les in profiles if les]
-            if active:
-                prefix = "Сегодня" if dt == "today" else "Завтра"
-                labels_d = ", ".join(l for l, _ in active)
-                labels_t = ", ".join(_alice_profile_tts(l) for l, _ in active)
-                msg_d = f"{prefix}, суббота.\nПрофили: {labels_d}.\nВыбери профиль."
-                msg_t = f"Выбери профиль. {labels_t}."
-                return _alice_resp(msg_d, _alice_truncate(msg_t), session,
-                                   buttons=_sat_list_buttons(active))
-        display, tts = _alice_day_text("today")
-        return _alice_resp(_alice_truncate(display, 1020), _alice_truncate(tts),
-                           session, buttons=_ALICE_MAIN_BUTTONS)
+    # ── «Сменить профиль» ────────────────────────────────────────────────────
+    if any(w in txt for w in ["сменить профиль", "другой профиль", "другое"]):
+        _alice_set_profile(alice_uid, "")
+        dt, sd = _nearest_sat()
+        if sd:
+            profiles = _get_saturday_profiles_for_date(sd)
+            active = [(l, les) for l, les in profiles if les]
+            if active:
+                prefix = "Сегодня" if dt == "today" else "Завтра"
+                labels_d = ", ".join(l for l, _ in active)
+                labels_t = ", ".join(_alice_profile_tts(l) for l, _ in active)
+                day_word = SCHEDULE_DAYS[sd.weekday()].lower()
+                msg_d = f"{prefix}, {day_word}.\nПрофили: {labels_d}.\nВыбери профиль."
+                msg_t = f"Выбери профиль. {labels_t}."
+                return _alice_resp(msg_d, _alice_truncate(msg_t), session,
+                                   buttons=_sat_list_buttons(active))
+        display, tts = _alice_day_text("today")
+        return _alice_resp(_alice_truncate(display, 1020), _alice_truncate(tts),
+                           session, buttons=_ALICE_MAIN_BUTTONS)
+
+    # ── Расписание на сегодня ────────────────────────────────────────────────
+    if any(w in txt for w in [
+        "сегодня", "на сегодня", "today", "сейчас",
+        "что сегодня", "какие сегодня", "какое сегодня",
+    ]):
+        target = now.date()
+        if _date_has_profiles(target):
+            return _alice_saturday_response(target, "today", saved_profile, session, alice_uid)
+        display, tts = _alice_day_text("today")
+        return _alice_resp(_alice_truncate(display, 1020), _alice_truncate(tts),
+                           session, buttons=_ALICE_MAIN_BUTTONS)
+
+    # ── Расписание на завтра ─────────────────────────────────────────────────
+    if any(w in txt for w in [
+        "завтра", "на завтра", "tomorrow",
+        "что завтра", "какие завтра", "какое завтра",
+    ]):
+        target = (now + timedelta(days=1)).date()
+        if _date_has_profiles(target):
+            return _alice_saturday_response(target, "tomorrow", saved_profile, session, alice_uid)
+        display, tts = _alice_day_text("tomorrow")
+        return _alice_resp(_alice_truncate(display, 1020), _alice_truncate(tts),
+                           session, buttons=_ALICE_MAIN_BUTTONS)
+
+    # ── Общий запрос «расписание» → сегодня ─────────────────────────────────
+    if any(w in txt for w in ["расписание", "уроки", "занятия", "какие уроки"]):
+        target = now.date()
+        if _date_has_profiles(target):
+            return _alice_saturday_response(target, "today", saved_profile, session, alice_uid)
+        display, tts = _alice_day_text("today")
+        return _alice_resp(_alice_truncate(display, 1020), _alice_truncate(tts),
+                           session, buttons=_ALICE_MAIN_BUTTONS)
+
+    # ── Выбор конкретного профиля субботы (кнопка или голос) ─────────────────
+    sat_resp = _alice_try_saturday_profile(txt, session, alice_uid)
+    if sat_resp:
+        return sat_resp
+
+    # ── Приветствие / помощь ─────────────────────────────────────────────────
+    if is_new or not txt or txt in {"помощь", "help", "что ты умеешь"}:
+        return _alice_resp(_ALICE_HELP_TEXT, _ALICE_HELP_TEXT, session,
+                           buttons=_ALICE_MAIN_BUTTONS)
+
+    # ── Выход ────────────────────────────────────────────────────────────────
+    if any(w in txt for w in ["стоп", "выход", "хватит", "пока", "выйти"]):
+        msg = "До свидания! Удачи в учёбе!"
+        return _alice_resp(msg, msg, session, end_session=True)
+
+    # ── Не понял ─────────────────────────────────────────────────────────────
+    answer = "Не поняла запрос. " + _ALICE_HELP_TEXT
+    return _alice_resp(answer, answer, session, buttons=_ALICE_MAIN_BUTTONS)
+
+
+@app.post("/alice")
+async def alice_webhook(request: Request):
+    """Эндпоинт для навыка Яндекс Алисы. URL: https://<домен>/alice"""
+    try:
+        body = await request.json()
+    except Exception:
+        return JSONResponse({"error": "invalid json"}, status_code=400)
+
+    if ALICE_SKILL_ID:
+        incoming_skill_id = (body.get("session") or {}).get("skill_id", "")
+        if incoming_skill_id != ALICE_SKILL_ID:
+            logger.warning(f"Alice: неверный skill_id: {incoming_skill_id!r}")
+            return JSONResponse({"error": "forbidden"}, status_code=403)
+
+    try:
+        response = _alice_handle_request(body)
+    except Exception as e:
+        logger.exception(f"Alice handler error: {e}\nbody={json.dumps(body, ensure_ascii=False)[:500]}")
+        err_msg = "Произошла ошибка. Попробуйте позже."
+        response = _alice_resp(err_msg, err_msg, body.get("session") or {})
+
+    return JSONResponse(response)
+
+
+# ================== Общее состояние (несколько воркеров) ==================
+# STATE_BACKEND=sqlite — режим нескольких воркеров (uvicorn --workers N или
+# несколько процессов на одном диске). Расписание, подписки, профили Алисы и
+# админы хранятся в общей SQLite-базе STATE_DB_PATH: каждое сохранение пишет туда
+# изменённые записи (слиянием с текущим содержимым базы, чтобы параллельные
+# правки разных воркеров не затирали друг друга), а остальные воркеры раз в
+# STATE_SYNC_SECONDS подхватывают ключи с новой версией. Планировщик напоминаний
+# и опрос Google Sheets работают только у лидера — воркера, держащего аренду
+# "scheduler"; остальные обслуживают webhook и API. Без STATE_BACKEND бот
+# работает как один процесс, как раньше.
+STATE_BACKEND = (os.environ.get("STATE_BACKEND") or "").strip().lower()
+STATE_DB_PATH = os.environ.get("STATE_DB_PATH") or "state.db"
+STATE_SYNC_SECONDS = float(os.environ.get("STATE_SYNC_SECONDS") or 1)
+STATE_LEASE_SECONDS = float(os.environ.get("STATE_LEASE_SECONDS") or 15)
+
+_STATE_KEYS = ("schedule", "temp_schedule", "subscriptions", "alice_profiles", "admins", "profiles")
+_state_owner = f"{os.uname().nodename if hasattr(os, 'uname') else 'host'}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_state_versions: dict[str, int] = {}
+# Последнее согласованное с базой содержимое: {ключ: {запись: json}} — по нему
+# считается, какие записи изменил этот воркер
+_state_shadow: dict[str, dict[str, str]] = {}
+_state_leader = not STATE_BACKEND
+_state_task: asyncio.Task | None = None
+# Запись в базу (с busy timeout) не выполняется в цикле событий: _state_publish
+# только помечает ключ, а единственный на процесс _state_writer по очереди
+# сливает помеченные ключи с базой в отдельном потоке. Пока ключ ждёт записи
+# или пишется, _state_sync_loop его не применяет — объединённое значение
+# вернёт сам писатель.
+_state_dirty: set[str] = set()
+_state_writing: set[str] = set()
+_state_writer_task: asyncio.Task | None = None
+
+
+def _state_enabled() -> bool:
+    return STATE_BACKEND == "sqlite"
+
+
+def _is_leader() -> bool:
+    """Этот воркер выполняет фоновые задачи (напоминания, опрос Sheets)."""
+    return _state_leader
+
+
+def _state_conn() -> sqlite3.Connection:
+    conn = sqlite3.connect(STATE_DB_PATH, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _state_items(name: str) -> dict:
+    """Текущее значение ключа в виде словаря записей."""
+    if name == "admins":
+        return {str(x): True for x in dynamic_admins}
+    if name == "profiles":
+        # порядок профилей — в поле pos: записи сливаются по ключу
+        return {p["key"]: {**p, "pos": i} for i, p in enumerate(_profile_set.items)}
+    return {"schedule": schedule, "temp_schedule": temp_schedule,
+            "subscriptions": subscriptions, "alice_profiles": alice_profiles}[name]
+
+
+def _state_set(name: str, items: dict) -> None:
+    global subscriptions, alice_profiles, dynamic_admins
+    if name == "schedule":
+        _replace_schedule(base=items, source="state")
+    elif name == "temp_schedule":
+        _replace_schedule(temp=items, source="state")
+    elif name == "subscriptions":
+        subscriptions = items
+    elif name == "alice_profiles":
+        alice_profiles = items
+    elif name == "admins":
+        dynamic_admins = {int(x) for x in items if str(x).lstrip("-").isdigit()}
+    elif name == "profiles":
+        ordered = sorted(items.values(), key=lambda p: p.get("pos", 0))
+        profiles, err = _normalize_profiles([{k: v for k, v in p.items() if k != "pos"} for p in ordered])
+        if err:
+            logger.error(f"state profiles: {err} — оставляем текущие профили")
+        else:
+            _set_profiles(profiles)
+
+
+def _state_snapshot(items: dict) -> dict[str, str]:
+    return {k: json.dumps(v, ensure_ascii=False, sort_keys=True) for k, v in items.items()}
+
+
+def _state_apply(name: str, items: dict, version: int) -> None:
+    """Применяет значение ключа, пришедшее из базы."""
+    _state_set(name, items)
+    _state_versions[name] = version
+    _state_shadow[name] = _state_snapshot(items)
+    if name == "subscriptions":
+        _publish(SubscriptionChanged(None, "state", persist=False))
+
+
+def _state_publish(name: str) -> None:
+    """Ставит в очередь запись в общую базу записей ключа name, изменённых этим
+    воркером. Вызывается из _save_*: после слияния глобальная переменная содержит
+    и чужие правки."""
+    global _state_writer_task
+    if not _state_enabled():
+        return
+    _state_dirty.add(name)
+    if _state_writer_task is not None and not _state_writer_task.done():
+        return
+    try:
+        _state_writer_task = asyncio.get_running_loop().create_task(_state_writer())
+    except RuntimeError:
+        # Вне цикла событий (поток, утилиты) — пишем сразу
+        while _state_dirty:
+            name = _state_dirty.pop()
+            sent, upserts, deletes = _state_diff(name)
+            if upserts or deletes:
+                try:
+                    _state_merged(name, sent, *_state_write(name, upserts, deletes))
+                except Exception as e:
+                    _state_dirty.add(name)  # повторится со следующей записью
+                    logger.error(f"_state_publish({name}) error: {e}")
+                    break
+
+
+def _state_diff(name: str) -> tuple[dict[str, str], dict, list[str]]:
+    """Отпечатки текущих записей ключа и их отличия от согласованных с базой."""
+    items = _state_items(name)
+    current = _state_snapshot(items)
+    shadow = _state_shadow.get(name, {})
+    upserts = {k: items[k] for k, v in current.items() if shadow.get(k) != v}
+    deletes = [k for k in shadow if k not in current]
+    return current, upserts, deletes
+
+
+def _state_write(name: str, upserts: dict, deletes: list[str]) -> tuple[dict, int]:
+    """Сливает изменения с содержимым базы. Возвращает (объединённое значение, версия)."""
+    conn = _state_conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT value, version FROM state WHERE key = ?", (name,)).fetchone()
+        merged = json.loads(row[0]) if row else {}
+        version = (row[1] if row else 0) + 1
+        merged.update(upserts)
+        for k in deletes:
+            merged.pop(k, None)
+        conn.execute(
+            "INSERT OR REPLACE INTO state (key, value, version) VALUES (?, ?, ?)",
+            (name, json.dumps(merged, ensure_ascii=False), version),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return merged, version
+
+
+def _state_merged(name: str, sent: dict[str, str], merged: dict, version: int) -> None:
+    """Применяет объединённое значение из базы. Записи, изменённые локально уже
+    после отправки (sent — их отпечатки на момент отправки), не трогаем: они
+    уйдут следующей записью."""
+    items = _state_items(name)
+    current = _state_snapshot(items)
+    value = {k: v for k, v in merged.items() if current.get(k) == sent.get(k)}
+    value.update({k: items[k] for k, v in current.items() if v != sent.get(k)})
+    if name == "admins" or value != items:
+        # В базе были чужие правки — подменяем значение объединённым
+        _state_set(name, value)
+        if name == "subscriptions":
+            _publish(SubscriptionChanged(None, "state", persist=False))
+    _state_versions[name] = version
+    _state_shadow[name] = _state_snapshot(merged)
+
+
+async def _state_writer() -> None:
+    delay = 1.0
+    while _state_dirty:
+        name = _state_dirty.pop()
+        sent, upserts, deletes = _state_diff(name)
+        if not upserts and not deletes:
+            continue
+        _state_writing.add(name)
+        try:
+            merged, version = await asyncio.to_thread(_state_write, name, upserts, deletes)
+        except Exception as e:
+            # Ключ остаётся помеченным: иначе _state_sync_loop применит чужую
+            # версию поверх незаписанной локальной правки
+            _state_dirty.add(name)
+            logger.error(f"_state_publish({name}) error: {e} — повтор через {delay:.0f} с")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+            continue
+        finally:
+            _state_writing.discard(name)
+        delay = 1.0
+        _state_merged(name, sent, merged, version)
+
+
+def _state_init() -> None:
+    """Создаёт таблицы; ключи, уже лежащие в базе, имеют приоритет над локальными файлами."""
+    conn = _state_conn()
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, version INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.execute("BEGIN IMMEDIATE")
+        rows = {k: (v, ver) for k, v, ver in conn.execute("SELECT key, value, version FROM state")}
+        for name in _STATE_KEYS:
+            if name not in rows:
+                items = _state_items(name)
+                conn.execute(
+                    "INSERT INTO state (key, value, version) VALUES (?, ?, 1)",
+                    (name, json.dumps(items, ensure_ascii=False)),
+                )
+                rows[name] = (None, 1)
+                _state_versions[name] = 1
+                _state_shadow[name] = _state_snapshot(items)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    for name, (value, version) in rows.items():
+        if value is not None and name in _STATE_KEYS:
+            _state_apply(name, json.loads(value), version)
+
+
+def _state_fetch_changed() -> list[tuple[str, dict, int]]:
+    """Читает ключи, версия которых новее известной этому воркеру. Выполняется в потоке."""
+    known = dict(_state_versions)
+    conn = _state_conn()
+    try:
+        changed = [k for k, ver in conn.execute("SELECT key, version FROM state") if ver > known.get(k, 0)]
+        out = []
+        for name in changed:
+            row = conn.execute("SELECT value, version FROM state WHERE key = ?", (name,)).fetchone()
+            if row:
+                out.append((name, json.loads(row[0]), row[1]))
+        return out
+    finally:
+        conn.close()
+
+
+def _state_try_lease(name: str, ttl: float) -> bool:
+    """Берёт или продлевает аренду name. Выполняется в потоке."""
+    now = time.time()
+    conn = _state_conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+        if row and row[0] != _state_owner and row[1] > now:
+            conn.execute("COMMIT")
+            return False
+        conn.execute(
+            "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+            (name, _state_owner, now + ttl),
+        )
+        conn.execute("COMMIT")
+        return True
+    finally:
+        conn.close()
+
+
+def _state_release_lease(name: str) -> None:
+    conn = _state_conn()
+    try:
+        conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, _state_owner))
+    finally:
+        conn.close()
+
+
+def _state_set_leader(leader: bool) -> None:
+    global _state_leader
+    if leader == _state_leader:
+        return
+    _state_leader = leader
+    if scheduler is not None:
+        scheduler.resume() if leader else scheduler.pause()
+    logger.info(f"👑 Воркер {_state_owner}: {'лидер — напоминания включены' if leader else 'не лидер — напоминания на паузе'}")
+
+
+async def _state_sync_loop() -> None:
+    last_lease = 0.0
+    while True:
+        await asyncio.sleep(STATE_SYNC_SECONDS)
+        try:
+            for name, items, version in await asyncio.to_thread(_state_fetch_changed):
+                if name in _state_dirty or name in _state_writing:
+                    continue  # своя запись в очереди — объединённое значение вернёт _state_writer
+                if version > _state_versions.get(name, 0):
+                    _state_apply(name, items, version)
+            if time.monotonic() - last_lease >= STATE_LEASE_SECONDS / 3:
+                _state_set_leader(await asyncio.to_thread(_state_try_lease, "scheduler", STATE_LEASE_SECONDS))
+                last_lease = time.monotonic()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"State sync error: {e}")
+
+
+# ================== Перезагрузка файлов расписания ==================
+# schedule.json и temp_schedule.json можно править прямо на диске: изменения
+# подхватываются без перезапуска. Каталог отслеживается через inotify (Linux),
+# иначе — опросом mtime раз в SCHEDULE_WATCH_POLL_SECONDS. Новый файл читается
+# целиком, проверяется и только потом подменяет данные в памяти; битый или
+# неверный по структуре файл отклоняется, работающая копия не трогается.
+# Собственные записи бота узнаются по содержимому (совпадает с данными в памяти).
+# С STATE_BACKEND слежение выключено: на общем диске запись одного воркера для
+# остальных выглядела бы внешней правкой (повторная запись в Sheets и в базу,
+# лишняя запись в журнал правок, откат параллельных правок); источник истины
+# там — общая база, править расписание нужно через бота или WebApp.
+SCHEDULE_WATCH = (os.environ.get("SCHEDULE_WATCH") or "1").strip().lower() not in ("0", "false", "no")
+SCHEDULE_WATCH_POLL_SECONDS = float(os.environ.get("SCHEDULE_WATCH_POLL_SECONDS") or 2)
+_WATCH_DEBOUNCE = 0.3
+
+_watch_files = {"schedule.json": "schedule", TEMP_SCHEDULE_PATH: "temp_schedule"}
+_watch_hashes: dict[str, str] = {}
+_watch_state: dict = {"mode": None, "fd": None, "task": None, "pending": set(), "timer": None}
+
+
+def _validate_lessons(value, where: str) -> str | None:
+    if not isinstance(value, list) or not all(isinstance(x, str) for x in value):
+        return f"{where}: ожидается список строк"
+    return None
+
+
+def _validate_day_value(value, where: str, allow_profiles: bool) -> str | None:
+    if isinstance(value, dict):
+        if not allow_profiles:
+            return f"{where}: в этот день профилей нет"
+        for pk, lessons in value.items():
+            err = _validate_lessons(lessons, f"{where} / {pk}")
+            if err:
+                return err
+        return None
+    return _validate_lessons(value, where)
+
+
+def _validate_schedule_file(name: str, data, profile_days=None) -> str | None:
+    """Проверяет структуру загруженного файла. Возвращает текст ошибки или None.
+    profile_days — дни, в которые допустимы профили (по умолчанию основного класса)."""
+    profile_days = _profile_set.days if profile_days is None else profile_days
+    if not isinstance(data, dict):
+        return "ожидается JSON-объект"
+    if name == "schedule":
+        if not data:
+            return "пустое расписание"
+        for day, value in data.items():
+            if day not in SCHEDULE_DAYS:
+                return f"неизвестный день {day!r}"
+            err = _validate_day_value(value, day, allow_profiles=(day in profile_days))
+            if err:
+                return err
+    else:
+        for key, value in data.items():
+            try:
+                d = date.fromisoformat(key)
+            except ValueError:
+                return f"неверная дата {key!r}"
+            err = _validate_day_value(value, key, allow_profiles=(SCHEDULE_DAYS[d.weekday()] in profile_days))
+            if err:
+                return err
+    return None
+
+
+def _reload_schedule_file(path: str) -> bool:
+    """Перечитывает файл расписания; True — если данные подменены."""
+    name = _watch_files[path]
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return False
+    digest = hashlib.sha1(raw).hexdigest()
+    if _watch_hashes.get(path) == digest:
+        return False
+    try:
+        data = json.loads(raw.decode("utf-8"))
+    except Exception as e:
+        logger.error(f"🗂 {path}: не удалось разобрать JSON ({e}) — оставляем текущее расписание")
+        _watch_hashes[path] = digest
+        return False
+    current = schedule if name == "schedule" else temp_schedule
+    _watch_hashes[path] = digest
+    if data == current:
+        return False  # наша собственная запись
+    err = _validate_schedule_file(name, data, _profile_set.days)
+    if err:
+        logger.error(f"🗂 {path}: файл отклонён — {err}")
+        return False
+    if name == "schedule":
+        _replace_schedule(base=data, source="disk")
+        _gs_sync("schedule", _gs_save_schedule)
+    else:
+        _replace_schedule(temp=data, source="disk")
+        _gs_sync("temp_schedule", _gs_save_temp_schedule)
+    _state_publish(name)
+    logger.info(f"🗂 {path} изменён на диске — расписание перезагружено (версия {schedule_version})")
+    return True
+
+
+def _watch_flush() -> None:
+    _watch_state["timer"] = None
+    pending, _watch_state["pending"] = _watch_state["pending"], set()
+    for path in pending:
+        try:
+            _reload_schedule_file(path)
+        except Exception as e:
+            logger.error(f"_reload_schedule_file({path}) error: {e}")
+
+
+def _watch_touch(path: str) -> None:
+    """Откладывает перечитывание: редактор может писать файл в несколько приёмов."""
+    _watch_state["pending"].add(path)
+    if _watch_state["timer"] is None:
+        _watch_state["timer"] = asyncio.get_running_loop().call_later(_WATCH_DEBOUNCE, _watch_flush)
+
+
+# ── inotify через ctypes ──
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+
+def _inotify_start() -> bool:
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            return False
+        wd = libc.inotify_add_watch(fd, os.path.abspath(".").encode(), _IN_CLOSE_WRITE | _IN_MOVED_TO)
+        if wd < 0:
+            os.close(fd)
+            return False
+    except Exception:
+        return False
+
+    def _on_events():
+        try:
+            buf = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        pos = 0
+        # struct inotify_event { int wd; uint32 mask; uint32 cookie; uint32 len; char name[]; }
+        while pos + 16 <= len(buf):
+            name_len = int.from_bytes(buf[pos + 12:pos + 16], sys.byteorder)
+            name = buf[pos + 16:pos + 16 + name_len].split(b"\0", 1)[0].decode("utf-8", "replace")
+            pos += 16 + name_len
+            if name in _watch_files:
+                _watch_touch(name)
+
+    asyncio.get_running_loop().add_reader(fd, _on_events)
+    _watch_state["fd"] = fd
+    return True
+
+
+def _watch_stat(path: str) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+async def _watch_poll_loop(stats: dict[str, tuple | None]) -> None:
+    while True:
+        await asyncio.sleep(SCHEDULE_WATCH_POLL_SECONDS)
+        for path in _watch_files:
+            sig = _watch_stat(path)
+            if sig is not None and stats.get(path) != sig:
+                _watch_touch(path)
+            stats[path] = sig
+
+
+def _watch_start() -> None:
+    if not SCHEDULE_WATCH:
+        return
+    if _state_enabled():
+        logger.info("🗂 Слежение за файлами расписания выключено: включён STATE_BACKEND")
+        return
+    for path in _watch_files:
+        try:
+            with open(path, "rb") as f:
+                _watch_hashes[path] = hashlib.sha1(f.read()).hexdigest()
+        except FileNotFoundError:
+            pass
+    if _inotify_start():
+        _watch_state["mode"] = "inotify"
+    else:
+        _watch_state["mode"] = "poll"
+        stats = {path: _watch_stat(path) for path in _watch_files}
+        _watch_state["task"] = asyncio.create_task(_watch_poll_loop(stats))
+    logger.info(f"🗂 Слежение за файлами расписания: {_watch_state['mode']}")
+
+
+def _watch_stop() -> None:
+    fd = _watch_state["fd"]
+    if fd is not None:
+        try:
+            asyncio.get_running_loop().remove_reader(fd)
+        finally:
+            os.close(fd)
+        _watch_state["fd"] = None
+    if _watch_state["task"] is not None:
+        _watch_state["task"].cancel()
+    if _watch_state["timer"] is not None:
+        _watch_state["timer"].cancel()
+
+
+# ================== Синхронизация с Google Sheets ==================
+# Правки прямо в таблице (или другим экземпляром бота) подхватываются фоновым
+# опросом: раз в SHEETS_POLL_SECONDS все листы читаются одним values_batch_get,
+# по отпечатку содержимого определяется, какие изменились, и перезагружаются
+# только они. При ошибках интервал растёт экспоненциально; если квота чтений
+# за минуту израсходована наполовину, опрос пропускается. 0 — опрос выключен.
+SHEETS_POLL_SECONDS = float(os.environ.get("SHEETS_POLL_SECONDS") or 60)
+_SHEETS_POLL_MAX_BACKOFF = 900.0
+
+_gs_poll_state: dict = {
+    "interval": SHEETS_POLL_SECONDS,
+    "last_poll": None,
+    "last_change": None,
+    "polls": 0,
+    "errors": 0,
+    "skipped_quota": 0,
+}
+_gs_poll_task: asyncio.Task | None = None
+_gs_hydrate_task: asyncio.Task | None = None
+# Листы, ставшие пустыми: применяем только если пустота подтвердится на следующем
+# опросе (между clear() и update() у другого экземпляра лист кратко пуст)
+_gs_pending_empty: set[str] = set()
+
+
+def _write_local_copy(name: str) -> None:
+    """Обновляет локальный JSON-файл листа без записи в Sheets."""
+    path, data, indent = {
+        "schedule": ("schedule.json", schedule, 4),
+        "temp_schedule": (TEMP_SCHEDULE_PATH, temp_schedule, 2),
+        "subscriptions": (SUBSCRIPTIONS_PATH, subscriptions, 2),
+        "alice_profiles": (ALICE_PROFILES_PATH, alice_profiles, 2),
+        "profiles": (PROFILES_PATH, list(_profile_set.items), 2),
+    }[name]
+    try:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.write("\n")
+        os.replace(tmp, path)
+    except Exception as e:
+        logger.error(f"_write_local_copy({name}) error: {e}")
+
+
+def _gs_apply_remote(name: str, rows: list[list[str]]) -> bool:
+    """Подменяет данные листа name прочитанными из Sheets. True — если применено."""
+    global subscriptions, alice_profiles
+    if name == "schedule":
+        data = _gs_parse_schedule(rows)
+        if not data:
+            return False
+        _replace_schedule(base=data, source="sheets")
+    elif name == "temp_schedule":
+        _replace_schedule(temp=_gs_parse_temp_schedule(rows), source="sheets")
+    elif name == "subscriptions":
+        subscriptions = _gs_parse_subscriptions(rows)
+        _publish(SubscriptionChanged(None, "sheets", persist=False))
+    elif name == "alice_profiles":
+        alice_profiles = _gs_parse_alice_profiles(rows)
+    elif name == "profiles":
+        items = _gs_parse_profiles(rows)
+        if not items:
+            return False
+        _set_profiles(items)
+    else:
+        return False
+    _state_publish(name)
+    _write_local_copy(name)
+    return True
+
+
+async def _gs_poll_once() -> list[str] | None:
+    """Один цикл опроса. Возвращает список перезагруженных листов (None — пропуск по квоте)."""
+    if _gs_used("read") >= GS_READS_PER_MIN // 2:
+        _gs_poll_state["skipped_quota"] += 1
+        return None
+    gen = _gs_write_gen
+    if gen % 2:
+        return []  # идёт наша запись
+    values = await asyncio.to_thread(_gs_batch_values, _GS_SHEET_NAMES)
+    if _gs_write_gen != gen:
+        return []  # чтение пересеклось с нашей записью — дождёмся следующего опроса
+    changed: list[str] = []
+    for name, rows in values.items():
+        digest = _gs_rows_hash(rows)
+        if digest == _gs_hashes.get(name):
+            _gs_pending_empty.discard(name)
+            continue
+        if not rows and name not in _gs_pending_empty:
+            _gs_pending_empty.add(name)
+            continue
+        _gs_pending_empty.discard(name)
+        if _gs_apply_remote(name, rows):
+            changed.append(name)
+        _gs_hashes[name] = digest
+    return changed
+
+
+async def _gs_poll_loop() -> None:
+    interval = SHEETS_POLL_SECONDS
+    while True:
+        _gs_poll_state["interval"] = interval
+        await asyncio.sleep(interval)
+        if not _is_leader():
+            continue
+        try:
+            changed = await _gs_poll_once()
+            _gs_poll_state["polls"] += 1
+            _gs_poll_state["last_poll"] = datetime.now(tz=_get_tz()).isoformat(timespec="seconds")
+            interval = SHEETS_POLL_SECONDS
+            if changed:
+                _gs_poll_state["last_change"] = _gs_poll_state["last_poll"]
+                logger.info(f"📊 Изменения в Google Sheets: {', '.join(changed)} — перезагружено")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _gs_poll_state["errors"] += 1
+            interval = min(interval * 2, _SHEETS_POLL_MAX_BACKOFF)
+            logger.error(f"Sheets poll error: {e} — следующий опрос через {interval:.0f} с")
+
+
+# ================== Lifespan ==================
+# Быстрый старт (FAST_START=1, по умолчанию): трафик обслуживается из локальных
+# JSON сразу после импорта, а настройка Telegram и загрузка из Google Sheets идут
+# параллельно в фоне. FAST_START=0 — старт ждёт окончания фоновой инициализации.
+FAST_START = (os.environ.get("FAST_START") or "1").strip().lower() not in ("0", "false", "no")
+_BOT_READY_TIMEOUT = 30.0
+
+_startup_state: dict = {
+    "ready": False,          # Telegram и Sheets инициализированы
+    "telegram": False,       # bot_app.initialize() выполнен
+    "webhook": False,        # set_webhook прошёл
+    "sheets": None,          # True — загружено из Sheets, False — работаем без них
+    "phases": {},            # длительности этапов старта, мс
+}
+_bot_ready = asyncio.Event()
+_startup_task: asyncio.Task | None = None
+_broadcast_task: asyncio.Task | None = None
+
+
+def _startup_phase(name: str, started: float) -> float:
+    """Записывает длительность этапа старта и возвращает текущее время."""
+    now = time.perf_counter()
+    _startup_state["phases"][name] = round((now - started) * 1000, 1)
+    return now
+
+
+def _reschedule_all() -> None:
+    """Пересоздаёт задачи напоминаний по текущим подпискам."""
+    if scheduler is None:
+        return
+    for job in scheduler.get_jobs():
+        if job.id.startswith("reminder:") and job.id.split(":", 1)[1] not in subscriptions:
+            scheduler.remove_job(job.id)
+    for user_id_str in list(subscriptions.keys()):
+        if user_id_str.lstrip("-").isdigit():
+            _reschedule_user(int(user_id_str))
+
+
+def _gs_hydrate() -> dict | None:
+    """Подключается к Sheets и читает все листы. Выполняется в отдельном потоке.
+    Возвращает {имя_листа: данные} или None, если Sheets не настроены / не подключились;
+    временные ошибки чтения (квота, 5xx) пробрасываются."""
+    if not _gs_connect():
+        return None
+    return _gs_load_all()
+
+
+async def _sheets_startup() -> None:
+    global _gs_hydrate_task
+    t = time.perf_counter()
+    try:
+        loaded = await asyncio.to_thread(_gs_hydrate)
+    except Exception as e:
+        # Sheets подключены, но не прочитаны (квота, 5xx): _gs_hydrated остаётся False,
+        # сохранения копятся в _gs_dirty_before_hydration, загрузка повторяется в фоне
+        logger.error(f"📊 Начальная загрузка из Google Sheets не удалась: {e} — повторим")
+        _startup_state["sheets"] = False
+        _gs_hydrate_task = asyncio.create_task(_gs_hydrate_retry())
+        return
+    t = _startup_phase("sheets_load", t)
+    await _sheets_apply(loaded, t)
+
+
+async def _gs_hydrate_retry() -> None:
+    """Повторяет начальную загрузку из Sheets с нарастающей паузой до успеха."""
+    global _gs_poll_task
+    delay = 10.0
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            loaded = await asyncio.to_thread(_gs_load_all)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            delay = min(delay * 2, _SHEETS_POLL_MAX_BACKOFF)
+            logger.error(f"📊 Загрузка из Google Sheets: {e} — следующая попытка через {delay:.0f} с")
+            continue
+        await _sheets_apply(loaded, time.perf_counter())
+        logger.info("📊 Google Sheets загружены после повтора")
+        if SHEETS_POLL_SECONDS > 0 and (_gs_poll_task is None or _gs_poll_task.done()):
+            _gs_poll_task = asyncio.create_task(_gs_poll_loop())
+        return
+
+
+async def _sheets_apply(loaded: dict | None, t: float) -> None:
+    global subscriptions, alice_profiles, _gs_hydrated
+    dirty = set(_gs_dirty_before_hydration)
+    _gs_dirty_before_hydration.clear()
+    _gs_hydrated = True
+    _startup_state["sheets"] = loaded is not None
+    if loaded is None:
+        return
+
+    # Листы, изменённые локально во время загрузки, не перетираем — отправляем в Sheets
+    push: list = []
+    applied: list[str] = []
+    gs_sched = loaded["schedule"]
+    if "schedule" in dirty:
+        push.append(_gs_save_schedule)
+    elif gs_sched:
+        _replace_schedule(base=gs_sched, source="sheets")
+        applied.append("schedule")
+        logger.info("📊 Основное расписание загружено из Google Sheets")
+        # Синхронизируем локальный файл
+        try:
+            tmp = "schedule.json.tmp"
+            with open(tmp, "w", encoding="utf-8") as _f:
+                json.dump(schedule, _f, ensure_ascii=False, indent=4)
+            os.replace(tmp, "schedule.json")
+        except Exception:
+            pass
+    else:
+        logger.info("📊 Google Sheets пуст — используем локальный schedule.json, загружаем в Sheets")
+        push.append(_gs_save_schedule)
+
+    if "temp_schedule" in dirty:
+        push.append(_gs_save_temp_schedule)
+    elif loaded["temp_schedule"] is not None:
+        _replace_schedule(temp=loaded["temp_schedule"], source="sheets")
+        applied.append("temp_schedule")
+        logger.info("📊 Временное расписание загружено из Google Sheets")
+
+    if "subscriptions" in dirty:
+        push.append(_gs_save_subscriptions)
+    elif loaded["subscriptions"] is not None:
+        subscriptions = loaded["subscriptions"]
+        applied.append("subscriptions")
+        logger.info("📊 Подписки загружены из Google Sheets")
+        _publish(SubscriptionChanged(None, "sheets", persist=False))
+
+    if "alice_profiles" in dirty:
+        push.append(_gs_save_alice_profiles)
+    elif loaded["alice_profiles"] is not None:
+        alice_profiles = loaded["alice_profiles"]
+        applied.append("alice_profiles")
+        logger.info("📊 Профили Алисы загружены из Google Sheets")
+
+    if "profiles" in dirty:
+        push.append(_gs_save_profiles)
+    elif loaded["profiles"]:
+        _set_profiles(loaded["profiles"])
+        applied.append("profiles")
+        _write_local_copy("profiles")
+        logger.info("📊 Профили загружены из Google Sheets")
+    elif loaded["profiles"] == []:
+        push.append(_gs_save_profiles)
+
+    for name in applied:
+        _state_publish(name)
+    for save_fn in push:
+        await asyncio.to_thread(save_fn)
+    _startup_phase("sheets_apply", t)
+
+
+async def _telegram_startup() -> None:
+    t = time.perf_counter()
+    await bot_app.initialize()
+    _startup_state["telegram"] = True
+    _bot_ready.set()
+    t = _startup_phase("telegram_init", t)
+    await bot_app.start()
+
+    async def _commands():
+        await bot_app.bot.set_my_commands(
+            [
+                BotCommand("start", "Запуск / приветствие"),
+                BotCommand("help", "Подсказки и помощь"),
+                BotCommand("edit_schedule", "Редактировать расписание"),
+                BotCommand("subscribe", "Ежедневное напоминание (HH:MM)"),
+                BotCommand("unsubscribe", "Отключить напоминания"),
+                BotCommand("chatid", "Узнать ID текущего чата"),
+                BotCommand("class", "Выбрать класс"),
+                BotCommand("calendar", "Расписание в календаре телефона"),
+                BotCommand("cancel", "Отменить редактирование"),
+            ]
+        )
+        # Сбрасываем Menu Button (кнопка под полем ввода) — используем /app вместо неё
+        try:
+            await bot_app.bot.delete_my_commands()
+        except Exception:
+            pass
+
+    async def _menu_button():
+        try:
+            await bot_app.bot.set_chat_menu_button()  # сброс на дефолт (без WebApp-кнопки)
+        except Exception:
+            pass
+
+    # Независимые вызовы Bot API — параллельно; set/delete_my_commands — по порядку
+    results = await asyncio.gather(
+        bot_app.bot.set_webhook(f"{BOT_URL.rstrip('/')}{WEBHOOK_PATH}"),
+        _commands(),
+        _menu_button(),
+        return_exceptions=True,
+    )
+    _startup_state["webhook"] = not isinstance(results[0], Exception)
+    for res in results:
+        if isinstance(res, Exception):
+            logger.error(f"Telegram setup error: {res}")
+    _startup_phase("telegram_setup", t)
+
+
+async def _background_startup(t_start: float) -> None:
+    results = await asyncio.gather(_telegram_startup(), _sheets_startup(), return_exceptions=True)
+    for res in results:
+        if isinstance(res, Exception):
+            logger.error(f"Startup error: {res}")
+    _startup_state["ready"] = _startup_state["telegram"]
+    global _gs_poll_task, _broadcast_task
+    if _startup_state["sheets"] and SHEETS_POLL_SECONDS > 0:
+        _gs_poll_task = asyncio.create_task(_gs_poll_loop())
+    if _startup_state["telegram"] and _is_leader():
+        _broadcast_task = asyncio.create_task(_broadcast_resume())
+    try:
+        _prewarm_caches()
+    except Exception as e:
+        logger.error(f"Prewarm error: {e}")
+    _startup_phase("background", t_start)
+    _startup_state["phases"]["total_since_import"] = round((time.perf_counter() - _IMPORT_T0) * 1000, 1)
+    phases = ", ".join(f"{k}={v}мс" for k, v in _startup_state["phases"].items())
+    logger.info(f"⏱ Этапы старта: {phases}")
+    print("✅ Webhook установлен, бот готов к работе")
+
 
-    # ── Расписание на сегодня ────────────────────────────────────────────────
-    if any(w in txt for w in [
-        "сегодня", "на сегодня", "today", "сейчас",
-        "что сегодня", "какие сегодня", "какое сегодня",
-    ]):
-        target = now.date()
-        if target.strftime("%A") == "Saturday":
-            return _alice_saturday_response(target, "today", saved_profile, session, alice_uid)
-        display, tts = _alice_day_text("today")
-        return _alice_resp(_alice_truncate(display, 1020), _alice_truncate(tts),
-                           session, buttons=_ALICE_MAIN_BUTTONS)
+# ── Прогрев ──
+# Раньше бот раз в 10 минут пинговал себя всегда. Теперь пинги привязаны к
+# пикам нагрузки, которые известны заранее:
+#   • reminders / evening — времена ежедневных напоминаний из подписок
+#     (evening — подписки «на завтра»);
+#   • school — самое раннее начало уроков сегодня среди всех классов.
+# За WARM_LEAD_MINUTES до пика прогреваются кэши (индексы уроков, HTML на
+# сегодня/завтра, тексты напоминаний по профилям подписчиков) и отправляется
+# пинг на «/», чтобы первый настоящий запрос не платил за холодный старт.
+# Между пиками инстанс держится бодрым, только пока следующий пик ближе
+# WARM_BRIDGE_MINUTES, и пинг уходит, лишь если WARM_IDLE_MINUTES не было ни
+# настоящих входящих запросов, ни нашего предыдущего пинга. После последнего пика хостинг может усыпить
+# процесс; для платформ, которые сами не просыпаются к утру, оставьте
+# WARM_BRIDGE_MINUTES больше ночного промежутка (по умолчанию 12 часов).
+WARM_LEAD_MINUTES = int(os.environ.get("WARM_LEAD_MINUTES") or 3)
+WARM_IDLE_MINUTES = int(os.environ.get("WARM_IDLE_MINUTES") or 10)
+WARM_BRIDGE_MINUTES = int(os.environ.get("WARM_BRIDGE_MINUTES") or 720)
+WARM_TICK_SECONDS = 60.0
+_WARM_HEADER = "x-warm-ping"
+
+_warm_state: dict = {
+    "last_inbound": time.monotonic(),
+    "last_ping_mono": 0.0,  # самопинг входящим не считается — интервал между пингами свой
+    "pings": 0,
+    "prewarms": 0,
+    "last_ping": None,      # {"at", "reason", "status"}
+    "next_peak": None,      # {"at", "kind"}
+}
+_warm_done: set[str] = set()   # пики (isoformat), перед которыми уже прогрели
+_warm_task: asyncio.Task | None = None
 
-    # ── Расписание на завтра ─────────────────────────────────────────────────
-    if any(w in txt for w in [
-        "завтра", "на завтра", "tomorrow",
-        "что завтра", "какие завтра", "какое завтра",
-    ]):
-        target = (now + timedelta(days=1)).date()
-        if target.strftime("%A") == "Saturday":
-            return _alice_saturday_response(target, "tomorrow", saved_profile, session, alice_uid)
-        display, tts = _alice_day_text("tomorrow")
-        return _alice_resp(_alice_truncate(display, 1020), _alice_truncate(tts),
-                           session, buttons=_ALICE_MAIN_BUTTONS)
 
-    # ── Общий запрос «расписание» → сегодня ─────────────────────────────────
-    if any(w in txt for w in ["расписание", "уроки", "занятия", "какие уроки"]):
-        target = now.date()
-        if target.strftime("%A") == "Saturday":
-            return _alice_saturday_response(target, "today", saved_profile, session, alice_uid)
-        display, tts = _alice_day_text("today")
-        return _alice_resp(_alice_truncate(display, 1020), _alice_truncate(tts),
-                           session, buttons=_ALICE_MAIN_BUTTONS)
+class _InboundTracker:
+    """ASGI-прослойка: время последнего настоящего (не самопинг) запроса."""
 
-    # ── Выбор конкретного профиля субботы (кнопка или голос) ─────────────────
-    sat_resp = _alice_try_saturday_profile(txt, session, alice_uid)
-    if sat_resp:
-        return sat_resp
+    def __init__(self, app):
+        self.app = app
 
-    # ── Приветствие / помощь ─────────────────────────────────────────────────
-    if is_new or not txt or txt in {"помощь", "help", "что ты умеешь"}:
-        return _alice_resp(_ALICE_HELP_TEXT, _ALICE_HELP_TEXT, session,
-                           buttons=_ALICE_MAIN_BUTTONS)
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not any(k == _WARM_HEADER.encode() for k, _ in scope["headers"]):
+            _warm_state["last_inbound"] = time.monotonic()
+        await self.app(scope, receive, send)
 
-    # ── Выход ────────────────────────────────────────────────────────────────
-    if any(w in txt for w in ["стоп", "выход", "хватит", "пока", "выйти"]):
-        msg = "До свидания! Удачи в учёбе!"
-        return _alice_resp(msg, msg, session, end_session=True)
 
-    # ── Не понял ─────────────────────────────────────────────────────────────
-    answer = "Не поняла запрос. " + _ALICE_HELP_TEXT
-    return _alice_resp(answer, answer, session, buttons=_ALICE_MAIN_BUTTONS)
+app.add_middleware(_InboundTracker)
 
 
-@app.post("/alice")
-async def alice_webhook(request: Request):
-    """Эндпоинт для навыка Яндекс Алисы. URL: https://<домен>/alice"""
-    try:
-        body = await request.json()
-    except Exception:
-        return JSONResponse({"error": "invalid json"}, status_code=400)
+def _warm_peaks(day: date) -> list[tuple[datetime, str]]:
+    """Пики нагрузки дня day: [(время, вид)], по возрастанию."""
+    minutes: dict[int, str] = {}
+    for entry in subscriptions.values():
+        if entry.get("notify_daily") is False:
+            continue
+        parsed = _parse_hhmm(entry.get("time", ""))
+        if parsed:
+            kind = "evening" if entry.get("day_type") == "tomorrow" else "reminders"
+            minutes.setdefault(parsed[0] * 60 + parsed[1], kind)
+    starts = []
+    for tenant_id in ("", *_tenants):
+        with _tenant_scope(tenant_id):
+            starts.extend(index.starts[0] for _, _, index in _lesson_indexes_for_date(day) if index.starts)
+    if starts:
+        minutes.setdefault(min(starts), "school")
+    tz = _get_tz()
+    return sorted(
+        (datetime(day.year, day.month, day.day, m // 60, m % 60, tzinfo=tz), kind)
+        for m, kind in minutes.items()
+    )
 
-    if ALICE_SKILL_ID:
-        incoming_skill_id = (body.get("session") or {}).get("skill_id", "")
-        if incoming_skill_id != ALICE_SKILL_ID:
-            logger.warning(f"Alice: неверный skill_id: {incoming_skill_id!r}")
-            return JSONResponse({"error": "forbidden"}, status_code=403)
 
+def _prewarm_caches(full: bool = False) -> int:
+    """Заполняет кэши чтения на сегодня и завтра для всех классов; full — ещё
+    неделю во всех видах WebApp и ICS-ленты. Возвращает число отрисовок."""
+    now = datetime.now(tz=_get_tz())
+    today, tomorrow = now.date(), (now + timedelta(days=1)).date()
+    profiles: dict[str, set] = {}
+    for chat_id, entry in subscriptions.items():
+        profiles.setdefault(_user_tenant(chat_id), {None}).add(entry.get("profile"))
+    day_types = ("today", "tomorrow", "week", "week_base", "saturday") if full else ("today", "tomorrow")
+    rendered = 0
+    for tenant_id in ("", *_tenants):
+        with _tenant_scope(tenant_id):
+            for d in (today, tomorrow):
+                _lesson_indexes_for_date(d)
+            for day_type in day_types:
+                _get_schedule_html_for_day_type(day_type)
+            tenant_profiles = profiles.get(tenant_id, {None})
+            for profile in tenant_profiles:
+                _render_reminder(today, "today", profile)
+                _render_reminder(tomorrow, "tomorrow", profile)
+            rendered += 2 + len(day_types) + 2 * len(tenant_profiles)
+            if full:
+                for profile in {"", *_current_profile_labels()}:
+                    _ics_feed(profile)
+                    rendered += 1
+    _warm_state["prewarms"] += 1
+    return rendered
+
+
+async def _warm_ping(reason: str) -> None:
+    status = None
     try:
-        response = _alice_handle_request(body)
+        resp = await _http_get(f"{BOT_URL.rstrip('/')}/", headers={_WARM_HEADER: "1"})
+        status = resp.status_code
     except Exception as e:
-        logger.exception(f"Alice handler error: {e}\nbody={json.dumps(body, ensure_ascii=False)[:500]}")
-        err_msg = "Произошла ошибка. Попробуйте позже."
-        response = _alice_resp(err_msg, err_msg, body.get("session") or {})
-
-    return JSONResponse(response)
+        logger.warning(f"[warm] ping error: {e}")
+    _warm_state["pings"] += 1
+    _warm_state["last_ping_mono"] = time.monotonic()
+    _warm_state["last_ping"] = {
+        "at": datetime.now(tz=_get_tz()).isoformat(timespec="seconds"),
+        "reason": reason,
+        "status": status,
+    }
 
 
-# ================== Lifespan ==================
-@app.on_event("startup")
-async def startup_event():
-    await bot_app.initialize()
-    await bot_app.bot.set_webhook(f"{BOT_URL.rstrip('/')}{WEBHOOK_PATH}")
-    await bot_app.bot.set_my_commands(
-        [
-            BotCommand("start", "Запуск / приветствие"),
-            BotCommand("help", "Подсказки и помощь"),
-            BotCommand("edit_schedule", "Редактировать расписание"),
-            BotCommand("subscribe", "Ежедневное напоминание (HH:MM)"),
-            BotCommand("unsubscribe", "Отключить напоминания"),
-            BotCommand("chatid", "Узнать ID текущего чата"),
-            BotCommand("cancel", "Отменить редактирование"),
-        ]
+async def _warm_tick() -> None:
+    now = datetime.now(tz=_get_tz())
+    peaks = [p for p in _warm_peaks(now.date()) + _warm_peaks((now + timedelta(days=1)).date()) if p[0] > now]
+    _warm_state["next_peak"] = (
+        {"at": peaks[0][0].isoformat(timespec="minutes"), "kind": peaks[0][1]} if peaks else None
     )
+    lead = timedelta(minutes=WARM_LEAD_MINUTES)
+    for at, kind in peaks:
+        if at - lead > now:
+            break
+        key = at.isoformat()
+        if key not in _warm_done:
+            _warm_done.difference_update([k for k in _warm_done if k < now.isoformat()])
+            _warm_done.add(key)
+            _prewarm_caches()
+            await _warm_ping(kind)
+            return
+    idle = time.monotonic() - max(_warm_state["last_inbound"], _warm_state["last_ping_mono"])
+    if (peaks and peaks[0][0] - now <= timedelta(minutes=WARM_BRIDGE_MINUTES)
+            and idle >= WARM_IDLE_MINUTES * 60):
+        await _warm_ping("bridge")
 
-    global scheduler, schedule
 
-    # ── Google Sheets: подключение и загрузка ────────────────────────────
-    if _gs_connect():
-        gs_sched = _gs_load_schedule()
-        if gs_sched:
-            schedule = gs_sched
-            logger.info("📊 Основное расписание загружено из Google Sheets")
-            # Синхронизируем локальный файл
-            try:
-                tmp = "schedule.json.tmp"
-                with open(tmp, "w", encoding="utf-8") as _f:
-                    json.dump(schedule, _f, ensure_ascii=False, indent=4)
-                os.replace(tmp, "schedule.json")
-            except Exception:
-                pass
-        else:
-            logger.info("📊 Google Sheets пуст — используем локальный schedule.json, загружаем в Sheets")
-            _gs_save_schedule()
-
-        gs_temp = _gs_load_temp_schedule()
-        if gs_temp is not None:
-            global temp_schedule
-            temp_schedule = gs_temp
-            logger.info("📊 Временное расписание загружено из Google Sheets")
-        
-        gs_subs = _gs_load_subscriptions()
-        if gs_subs is not None:
-            global subscriptions
-            subscriptions = gs_subs
-            logger.info("📊 Подписки загружены из Google Sheets")
-        gs_ap = _gs_load_alice_profiles()
-        if gs_ap is not None:
-            global alice_profiles
-            alice_profiles = gs_ap
-            logger.info("📊 Профили Алисы загружены из Google Sheets")
-    else:
-        # Fallback: локальные файлы
-        _load_temp_schedule_from_disk()
-        _load_subscriptions_from_disk()
-        _load_alice_profiles_from_disk()
+async def _warm_loop() -> None:
+    while True:
+        try:
+            await _warm_tick()
+        except Exception as e:
+            logger.error(f"[warm] tick error: {e}")
+        await asyncio.sleep(WARM_TICK_SECONDS)
 
-    scheduler = AsyncIOScheduler(timezone=_get_tz())
-    if _gs_spreadsheet is None:
-        _load_temp_schedule_from_disk()
-        _load_subscriptions_from_disk()
+
+@app.on_event("startup")
+async def startup_event():
+    global scheduler, _startup_task, _state_task, _warm_task
+    if PROFILE_ON_START > 0:
+        _profile_start(PROFILE_ON_START)
+    _startup_state["phases"]["import"] = round((time.perf_counter() - _IMPORT_T0) * 1000, 1)
+
+    # ── Локальные файлы: обслуживаем трафик сразу ─────────────────────────
+    t = time.perf_counter()
+    _load_profiles_from_disk()
+    _load_temp_schedule_from_disk()
+    _load_subscriptions_from_disk()
+    _load_alice_profiles_from_disk()
     _load_dynamic_admins()
-    for user_id_str in list(subscriptions.keys()):
-        if user_id_str.isdigit():
-            _reschedule_user(int(user_id_str))
-    scheduler.start()
+    _load_reminder_messages_from_disk()
+    _load_tenants_from_disk()
+    _load_user_tenants_from_disk()
+    await asyncio.to_thread(_audit_load_index)
+    _watch_start()
+    t = _startup_phase("local_load", t)
+
+    # ── Общее состояние и выбор лидера (STATE_BACKEND) ────────────────────
+    if _state_enabled():
+        _state_init()
+        _state_set_leader(_state_try_lease("scheduler", STATE_LEASE_SECONDS))
+        _state_task = asyncio.create_task(_state_sync_loop())
+        t = _startup_phase("state", t)
 
-    await bot_app.start()
-    # Сбрасываем Menu Button (кнопка под полем ввода) — используем /app вместо неё
-    try:
-        await bot_app.bot.delete_my_commands()
-    except Exception:
-        pass
-    try:
-        await bot_app.bot.set_chat_menu_button()  # сброс на дефолт (без WebApp-кнопки)
-    except Exception:
-        pass
-    print("✅ Webhook установлен, бот готов к работе")
+    scheduler = AsyncIOScheduler(timezone=_get_tz())
+    _reschedule_all()
+    scheduler.start(paused=not _is_leader())
+    t = _startup_phase("scheduler", t)
 
-    async def ping_self():
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            while True:
-                try:
-                    resp = await client.get(BOT_URL)
-                    print(f"[ping] {resp.status_code} {datetime.now().strftime('%H:%M:%S')}")
-                except Exception as e:
-                    print(f"[ping error] {e}")
-                await asyncio.sleep(600)
+    # ── Telegram и Google Sheets: параллельно в фоне ───────────────────────
+    if FAST_START:
+        _startup_task = asyncio.create_task(_background_startup(t))
+    else:
+        await _background_startup(t)
 
-    asyncio.create_task(ping_self())
+    _warm_task = asyncio.create_task(_warm_loop())
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    _journal_pending_notices()
+    _watch_stop()
+    if _reminder_messages_save_task is not None and not _reminder_messages_save_task.done():
+        _save_reminder_messages_to_disk()
+    if _state_writer_task is not None and not _state_writer_task.done():
+        await asyncio.wait({_state_writer_task}, timeout=10)
+    for task in (_startup_task, _gs_poll_task, _gs_hydrate_task, _state_task, _broadcast_task, _notice_task, _warm_task):
+        if task is not None and not task.done():
+            task.cancel()
+    if scheduler is not None and scheduler.running:
+        scheduler.shutdown(wait=False)
+    if _state_enabled():
+        try:
+            _state_release_lease("scheduler")
+        except Exception as e:
+            logger.error(f"Lease release error: {e}")
+    await _http_close()
+    if not _startup_state["telegram"]:
+        return
     await bot_app.stop()
     await bot_app.shutdown()
     print("🛑 Бот остановлен")
@@ -3137,6 +6344,69 @@ def root():
     return {"status": "Bot is running ✅"}
 
 
+# ── Проверки для деплоя ──
+# /healthz — процесс жив и цикл событий отвечает (для перезапуска контейнера).
+# /readyz — можно пускать трафик: Telegram инициализирован и вебхук выставлен,
+# планировщик запущен, Sheets (если настроены) загружены. 503, пока нет.
+# Остальное в ответе — для диагностики: задачи планировщика, очереди
+# несохранённого/неразосланного и заполненность кэшей (кэши сбрасываются при
+# каждой правке, поэтому на готовность они не влияют; прогреть — /api/admin/warmup).
+@app.get("/healthz")
+def healthz():
+    return {"ok": True}
+
+
+def _readiness() -> dict:
+    sheets_configured = bool(GOOGLE_SHEET_ID and _GCREDS_JSON_RAW)
+    today = datetime.now(tz=_get_tz()).date().isoformat()
+    checks = {
+        "telegram": _startup_state["telegram"],
+        "webhook": _startup_state["webhook"],
+        "scheduler": scheduler is not None and scheduler.running,
+        "sheets": _startup_state["sheets"] is True if sheets_configured else True,
+    }
+    return {
+        "ready": all(checks.values()),
+        "checks": checks,
+        "sheets": {
+            "configured": sheets_configured,
+            "connected": _gs_spreadsheet is not None,
+            "loaded": _startup_state["sheets"],
+        },
+        "scheduler": {
+            "jobs": len(scheduler.get_jobs()) if scheduler is not None else 0,
+            "paused": scheduler is not None and scheduler.state == STATE_PAUSED,
+            "leader": _is_leader(),
+        },
+        "queues": {
+            "change_notices": len(_pending_notices),
+            "sheets_dirty": len(_gs_dirty_before_hydration),
+            "reminder_messages_save": int(
+                _reminder_messages_save_task is not None and not _reminder_messages_save_task.done()
+            ),
+        },
+        "events": {
+            "published": dict(sorted(_event_stats.items())),
+            "pending_tasks": len(_event_tasks),
+        },
+        "caches": {
+            "schedule_version": _snapshot.version,
+            "today_warm": ("", "today", today) in _schedule_html_cache,
+            "html": len(_schedule_html_cache),
+            "reminders": len(_reminder_cache),
+            "lesson_index": len(_lesson_index_cache),
+            "ics_feeds": len(_ics_feed_cache),
+            "prewarms": _warm_state["prewarms"],
+        },
+    }
+
+
+@app.get("/readyz")
+def readyz():
+    state = _readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
 WEBAPP_HTML = """<!DOCTYPE html>
 <html lang="ru">
 <head>
@@ -3692,6 +6962,17 @@ WEBAPP_HTML = """<!DOCTYPE html>
       overflow-y: auto;
       padding: 10px 12px;
     }
+    .week-diag {
+      max-height: 30vh;
+      overflow-y: auto;
+      padding: 6px 12px;
+      font-size: 12px;
+      border-top: 1px solid rgba(0,0,0,0.08);
+      background: var(--tg-theme-secondary-bg-color, #f5f5f5);
+    }
+    .week-diag div { padding: 3px 0; cursor: pointer; }
+    .week-diag .diag-error { color: #d93025; }
+    .week-diag .diag-warning { color: #b06000; }
     .editor-textarea {
       flex: 1;
       width: 100%;
@@ -3863,6 +7144,12 @@ WEBAPP_HTML = """<!DOCTYPE html>
               </select>
             </div>
           </div>
+          <div class="sub-field" style="margin-top:10px;">
+            <label class="sub-label">Профиль в субботу</label>
+            <select id="sub-profile" class="sub-input">
+              <option value="">Все профили</option>
+            </select>
+          </div>
         </div>
       </div>
       <!-- Уведомления об изменениях -->
@@ -4005,6 +7292,7 @@ WEBAPP_HTML = """<!DOCTYPE html>
         <button id="admin-week-load" class="secondary" style="font-size:12px;padding:6px 10px;">📥 Загрузить</button>
       </div>
       <textarea id="admin-week-text" class="editor-textarea" placeholder="Понедельник:&#10;08:00-08:40 Математика/211&#10;&#10;Вторник:&#10;08:00-08:40 Русский яз./305"></textarea>
+      <div id="admin-week-diag" class="week-diag hidden"></div>
       <div class="editor-bottombar">
         <button id="admin-week-save" style="flex:1;">Сохранить неделю</button>
       </div>
@@ -4280,7 +7568,9 @@ WEBAPP_HTML = """<!DOCTYPE html>
         });
         const data = await res.json();
         if (!data.ok) {
-          throw new Error(data.error || 'Ошибка запроса');
+          const err = new Error(data.error || 'Ошибка запроса');
+          err.data = data;  // тело ответа — например, diagnostics при bad_format
+          throw err;
         }
         return data;
       } catch (e) {
@@ -4293,6 +7583,13 @@ WEBAPP_HTML = """<!DOCTYPE html>
     async function loadMe() {
       setStatus('Загрузка данных пользователя...');
       const data = await api('/api/me', {});
+      const subProfile = document.getElementById('sub-profile');
+      (data.saturday_profiles || []).forEach(p => {
+        const opt = document.createElement('option');
+        opt.value = p.key;
+        opt.textContent = p.label;
+        subProfile.appendChild(opt);
+      });
       renderSubState(data.subscription || null);
       isAdmin = !!data.is_admin;
       isSuperAdmin = !!data.is_superadmin;
@@ -4352,6 +7649,7 @@ WEBAPP_HTML = """<!DOCTYPE html>
       const dailyDesc    = document.getElementById('sub-daily-desc');
       const subTime      = document.getElementById('sub-time');
       const subDayType   = document.getElementById('sub-day-type');
+      const subProfile   = document.getElementById('sub-profile');
 
       setToggle(dailyToggle, dailyKnob, subDailyOn);
       setToggle(changesToggle, changesKnob, subChangesOn);
@@ -4363,6 +7661,7 @@ WEBAPP_HTML = """<!DOCTYPE html>
         dailyDesc.textContent = 'Каждый день в ' + sub.time + ' — ' + dl;
         if (subTime) subTime.value = sub.time || '07:00';
         if (subDayType) subDayType.value = sub.day_type || 'today';
+        if (subProfile) subProfile.value = sub.profile || '';
       } else {
         dailyDesc.textContent = 'Выключено';
         if (!subTime.value) subTime.value = '07:00';
@@ -4373,7 +7672,8 @@ WEBAPP_HTML = """<!DOCTYPE html>
       subDailyOn = !subDailyOn;
       const sub = { notify_daily: subDailyOn, notify_changes: subChangesOn,
                     time: document.getElementById('sub-time').value || '07:00',
-                    day_type: document.getElementById('sub-day-type').value || 'today' };
+                    day_type: document.getElementById('sub-day-type').value || 'today',
+                    profile: document.getElementById('sub-profile').value };
       renderSubState(sub);
     }
 
@@ -4381,17 +7681,19 @@ WEBAPP_HTML = """<!DOCTYPE html>
       subChangesOn = !subChangesOn;
       const sub = { notify_daily: subDailyOn, notify_changes: subChangesOn,
                     time: document.getElementById('sub-time').value || '07:00',
-                    day_type: document.getElementById('sub-day-type').value || 'today' };
+                    day_type: document.getElementById('sub-day-type').value || 'today',
+                    profile: document.getElementById('sub-profile').value };
       renderSubState(sub);
     }
 
     async function saveSubscription() {
       const time    = document.getElementById('sub-time').value || '07:00';
       const dayType = document.getElementById('sub-day-type').value || 'today';
+      const profile = document.getElementById('sub-profile').value;
       setStatus('Сохранение подписок...');
       const res = await api('/api/subscribe', {
         notify_daily: subDailyOn, notify_changes: subChangesOn,
-        time, day_type: dayType
+        time, day_type: dayType, profile
       });
       setStatus(subDailyOn || subChangesOn ? 'Подписки сохранены' : 'Подписки отключены');
       renderSubState(res.subscription || null);
@@ -4406,8 +7708,43 @@ WEBAPP_HTML = """<!DOCTYPE html>
       setStatus('Подписки отключены');
     }
 
+    // Подсветка замечаний парсера: клик по замечанию выделяет строку в редакторе
+    function renderWeekDiagnostics(diagnostics) {
+      const box = document.getElementById('admin-week-diag');
+      box.innerHTML = '';
+      (diagnostics || []).forEach(d => {
+        const item = document.createElement('div');
+        item.className = d.level === 'error' ? 'diag-error' : 'diag-warning';
+        item.textContent = (d.level === 'error' ? '❌' : '⚠️') + ' Строка ' + d.line + ': ' + d.message;
+        item.onclick = () => {
+          const lines = adminWeekText.value.split('\\n');
+          const start = lines.slice(0, d.line - 1).reduce((n, l) => n + l.length + 1, 0);
+          adminWeekText.focus();
+          adminWeekText.setSelectionRange(start, start + (lines[d.line - 1] || '').length);
+        };
+        box.appendChild(item);
+      });
+      box.classList.toggle('hidden', !(diagnostics || []).length);
+    }
+
     async function saveAdminWeek() {
       const text = adminWeekText.value || '';
+      setStatus('Проверка расписания...');
+      let check;
+      try {
+        check = await api('/api/admin/week', { week_text: text, mode: adminType, dry_run: true });
+      } catch (e) {
+        // 400 bad_format: разбор не удался, но замечания по строкам пришли в теле ответа
+        if (!e.data || e.data.error !== 'bad_format') throw e;
+        check = e.data;
+      }
+      renderWeekDiagnostics(check.diagnostics);
+      if (!check.ok || (check.diagnostics || []).some(d => d.level === 'error')) {
+        setStatus((check.diagnostics || []).length
+          ? 'В расписании есть ошибки — исправь отмеченные строки'
+          : 'Не удалось разобрать расписание', true);
+        return;
+      }
       setStatus('Сохранение расписания на неделю...');
       await api('/api/admin/week', { week_text: text, mode: adminType });
       setStatus('Расписание обновлено');
@@ -4714,7 +8051,10 @@ async def api_me(request: Request):
         return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
     user_id = int(user["id"])
     sub = subscriptions.get(str(user_id))
-    sat_profiles = _nearest_saturday_profiles()
+    tenant_id = _user_tenant(user_id)
+    with _tenant_scope(tenant_id):
+        sat_profiles = _nearest_saturday_profiles()
+        profiles = _current_profiles()
     has_saturday = bool(sat_profiles)
     has_saturday_profiles = False
     if sat_profiles:
@@ -4731,6 +8071,8 @@ async def api_me(request: Request):
             "subscription": sub,
             "has_saturday": has_saturday,
             "has_saturday_profiles": has_saturday_profiles,
+            "saturday_profiles": [{"key": k, "label": label} for k, label in profiles],
+            "tenant": {"id": tenant_id, "title": _tenant_title(tenant_id)},
         }
     )
 
@@ -4748,10 +8090,52 @@ async def api_schedule(request: Request):
     if not user:
         return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
     day_type = data.get("type", "today")
-    html_text = _get_schedule_html_for_day_type(day_type)
+    with _tenant_scope(_user_tenant(user["id"])):
+        html_text = _get_schedule_html_for_day_type(day_type)
     return JSONResponse({"ok": True, "html": html_text})
 
 
+@app.post("/api/now")
+async def api_now(request: Request):
+    """Текущий и следующий урок. profile — ключ профиля; по умолчанию берётся
+    профиль из подписки пользователя, без него — все профили дня."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        init_data = data.get("init_data", "")
+        user = _get_user_from_init_data(init_data)
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    profile = data.get("profile")
+    if profile is None:
+        profile = (subscriptions.get(str(user["id"])) or {}).get("profile")
+    now = datetime.now(tz=_get_tz())
+    with _tenant_scope(_user_tenant(user["id"])):
+        status = _now_status(now, profile or None)
+        text = _format_now_text(status)
+    return JSONResponse({
+        "ok": True,
+        "date": now.date().isoformat(),
+        "time": now.strftime("%H:%M"),
+        "items": [
+            {
+                "profile": item["profile"],
+                "label": item["label"],
+                "current": _now_lesson_json(item["current"]),
+                "next": _now_lesson_json(item["next"]),
+                "minutes_left": item["minutes_left"],
+                "minutes_to_next": item["minutes_to_next"],
+                "finished": item["finished"],
+            }
+            for item in status
+        ],
+        "text": text,
+    })
+
+
 @app.post("/api/subscribe")
 async def api_subscribe(request: Request):
     data = await request.json()
@@ -4783,22 +8167,22 @@ async def api_subscribe(request: Request):
         entry["time"] = f"{hh:02d}:{mm:02d}"
         day_type = data.get("day_type", entry.get("day_type", "today"))
         entry["day_type"] = day_type if day_type in {"today", "tomorrow"} else "today"
+        if "profile" in data:
+            profile = (data.get("profile") or "").strip()
+            with _tenant_scope(_user_tenant(user_id)):
+                known = profile in _current_profile_labels()
+            if profile and not known:
+                return JSONResponse({"ok": False, "error": "bad_profile"}, status_code=400)
+            if profile:
+                entry["profile"] = profile
+            else:
+                entry.pop("profile", None)
 
     if not notify_daily and not notify_changes:
         subscriptions.pop(uid, None)
-        if scheduler is not None:
-            try: scheduler.remove_job(_job_id_for(user_id))
-            except Exception: pass
     else:
         subscriptions[uid] = entry
-        if notify_daily:
-            _reschedule_user(user_id)
-        else:
-            if scheduler is not None:
-                try: scheduler.remove_job(_job_id_for(user_id))
-                except Exception: pass
-
-    _save_subscriptions_to_disk()
+    _publish(SubscriptionChanged(user_id, "webapp"))
     return JSONResponse({"ok": True, "subscription": subscriptions.get(uid)})
 
 
@@ -4816,12 +8200,7 @@ async def api_unsubscribe(request: Request):
         return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
     user_id = int(user["id"])
     subscriptions.pop(str(user_id), None)
-    _save_subscriptions_to_disk()
-    if scheduler is not None:
-        try:
-            scheduler.remove_job(_job_id_for(user_id))
-        except Exception:
-            pass
+    _publish(SubscriptionChanged(user_id, "webapp"))
     return JSONResponse({"ok": True})
 
 
@@ -4840,11 +8219,15 @@ async def api_admin_week(request: Request):
     user_id = int(user["id"])
     if not _is_admin_user_id(user_id):
         return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+    _current_actor.set(user_id)
     week_text = data.get("week_text", "") or ""
     mode = (data.get("mode") or "base").strip()
-    week = _parse_week_from_text(week_text)
+    week, diagnostics = _parse_schedule_text(week_text)
     if week is None:
-        return JSONResponse({"ok": False, "error": "bad_format"}, status_code=400)
+        return JSONResponse({"ok": False, "error": "bad_format", "diagnostics": diagnostics}, status_code=400)
+    if data.get("dry_run"):
+        # Только проверка — WebApp подсвечивает строки с замечаниями до сохранения
+        return JSONResponse({"ok": True, "diagnostics": diagnostics})
 
     if mode == "temp":
         # Временная неделя: применяем к текущей неделе (пн-вс)
@@ -4852,6 +8235,7 @@ async def api_admin_week(request: Request):
         base_monday_idx = 0
         today_idx = now_tz.weekday()
         monday = (now_tz - timedelta(days=today_idx - base_monday_idx)).date()
+        updates = {}
         for offset, d_name in enumerate(SCHEDULE_DAYS):
             if d_name not in week:
                 continue
@@ -4859,30 +8243,28 @@ async def api_admin_week(request: Request):
             key = target_date.isoformat()
             day_lessons = week[d_name]
             if isinstance(day_lessons, list):
-                temp_schedule[key] = day_lessons
+                updates[key] = day_lessons
+        old = _snapshot
         try:
-            _save_temp_schedule_to_disk()
+            _set_temp_days(updates, source="admin")
         except Exception as e:
             return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
-        week_html = _format_week_text()
-        msg = _truncate_message("📢 Временное расписание на неделю обновлено:\n\n" + week_html)
-        asyncio.create_task(_notify_subscribers(msg))
+        week_dates = [
+            (monday + timedelta(days=offset)).isoformat()
+            for offset, d_name in enumerate(SCHEDULE_DAYS) if d_name in week
+        ]
+        _queue_diff_notice(f"temp:week:{monday.isoformat()}", "📢 Временное расписание на неделю обновлено:", old,
+                           week_dates, [f"temp:{k}" for k in week_dates] + [f"temp:{k}:" for k in week_dates])
     else:
-        for d in SCHEDULE_DAYS:
-            if d in week:
-                schedule[d] = week[d]
+        old = _snapshot
         try:
-            _save_schedule_to_disk()
+            _set_base_days({d: week[d] for d in SCHEDULE_DAYS if d in week}, source="admin")
         except Exception as e:
             return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
-        week_html = "\n\n".join(
-            _format_day_table_html(d, schedule.get(d, []))
-            for d in SCHEDULE_DAYS
-            if d in schedule
-        ) or _format_day_table_html("Неделя", [])
-        msg = _truncate_message("📢 Обновлено расписание на неделю:\n\n" + week_html)
-        asyncio.create_task(_notify_subscribers(msg))
-    return JSONResponse({"ok": True})
+        _queue_diff_notice("base:week", "📢 Обновлено расписание на неделю:", old,
+                           [d for d in SCHEDULE_DAYS if d in week],
+                           [f"base:{d}:" if d == "Суббота" else f"base:{d}" for d in week])
+    return JSONResponse({"ok": True, "diagnostics": diagnostics})
 
 
 @app.post("/api/admin/day")
@@ -4900,50 +8282,289 @@ async def api_admin_day(request: Request):
     user_id = int(user["id"])
     if not _is_admin_user_id(user_id):
         return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
-
-    day = (data.get("day") or "").strip()
-    if day not in SCHEDULE_DAYS:
-        return JSONResponse({"ok": False, "error": "bad_day"}, status_code=400)
-
-    mode = (data.get("mode") or "base").strip()
-    lessons_text = data.get("lessons_text", "") or ""
-    lessons = _parse_lessons_from_text(lessons_text)
-    if lessons is None:
-        return JSONResponse({"ok": False, "error": "bad_format"}, status_code=400)
-
-    if mode == "temp":
-        date_str = (data.get("date") or "").strip()
-        if date_str:
-            try:
-                d = datetime.fromisoformat(date_str).date()
-            except ValueError:
-                return JSONResponse({"ok": False, "error": "bad_date"}, status_code=400)
-        else:
-            # если дата не указана — берём текущую неделю и соответствующий день
-            now_tz = datetime.now(tz=_get_tz())
-            today_idx = now_tz.weekday()
-            target_idx = SCHEDULE_DAYS.index(day)
-            delta = target_idx - today_idx
-            d = (now_tz + timedelta(days=delta)).date()
-        key = d.isoformat()
-        temp_schedule[key] = lessons
-        try:
-            _save_temp_schedule_to_disk()
-        except Exception as e:
-            return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
-        label = f"{d.strftime('%d.%m.%Y')} ({DAY_MAP.get(d.strftime('%A'), d.strftime('%A'))})"
-        msg = "📢 Временное расписание обновлено:\n\n" + _format_day_table_html(label, lessons)
-        asyncio.create_task(_notify_subscribers(_truncate_message(msg)))
-    else:
-        schedule[day] = lessons
-        try:
-            _save_schedule_to_disk()
-        except Exception as e:
-            return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
-        msg = "📢 Обновлено расписание:\n\n" + _format_day_table_html(day, lessons)
-        asyncio.create_task(_notify_subscribers(_truncate_message(msg)))
-
-    return JSONResponse({"ok": True})
+    _current_actor.set(user_id)
+
+    day = (data.get("day") or "").strip()
+    if day not in SCHEDULE_DAYS:
+        return JSONResponse({"ok": False, "error": "bad_day"}, status_code=400)
+
+    mode = (data.get("mode") or "base").strip()
+    lessons_text = data.get("lessons_text", "") or ""
+    lessons = _parse_lessons_from_text(lessons_text)
+    if lessons is None:
+        return JSONResponse({"ok": False, "error": "bad_format"}, status_code=400)
+
+    if mode == "temp":
+        date_str = (data.get("date") or "").strip()
+        if date_str:
+            try:
+                d = datetime.fromisoformat(date_str).date()
+            except ValueError:
+                return JSONResponse({"ok": False, "error": "bad_date"}, status_code=400)
+        else:
+            # если дата не указана — берём текущую неделю и соответствующий день
+            now_tz = datetime.now(tz=_get_tz())
+            today_idx = now_tz.weekday()
+            target_idx = SCHEDULE_DAYS.index(day)
+            delta = target_idx - today_idx
+            d = (now_tz + timedelta(days=delta)).date()
+        key = d.isoformat()
+        old = _snapshot
+        try:
+            _set_temp_days({key: lessons}, source="admin")
+        except Exception as e:
+            return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+        _queue_diff_notice(f"temp:{key}", "📢 Временное расписание обновлено:", old, [key])
+    else:
+        old = _snapshot
+        try:
+            _set_base_days({day: lessons}, source="admin")
+        except Exception as e:
+            return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+        _queue_diff_notice(f"base:{day}", "📢 Обновлено расписание:", old, [day])
+
+    return JSONResponse({"ok": True})
+
+
+# ── Массовый импорт временного расписания ──
+# Перед каникулами и сессией замены задаются сразу на весь период:
+#   • диапазоном start..end — каждой дате достаётся её день недели из week_text
+#     или одни и те же уроки lessons_text («пусто» — выходные, по умолчанию);
+#     clear=true убирает замены в диапазоне;
+#   • списком entries (JSON): [{"date", "lessons" | "lessons_text", "profile"?}]
+#     или {дата: уроки | {профиль: уроки}};
+#   • текстом csv: строки «дата;урок» или «дата;профиль;урок», по строке на урок
+#     (пустой урок — день без уроков, первая строка может быть заголовком).
+# Всё применяется одним снимком, одним сохранением и одним уведомлением.
+# Ошибки возвращаются в том же виде, что у парсера недели: {line, level, message},
+# где line — номер строки csv / записи entries (0 — параметры запроса).
+TEMP_BULK_MAX_DATES = int(os.environ.get("TEMP_BULK_MAX_DATES") or 400)
+
+
+def _bulk_parse_date(value) -> date | None:
+    s = str(value or "").strip()
+    try:
+        return date.fromisoformat(s)
+    except ValueError:
+        return _parse_date_str(s)
+
+
+def _bulk_lessons(value) -> list[str] | None:
+    """Уроки одной записи: текст или список строк; пусто — день без уроков."""
+    if isinstance(value, list):
+        if not all(isinstance(x, str) for x in value):
+            return None
+        value = "\n".join(value)
+    if not isinstance(value, str):
+        return None
+    return _parse_lessons_from_text(value) if value.strip() else []
+
+
+def _bulk_profile_key(value) -> str | None:
+    s = str(value or "").strip()
+    key = SATURDAY_LABEL_TO_KEY.get(s, s)
+    return key if key in SATURDAY_PROFILE_LABELS else None
+
+
+def _bulk_collect(data: dict) -> tuple[dict, list[dict]]:
+    """Собирает из запроса замены {дата ISO: уроки | {профиль: уроки} | None}."""
+    diagnostics: list[dict] = []
+    # (номер строки, дата, профиль или None, уроки или None — убрать замену)
+    items: list[tuple[int, date, str | None, list[str] | None]] = []
+
+    def error(line: int, message: str) -> None:
+        diagnostics.append({"line": line, "level": "error", "message": message})
+
+    if data.get("start") or data.get("end"):
+        d1 = _bulk_parse_date(data.get("start"))
+        d2 = _bulk_parse_date(data.get("end") or data.get("start"))
+        week_text = data.get("week_text") or ""
+        week = None
+        lessons = []
+        if d1 is None or d2 is None or d2 < d1:
+            error(0, "неверный диапазон дат")
+        elif (d2 - d1).days >= TEMP_BULK_MAX_DATES:
+            error(0, f"диапазон длиннее {TEMP_BULK_MAX_DATES} дней")
+        elif week_text.strip():
+            week, week_diag = _parse_schedule_text(week_text)
+            diagnostics.extend(week_diag)
+            if week is None:
+                error(0, "в week_text не найдено ни одного дня")
+        else:
+            lessons = _bulk_lessons(data.get("lessons_text") or "")
+        if not any(x["level"] == "error" for x in diagnostics):
+            d = d1
+            while d <= d2:
+                day_name = SCHEDULE_DAYS[d.weekday()]
+                if data.get("clear"):
+                    items.append((0, d, None, None))
+                elif week is not None:
+                    if day_name in week:
+                        items.append((0, d, None, week[day_name]))
+                elif day_name != "Воскресенье":
+                    items.append((0, d, None, lessons))
+                d += timedelta(days=1)
+
+    entries = data.get("entries")
+    if isinstance(entries, dict):
+        entries = [{"date": k, "lessons": v} for k, v in entries.items()]
+    if entries is not None and not isinstance(entries, list):
+        error(0, "entries: ожидается список или объект")
+        entries = []
+    for n, entry in enumerate(entries or [], start=1):
+        if not isinstance(entry, dict):
+            error(n, "ожидается объект {date, lessons}")
+            continue
+        d = _bulk_parse_date(entry.get("date"))
+        if d is None:
+            error(n, f"неверная дата {entry.get('date')!r}")
+            continue
+        value = entry.get("lessons", entry.get("lessons_text", ""))
+        if isinstance(value, dict):
+            groups = list(value.items())
+        else:
+            groups = [(entry.get("profile"), value)]
+        for profile, raw in groups:
+            pk = None
+            if profile:
+                pk = _bulk_profile_key(profile)
+                if pk is None:
+                    error(n, f"неизвестный профиль {profile!r}")
+                    continue
+            lessons = _bulk_lessons(raw)
+            if lessons is None:
+                error(n, "уроки: ожидается текст или список строк")
+                continue
+            items.append((n, d, pk, lessons))
+
+    csv_text = data.get("csv") or ""
+    if csv_text.strip():
+        first = csv_text.lstrip().split("\n", 1)[0]
+        delimiter = ";" if first.count(";") >= first.count(",") else ","
+        rows: dict[tuple[date, str | None], tuple[int, list[str]]] = {}
+        reader = csv.reader(io.StringIO(csv_text.strip()), delimiter=delimiter)
+        for row in reader:
+            n = reader.line_num
+            cells = [c.strip() for c in row]
+            if not any(cells):
+                continue
+            d = _bulk_parse_date(cells[0])
+            if d is None:
+                if n > 1:
+                    error(n, f"неверная дата {cells[0]!r}")
+                continue
+            pk = None
+            if len(cells) >= 3:
+                if cells[1]:
+                    pk = _bulk_profile_key(cells[1])
+                    if pk is None:
+                        error(n, f"неизвестный профиль {cells[1]!r}")
+                        continue
+                lesson = delimiter.join(cells[2:]).strip()
+            else:
+                lesson = cells[1] if len(cells) > 1 else ""
+            _, lines = rows.setdefault((d, pk), (n, []))
+            if lesson:
+                lines.append(lesson)
+        for (d, pk), (n, lines) in rows.items():
+            items.append((n, d, pk, _parse_lessons_from_text("\n".join(lines)) if lines else []))
+
+    updates: dict = {}
+    for n, d, pk, lessons in items:
+        key = d.isoformat()
+        if pk is None:
+            updates[key] = lessons
+            continue
+        day = SCHEDULE_DAYS[d.weekday()]
+        if day not in _profile_set.days:
+            error(n, f"{d.strftime('%d.%m.%Y')}: в этот день профилей нет")
+            continue
+        current = updates.get(key, _snapshot.temp.get(key))
+        if not isinstance(current, dict):
+            # остальные профили — из основного расписания, как при правке одного профиля
+            day_base = _snapshot.base.get(day)
+            base_dict = day_base if isinstance(day_base, dict) else {}
+            current = {k: list(base_dict.get(k, [])) for k in SATURDAY_PROFILE_KEYS}
+        updates[key] = {**current, pk: lessons}
+    if len(updates) > TEMP_BULK_MAX_DATES:
+        error(0, f"больше {TEMP_BULK_MAX_DATES} дат за один импорт")
+    return updates, diagnostics
+
+
+def _bulk_notice_text(updates: dict) -> str:
+    """Одно сводное уведомление об импорте: таблицы, если дат немного, иначе список."""
+    keys = sorted(updates)
+    first, last = date.fromisoformat(keys[0]), date.fromisoformat(keys[-1])
+    period = first.strftime("%d.%m.%Y")
+    if last != first:
+        period = f"{first.strftime('%d.%m')}–{last.strftime('%d.%m.%Y')}"
+    head = f"📢 Временное расписание на {period} обновлено ({len(keys)} дн.):\n\n"
+    parts = []
+    for key in keys:
+        d = date.fromisoformat(key)
+        label = f"{d.strftime('%d.%m.%Y')} ({DAY_MAP.get(d.strftime('%A'), d.strftime('%A'))})"
+        value = updates[key]
+        if len(keys) <= 7:
+            if value is None:
+                parts.append(f"<b>{html.escape(label)}</b>: по основному расписанию")
+            elif isinstance(value, dict):
+                parts.extend(
+                    _format_day_table_html(f"{label} — {SATURDAY_PROFILE_LABELS.get(pk, pk)}", lessons)
+                    for pk, lessons in value.items()
+                )
+            else:
+                parts.append(_format_day_table_html(label, value))
+        else:
+            if value is None:
+                note = "по основному расписанию"
+            elif isinstance(value, dict):
+                note = "по профилям"
+            else:
+                note = f"{len(value)} ур." if value else "без уроков"
+            parts.append(f"• {html.escape(label)} — {note}")
+    sep = "\n\n" if len(keys) <= 7 else "\n"
+    return _truncate_message(head + sep.join(parts))
+
+
+@app.post("/api/admin/temp_bulk")
+async def api_admin_temp_bulk(request: Request):
+    """Массовый импорт временного расписания (диапазон дат, entries или csv)."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        init_data = data.get("init_data", "")
+        user = _get_user_from_init_data(init_data)
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    user_id = int(user["id"])
+    if not _is_admin_user_id(user_id):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+    _current_actor.set(user_id)
+
+    updates, diagnostics = _bulk_collect(data)
+    if any(x["level"] == "error" for x in diagnostics):
+        return JSONResponse({"ok": False, "error": "bad_format", "diagnostics": diagnostics}, status_code=400)
+    if not updates:
+        return JSONResponse({"ok": False, "error": "empty", "diagnostics": diagnostics}, status_code=400)
+    dates = sorted(updates)
+    if data.get("dry_run"):
+        return JSONResponse({"ok": True, "dates": dates, "diagnostics": diagnostics})
+
+    # Один снимок, одно сохранение (файл + Sheets) и одно уведомление на весь импорт
+    try:
+        _set_temp_days(updates, source="bulk")
+    except Exception as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+    _queue_change_notice(
+        f"temp:bulk:{dates[0]}:{dates[-1]}",
+        _bulk_notice_text(updates),
+        [f"temp:{k}" for k in dates] + [f"temp:{k}:" for k in dates],
+    )
+    logger.info(f"📥 Массовый импорт замен: {len(dates)} дат ({dates[0]} — {dates[-1]}), admin {user_id}")
+    return JSONResponse({"ok": True, "dates": dates, "diagnostics": diagnostics})
 
 
 @app.post("/api/admin/sat_profile_get")
@@ -5001,6 +8622,7 @@ async def api_admin_sat_profile(request: Request):
     user_id = int(user["id"])
     if not _is_admin_user_id(user_id):
         return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+    _current_actor.set(user_id)
 
     profile_key = (data.get("profile") or "").strip()
     if profile_key not in SATURDAY_PROFILE_KEYS:
@@ -5012,8 +8634,7 @@ async def api_admin_sat_profile(request: Request):
     if lessons is None:
         return JSONResponse({"ok": False, "error": "bad_format"}, status_code=400)
 
-    label = SATURDAY_PROFILE_LABELS.get(profile_key, profile_key)
-
+    old = _snapshot
     if mode == "temp":
         date_str = (data.get("date") or "").strip()
         if not date_str:
@@ -5023,30 +8644,12 @@ async def api_admin_sat_profile(request: Request):
         except ValueError:
             return JSONResponse({"ok": False, "error": "bad_date"}, status_code=400)
         key = d.isoformat()
-        existing = temp_schedule.get(key)
-        if isinstance(existing, dict):
-            existing[profile_key] = lessons
-        else:
-            # Инициализируем все профили из основного расписания
-            sat_base = schedule.get("Суббота")
-            base_dict = sat_base if isinstance(sat_base, dict) else {}
-            new_dict = {pk: list(base_dict.get(pk, [])) for pk in SATURDAY_PROFILE_KEYS}
-            new_dict[profile_key] = lessons
-            temp_schedule[key] = new_dict
-        _save_temp_schedule_to_disk()
-        msg = f"📢 Временное расписание субботы ({d.strftime('%d.%m.%Y')}) — {label} обновлено:\n\n"
-        msg += _format_day_table_html(label, lessons)
+        # Если замены на эту дату ещё нет — остальные профили берём из основного расписания
+        _set_temp_saturday_profiles(key, {profile_key: lessons}, seed_from_base=True, source="admin")
+        _queue_diff_notice(f"temp:{key}:{profile_key}", "📢 Временное расписание обновлено:", old, [key])
     else:
-        sat = schedule.get("Суббота")
-        if not isinstance(sat, dict):
-            sat = {}
-        sat[profile_key] = lessons
-        schedule["Суббота"] = sat
-        _save_schedule_to_disk()
-        msg = f"📢 Расписание субботы — {label} обновлено:\n\n"
-        msg += _format_day_table_html(label, lessons)
-
-    asyncio.create_task(_notify_subscribers(_truncate_message(msg)))
+        _set_base_saturday_profiles({profile_key: lessons}, source="admin")
+        _queue_diff_notice(f"base:Суббота:{profile_key}", "📢 Обновлено расписание:", old, ["Суббота"])
     return JSONResponse({"ok": True})
 
 
@@ -5221,17 +8824,14 @@ async def api_admin_subscribe_chat(request: Request):
         entry["time"] = f"{hh:02d}:{mm:02d}"
         day_type = data.get("day_type", "today")
         entry["day_type"] = day_type if day_type in {"today", "tomorrow"} else "today"
+        profile = (data.get("profile") or "").strip()
+        if profile and profile not in SATURDAY_PROFILE_LABELS:
+            return JSONResponse({"ok": False, "error": "bad_profile"}, status_code=400)
+        if profile:
+            entry["profile"] = profile
 
     subscriptions[str(chat_id)] = entry
-    _save_subscriptions_to_disk()
-    if notify_daily:
-        _reschedule_user(chat_id)
-    else:
-        if scheduler is not None:
-            try:
-                scheduler.remove_job(_job_id_for(chat_id))
-            except Exception:
-                pass
+    _publish(SubscriptionChanged(chat_id, "admin"))
     return JSONResponse({"ok": True})
 
 
@@ -5262,6 +8862,7 @@ async def api_admin_subscriptions_list(request: Request):
                 "day_type":       entry.get("day_type", "today"),
                 "notify_daily":   entry.get("notify_daily", True),
                 "notify_changes": entry.get("notify_changes", False),
+                "profile":        entry.get("profile", ""),
             })
     return JSONResponse({"ok": True, "subscriptions": result})
 
@@ -5289,12 +8890,7 @@ async def api_admin_unsubscribe_chat(request: Request):
     chat_id = int(chat_id_raw)
 
     subscriptions.pop(str(chat_id), None)
-    _save_subscriptions_to_disk()
-    if scheduler is not None:
-        try:
-            scheduler.remove_job(_job_id_for(chat_id))
-        except Exception:
-            pass
+    _publish(SubscriptionChanged(chat_id, "admin"))
     return JSONResponse({"ok": True})
 
 
@@ -5364,3 +8960,562 @@ async def api_admin_admin_remove(request: Request):
     dynamic_admins.discard(target_id)
     _save_dynamic_admins()
     return JSONResponse({"ok": True})
+
+
+@app.post("/api/admin/profile_start")
+async def api_admin_profile_start(request: Request):
+    """Включает семплирующий профилировщик на N секунд (по умолчанию 30)."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        user = _get_user_from_init_data(data.get("init_data", ""))
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    if not _is_admin_user_id(int(user["id"])):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+
+    if data.get("stop"):
+        _profile_stop_now()
+        return JSONResponse({"ok": True, "profile": _profile_state})
+    try:
+        seconds = float(data.get("seconds") or 30)
+    except (TypeError, ValueError):
+        return JSONResponse({"ok": False, "error": "bad_seconds"}, status_code=400)
+    if not _profile_start(seconds):
+        return JSONResponse({"ok": False, "error": "already_running"}, status_code=409)
+    return JSONResponse({"ok": True, "profile": _profile_state})
+
+
+@app.post("/api/admin/profile_status")
+async def api_admin_profile_status(request: Request):
+    """Состояние профилировщика: идёт ли, сколько семплов собрано."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        user = _get_user_from_init_data(data.get("init_data", ""))
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    if not _is_admin_user_id(int(user["id"])):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+    return JSONResponse({"ok": True, "profile": _profile_state, "stacks": len(_profile_stacks)})
+
+
+@app.post("/api/admin/profile_download")
+async def api_admin_profile_download(request: Request):
+    """Отдаёт collapsed stacks последнего профилирования файлом (flamegraph.pl / speedscope)."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        user = _get_user_from_init_data(data.get("init_data", ""))
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    if not _is_admin_user_id(int(user["id"])):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+    if not _profile_stacks:
+        return JSONResponse({"ok": False, "error": "no_profile"}, status_code=404)
+    stamp = (_profile_state.get("started_at") or "profile").replace(":", "-")
+    return PlainTextResponse(
+        _profile_collapsed(),
+        headers={"Content-Disposition": f'attachment; filename="profile-{stamp}.folded"'},
+    )
+
+
+@app.post("/api/admin/broadcasts")
+async def api_admin_broadcasts(request: Request):
+    """Журнал рассылок: последние завершённые (сводки) и идущие сейчас."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        user = _get_user_from_init_data(data.get("init_data", ""))
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    if not _is_admin_user_id(int(user["id"])):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+    entries = await asyncio.to_thread(_broadcast_read)
+    result = []
+    for e in sorted(entries.values(), key=lambda e: e.get("ts") or "", reverse=True):
+        if e.get("op") == "summary":
+            result.append({k: v for k, v in e.items() if k not in ("op", "done")})
+        else:
+            result.append({**_broadcast_summary(e), "in_progress": not e["done"]})
+            result[-1].pop("op", None)
+    return JSONResponse({"ok": True, "broadcasts": result})
+
+
+@app.post("/api/admin/audit")
+async def api_admin_audit(request: Request):
+    """Журнал правок расписания класса (tenant, по умолчанию основной): последние
+    limit правок, новые первыми; с at (ISO-время) — ещё и расписание на тот момент."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        user = _get_user_from_init_data(data.get("init_data", ""))
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    user_id = int(user["id"])
+    tenant_id = (data.get("tenant") or "").strip()
+    if tenant_id and tenant_id not in _tenants:
+        return JSONResponse({"ok": False, "error": "bad_tenant"}, status_code=400)
+    if not (_is_tenant_admin(user_id, tenant_id) if tenant_id else _is_admin_user_id(user_id)):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+    try:
+        limit = max(1, min(int(data.get("limit") or 50), AUDIT_RECENT))
+    except (TypeError, ValueError):
+        return JSONResponse({"ok": False, "error": "bad_limit"}, status_code=400)
+    result: dict = {"ok": True}
+    if data.get("at"):
+        try:
+            at = datetime.fromisoformat(str(data["at"]))
+        except ValueError:
+            return JSONResponse({"ok": False, "error": "bad_at"}, status_code=400)
+        if at.tzinfo is None:
+            at = at.replace(tzinfo=_get_tz())
+        state = await asyncio.to_thread(_audit_state_at, tenant_id, at.timestamp())
+        if state is None:
+            return JSONResponse({"ok": False, "error": "no_history"}, status_code=404)
+        result["schedule"], result["temp_schedule"] = state
+    result["entries"] = await asyncio.to_thread(_audit_entries, tenant_id, limit)
+    return JSONResponse(result)
+
+
+@app.post("/api/admin/undo")
+async def api_admin_undo(request: Request):
+    """Откатывает правку id (без id — последнюю правку класса). Если затронутые
+    дни с тех пор меняли ещё раз — 409 со списком конфликтов (force — всё равно)."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        user = _get_user_from_init_data(data.get("init_data", ""))
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    user_id = int(user["id"])
+    tenant_id = (data.get("tenant") or "").strip()
+    edit_id = (data.get("id") or "").strip() or None
+    rec = await asyncio.to_thread(_audit_find, edit_id, tenant_id)
+    if rec is None:
+        return JSONResponse({"ok": False, "error": "not_found"}, status_code=404)
+    tenant_id = rec.get("tenant", "")
+    if tenant_id and tenant_id not in _tenants:
+        return JSONResponse({"ok": False, "error": "bad_tenant"}, status_code=400)
+    if not (_is_tenant_admin(user_id, tenant_id) if tenant_id else _is_admin_user_id(user_id)):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+    _current_actor.set(user_id)
+    try:
+        conflicts = _audit_undo(rec, force=bool(data.get("force")))
+    except Exception as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+    if conflicts:
+        return JSONResponse({"ok": False, "error": "conflict", "conflicts": conflicts}, status_code=409)
+    return JSONResponse({"ok": True, "undone": rec["id"],
+                         "changes": [f"{c['kind']}:{c['key']}" for c in rec.get("changes", [])]})
+
+
+@app.post("/api/admin/tenants")
+async def api_admin_tenants(request: Request):
+    """Классы, которыми может управлять пользователь (для главного админа — все)."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        init_data = data.get("init_data", "")
+        user = _get_user_from_init_data(init_data)
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    user_id = int(user["id"])
+    allowed = [t for t in _tenants.values() if _is_tenant_admin(user_id, t["id"])]
+    if not allowed and not _is_admin_user_id(user_id):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+    members: dict[str, int] = {}
+    for tenant_id in user_tenants.values():
+        members[tenant_id] = members.get(tenant_id, 0) + 1
+    return JSONResponse({
+        "ok": True,
+        "tenants": [
+            {
+                "id": t["id"],
+                "title": t["title"],
+                "school": t["school"],
+                "class": t["class"],
+                "saturday_profiles": [{"key": k, "label": label} for k, label in t["profile_set"].profiles],
+                "version": t["snapshot"].version,
+                "members": members.get(t["id"], 0),
+            }
+            for t in allowed
+        ],
+    })
+
+
+@app.post("/api/admin/tenant_week")
+async def api_admin_tenant_week(request: Request):
+    """Расписание недели для класса (основное или временное на текущую неделю).
+    Доступно админам бота и админам этого класса из tenants.json."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        init_data = data.get("init_data", "")
+        user = _get_user_from_init_data(init_data)
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    user_id = int(user["id"])
+    tenant_id = (data.get("tenant") or "").strip()
+    if tenant_id not in _tenants:
+        return JSONResponse({"ok": False, "error": "bad_tenant"}, status_code=400)
+    if not _is_tenant_admin(user_id, tenant_id):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+    _current_actor.set(user_id)
+
+    tenant = _tenants[tenant_id]
+    week_text = data.get("week_text", "") or ""
+    mode = (data.get("mode") or "base").strip()
+    week, diagnostics = _parse_schedule_text(week_text, profile_set=tenant["profile_set"])
+    if week is None:
+        return JSONResponse({"ok": False, "error": "bad_format", "diagnostics": diagnostics}, status_code=400)
+    if data.get("dry_run"):
+        return JSONResponse({"ok": True, "diagnostics": diagnostics})
+
+    snap = tenant["snapshot"]
+    try:
+        if mode == "temp":
+            now_tz = datetime.now(tz=_get_tz())
+            monday = (now_tz - timedelta(days=now_tz.weekday())).date()
+            days = [(monday + timedelta(days=offset)).isoformat()
+                    for offset, d_name in enumerate(SCHEDULE_DAYS) if d_name in week]
+            temp = dict(snap.temp)
+            for key in days:
+                temp[key] = week[SCHEDULE_DAYS[date.fromisoformat(key).weekday()]]
+            _replace_tenant_schedule(tenant_id, temp=temp, source="admin", persist=True)
+            title = "📢 Временное расписание на неделю обновлено:"
+        else:
+            days = [d for d in SCHEDULE_DAYS if d in week]
+            base = dict(snap.base)
+            base.update({d: week[d] for d in days})
+            _replace_tenant_schedule(tenant_id, base=base, source="admin", persist=True)
+            title = "📢 Обновлено расписание на неделю:"
+    except Exception as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+
+    if mode == "temp":
+        _queue_diff_notice(f"temp:week:{monday.isoformat()}", title, snap, days,
+                           [f"temp:{k}" for k in days] + [f"temp:{k}:" for k in days], tenant=tenant_id)
+    else:
+        _queue_diff_notice("base:week", title, snap, days,
+                           [f"base:{d}:" if d == "Суббота" else f"base:{d}" for d in days], tenant=tenant_id)
+    return JSONResponse({"ok": True, "diagnostics": diagnostics, "version": tenant["snapshot"].version})
+
+
+@app.post("/api/admin/profiles")
+async def api_admin_profiles(request: Request):
+    """Профили основного класса: без "profiles" — текущий список, с ним — замена.
+    Формат — как в profiles.json: [{"key", "label", "tts", "triggers", "days"}, ...]."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        init_data = data.get("init_data", "")
+        user = _get_user_from_init_data(init_data)
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    if not _is_admin_user_id(int(user["id"])):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+
+    if "profiles" in data:
+        items, err = _normalize_profiles(data["profiles"])
+        if err:
+            return JSONResponse({"ok": False, "error": err}, status_code=400)
+        _set_profiles(items)
+        try:
+            _save_profiles_to_disk()
+        except Exception as e:
+            logger.error(f"Не удалось сохранить {PROFILES_PATH}: {e}")
+            return JSONResponse({"ok": False, "error": "save_failed"}, status_code=500)
+        logger.info(f"Профили обновлены: {', '.join(SATURDAY_PROFILE_KEYS)}")
+    return JSONResponse({"ok": True, "profiles": list(_profile_set.items)})
+
+
+# ================== Календарь (ICS) ==================
+# Подписка на расписание в календаре телефона. Лента — разрешённое расписание
+# (основное + temp_schedule, с профилями) на окно ICS_DAYS_BACK..ICS_DAYS_AHEAD
+# дней вокруг сегодняшнего. Адреса:
+#   /calendar/<id>-<подпись>.ics   — лента пользователя или чата: его класс и
+#                                    профиль из подписки (подпись — HMAC id);
+#   /calendar/profile/<ключ>.ics   — лента профиля, ?class=<id класса>.
+# Календари опрашивают ленту часто, поэтому ответ кэшируется по версии
+# расписания: VEVENT'ы каждого дня рендерятся один раз (_ics_day_cache), лента
+# собирается из них, а ETag (хэш тела) и Last-Modified позволяют отвечать 304
+# без рендера и без передачи тела.
+ICS_DAYS_BACK = int(os.environ.get("ICS_DAYS_BACK") or 7)
+ICS_DAYS_AHEAD = int(os.environ.get("ICS_DAYS_AHEAD") or 28)
+
+# (класс, дата, профиль) → VEVENT'ы дня
+_ics_day_cache: dict[tuple[str, str, str], str] = _register_schedule_cache({}, date_pos=1)
+# (класс, профиль, сегодня) → (etag, last_modified, тело)
+_ics_feed_cache: dict[tuple[str, str, str], tuple[str, datetime, bytes]] = _register_schedule_cache({})
+
+
+def _ics_token(user_key) -> str:
+    return hmac.new(TOKEN.encode("utf-8"), f"ics:{user_key}".encode("utf-8"),
+                    hashlib.sha256).hexdigest()[:16]
+
+
+def _ics_user_url(user_key) -> str:
+    return f"{BOT_URL.rstrip('/')}/calendar/{user_key}-{_ics_token(user_key)}.ics"
+
+
+def _ics_escape(text: str) -> str:
+    return (text.replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+
+def _ics_fold(line: str) -> str:
+    """Складывает строку по 75 октетов (RFC 5545, 3.1)."""
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line
+    parts, chunk, size = [], "", 0
+    for ch in line:
+        n = len(ch.encode("utf-8"))
+        if size + n > (75 if not parts else 74):
+            parts.append(chunk)
+            chunk, size = "", 0
+        chunk += ch
+        size += n
+    parts.append(chunk)
+    return "\r\n ".join(parts)
+
+
+def _ics_utc(d: date, minute: int) -> str:
+    local = datetime(d.year, d.month, d.day, minute // 60, minute % 60, tzinfo=_get_tz())
+    return local.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _ics_day_events(d: date, profile: str) -> str:
+    """VEVENT'ы одного дня; profile — ключ профиля или "" (все профили)."""
+    cache_key = (_current_tenant.get(), d.isoformat(), profile)
+    cached = _ics_day_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    if len(_ics_day_cache) > 2048:
+        _ics_day_cache.clear()
+    indexes = _lesson_indexes_for_date(d)
+    if profile and any(key == profile for key, _, _ in indexes):
+        indexes = [row for row in indexes if row[0] == profile]
+    tenant = _current_tenant.get() or "main"
+    stamp = d.strftime("%Y%m%dT000000Z")
+    lines: list[str] = []
+    for key, label, index in indexes:
+        for start, end, lesson in zip(index.starts, index.ends, index.lessons):
+            summary = lesson["subject"]
+            if label and len(indexes) > 1:
+                summary = f"{summary} ({label})"
+            lines.append("BEGIN:VEVENT")
+            lines.append(f"UID:{d.isoformat()}-{lesson['number']}-{key or 'day'}-{tenant}@schedule-bot")
+            lines.append(f"DTSTAMP:{stamp}")
+            lines.append(f"DTSTART:{_ics_utc(d, start)}")
+            lines.append(f"DTEND:{_ics_utc(d, end)}")
+            lines.append(f"SUMMARY:{_ics_escape(summary)}")
+            if lesson["room"]:
+                lines.append(f"LOCATION:{_ics_escape('каб. ' + lesson['room'])}")
+            lines.append("END:VEVENT")
+    cached = "".join(_ics_fold(line) + "\r\n" for line in lines)
+    _ics_day_cache[cache_key] = cached
+    return cached
+
+
+def _ics_feed(profile: str) -> tuple[str, datetime, bytes]:
+    """(etag, last_modified, тело) ленты текущего класса; кэш до смены версии
+    расписания или дня."""
+    today = datetime.now(tz=_get_tz()).date()
+    cache_key = (_current_tenant.get(), profile, today.isoformat())
+    cached = _ics_feed_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    if len(_ics_feed_cache) > 256:
+        _ics_feed_cache.clear()
+    title = _tenant_title(_current_tenant.get())
+    label = _current_profile_labels().get(profile)
+    name = f"Расписание — {title}" + (f", {label}" if label else "")
+    parts = [
+        "BEGIN:VCALENDAR\r\n",
+        "VERSION:2.0\r\n",
+        "PRODID:-//school-schedule-bot//RU\r\n",
+        "CALSCALE:GREGORIAN\r\n",
+        _ics_fold(f"X-WR-CALNAME:{_ics_escape(name)}") + "\r\n",
+        "REFRESH-INTERVAL;VALUE=DURATION:PT1H\r\n",
+    ]
+    for i in range(-ICS_DAYS_BACK, ICS_DAYS_AHEAD + 1):
+        parts.append(_ics_day_events(today + timedelta(days=i), profile))
+    parts.append("END:VCALENDAR\r\n")
+    body = "".join(parts).encode("utf-8")
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    previous = next((v for k, v in _ics_feed_cache.items() if v[0] == etag), None)
+    last_modified = previous[1] if previous else datetime.now(tz=timezone.utc).replace(microsecond=0)
+    cached = _ics_feed_cache[cache_key] = (etag, last_modified, body)
+    return cached
+
+
+def _ics_response(request: Request, tenant_id: str, profile: str) -> Response:
+    with _tenant_scope(tenant_id):
+        etag, last_modified, body = _ics_feed(profile)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        not_modified = etag in [t.strip() for t in inm.split(",")] or inm.strip() == "*"
+    else:
+        try:
+            ims = parsedate_to_datetime(request.headers.get("if-modified-since") or "")
+            not_modified = ims is not None and last_modified <= ims
+        except (TypeError, ValueError):
+            not_modified = False
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    if request.method == "HEAD":
+        return Response(status_code=200, headers=headers, media_type="text/calendar; charset=utf-8")
+    return Response(content=body, headers=headers, media_type="text/calendar; charset=utf-8")
+
+
+@app.api_route("/calendar/profile/{profile_key}.ics", methods=["GET", "HEAD"])
+async def ics_profile_feed(profile_key: str, request: Request):
+    """Лента одного профиля (для дней без профилей — общее расписание)."""
+    tenant_id = request.query_params.get("class", "")
+    if tenant_id and tenant_id not in _tenants:
+        return PlainTextResponse("unknown class", status_code=404)
+    with _tenant_scope(tenant_id):
+        known = profile_key in _current_profile_labels()
+    if not known:
+        return PlainTextResponse("unknown profile", status_code=404)
+    return _ics_response(request, tenant_id, profile_key)
+
+
+@app.api_route("/calendar/{feed}.ics", methods=["GET", "HEAD"])
+async def ics_user_feed(feed: str, request: Request):
+    """Лента пользователя или чата: класс и профиль берутся при каждом запросе,
+    так что /class и смена профиля в подписке действуют без новой ссылки."""
+    user_key, _, token = feed.rpartition("-")
+    if not user_key or not hmac.compare_digest(token, _ics_token(user_key)):
+        return PlainTextResponse("not found", status_code=404)
+    profile = (subscriptions.get(user_key) or {}).get("profile") or ""
+    return _ics_response(request, _user_tenant(user_key), profile)
+
+
+@app.post("/api/calendar")
+async def api_calendar(request: Request):
+    """Ссылки для подписки в календаре: личная и по профилям класса."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        init_data = data.get("init_data", "")
+        user = _get_user_from_init_data(init_data)
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    tenant_id = _user_tenant(user["id"])
+    base = BOT_URL.rstrip("/")
+    suffix = f"?class={quote(tenant_id)}" if tenant_id else ""
+    with _tenant_scope(tenant_id):
+        profiles = [
+            {"key": k, "label": label, "url": f"{base}/calendar/profile/{quote(k)}.ics{suffix}"}
+            for k, label in _current_profile_set().profiles
+        ]
+    return JSONResponse({"ok": True, "url": _ics_user_url(user["id"]), "profiles": profiles})
+
+
+@app.post("/api/admin/http_stats")
+async def api_admin_http_stats(request: Request):
+    """Загрузка пулов исходящих соединений (Telegram, общий клиент, Sheets)."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        user = _get_user_from_init_data(data.get("init_data", ""))
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    if not _is_admin_user_id(int(user["id"])):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+    return JSONResponse({"ok": True, **_http_stats_snapshot()})
+
+
+@app.post("/api/admin/warm_status")
+async def api_admin_warm_status(request: Request):
+    """Прогрев: пики на сегодня, следующий пик, последний пинг, счётчики."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        user = _get_user_from_init_data(data.get("init_data", ""))
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    if not _is_admin_user_id(int(user["id"])):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+    today = datetime.now(tz=_get_tz()).date()
+    return JSONResponse({
+        "ok": True,
+        "peaks": [{"at": at.strftime("%H:%M"), "kind": kind} for at, kind in _warm_peaks(today)],
+        "next_peak": _warm_state["next_peak"],
+        "last_ping": _warm_state["last_ping"],
+        "pings": _warm_state["pings"],
+        "prewarms": _warm_state["prewarms"],
+        "idle_seconds": round(time.monotonic() - _warm_state["last_inbound"]),
+        "lead_minutes": WARM_LEAD_MINUTES,
+        "idle_minutes": WARM_IDLE_MINUTES,
+        "bridge_minutes": WARM_BRIDGE_MINUTES,
+    })
+
+
+@app.post("/api/admin/warmup")
+async def api_admin_warmup(request: Request):
+    """Заранее отрисовывает сегодня/завтра/неделю во всех видах (WebApp,
+    напоминания, ICS) для всех классов — перед пуском трафика после деплоя."""
+    data = await request.json()
+    raw_user = data.get("user")
+    user = None
+    if isinstance(raw_user, dict) and "id" in raw_user:
+        user = raw_user
+    else:
+        user = _get_user_from_init_data(data.get("init_data", ""))
+    if not user:
+        return JSONResponse({"ok": False, "error": "bad_init_data"}, status_code=400)
+    if not _is_admin_user_id(int(user["id"])):
+        return JSONResponse({"ok": False, "error": "forbidden"}, status_code=403)
+    t = time.perf_counter()
+    rendered = _prewarm_caches(full=True)
+    return JSONResponse({
+        "ok": True,
+        "rendered": rendered,
+        "ms": round((time.perf_counter() - t) * 1000, 1),
+        "caches": _readiness()["caches"],
+    })